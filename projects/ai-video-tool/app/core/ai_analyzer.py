@@ -1,9 +1,13 @@
 import os
 import json
+import time
+from typing import List
 from google import genai
 from dotenv import load_dotenv
 from app.core import database
 from app.core import utils
+from app.core import chat
+from app.core import telemetry
 
 load_dotenv()
 
@@ -18,13 +22,10 @@ def get_model_name():
     config = utils.load_config()
     return config.get("model_gemini", "gemini-2.0-flash-exp")
 
-def analyze_video(video_db_id: int, progress=None):
+def _build_prompt(video_db_id: int, progress=None):
     """
-    Analyze video transcript using Gemini.
-    Generates tags, summary, and highlights.
-    Updates DB with tags and analysis result.
+    Returns (video, prompt, transcript_text) for the given video.
     """
-    
     # 1. Fetch Transcript
     if progress: progress(0.1, desc="Fetching transcript...")
     subtitles = database.get_subtitles(video_db_id)
@@ -38,9 +39,6 @@ def analyze_video(video_db_id: int, progress=None):
         # Format: "START:Text" (e.g. "12:Hello world")
         start_sec = int(s['start_time'])
         transcript_text += f"{start_sec}:{s['text']}\n"
-        
-    # 2. Call AI
-    if progress: progress(0.3, desc="Calling Gemini API...")
     
     # Get duration to calculate target highlights
     video = database.get_video_by_id(video_db_id)
@@ -53,98 +51,93 @@ def analyze_video(video_db_id: int, progress=None):
     existing_tags_str = ", ".join(existing_tags)
     
     # Load Comments/Chat Context
+    # Sample from the busiest parts of the stream instead of only its first minutes
     comments_context = ""
-    # Usually we save it in the same directory as the video file
-    video_path = video.get('file_path')
-    if video_path:
-        video_dir = os.path.dirname(video_path)
-        comments_file = os.path.join(video_dir, "comments.json")
-        if os.path.exists(comments_file):
-            try:
-                with open(comments_file, 'r', encoding='utf-8') as f:
-                    comments_data = json.load(f)
-                    
-                # Summarize comments for context
-                # E.g. "Here are some top comments/live chat messages for context:"
-                # Just take a random sample or first 50 to avoid token overflow
-                sample_comments = [c.get('message', '') for c in comments_data[:50] if c.get('message')]
-                comments_text = "\n".join(sample_comments)
-                if comments_text:
-                    comments_context = f"Relevant Viewer Comments/Chat:\n{comments_text}\n"
-            except Exception as e:
-                print(f"Failed to load comments: {e}")
+    try:
+        sample_comments = chat.sample_chat(video_db_id, max_messages=50)
+        comments_text = "\n".join(
+            f"{int(c['time_in_seconds'] or 0)}:{c['message']}" for c in sample_comments if c.get('message')
+        )
+        if comments_text:
+            comments_context = f"Relevant Viewer Comments/Chat (Format: Seconds:Text):\n{comments_text}\n"
+    except Exception as e:
+        print(f"Failed to load comments: {e}")
 
+    # Highlights come first so that streaming can show them before the summary is written.
     prompt = f"""
     Analyze the transcript and comments (if any) to provide:
-    1. 5 relevant tags (Japanese/English). PRIORITIZE EXISTING: [{existing_tags_str}].
-    2. Concise Japanese summary.
-    3. List of {target_count} highlights (approx 3 min each).
+    1. List of {target_count} highlights (approx 3 min each).
        - 'description': Japanese.
        - 'start_time' < 'end_time' (seconds).
+    2. 5 relevant tags (Japanese/English). PRIORITIZE EXISTING: [{existing_tags_str}].
+    3. Concise Japanese summary.
     
     {comments_context}
 
     Return strictly JSON:
     {{
-      "tags": ["..."],
-      "summary": "...",
       "highlights": [
         {{"start_time": 100.0, "end_time": 280.0, "score": 90, "description": "..."}},
         ...
-      ]
+      ],
+      "tags": ["..."],
+      "summary": "..."
     }}
     
     Transcript (Format: Seconds:Text):
     """
-    
+    return video, prompt, transcript_text
+
+def _validate_highlight(h: dict):
+    """
+    Normalize a single highlight. Returns None if it should be rejected.
+    """
     try:
-        client = get_gemini_client()
-        model_name = get_model_name()
-        
-        response = client.models.generate_content(
-            model=model_name,
-            contents=[prompt, transcript_text]
-        )
-        response_text = response.text.strip()
-        
-        # Strip markdown if present
-        if response_text.startswith("```"):
-            response_text = response_text.strip("`")
-            if response_text.startswith("json"):
-                response_text = response_text[4:]
-        
-        response_text = response_text.strip()
-        
-        result = json.loads(response_text)
-        
-        # Post-process highlights
-        valid_highlights = []
-        if 'highlights' in result:
-            for h in result['highlights']:
-                s = float(h.get('start_time', 0))
-                e = float(h.get('end_time', 0))
-                
-                # Fix inverted times
-                if s > e:
-                    s, e = e, s
-                
-                # Filter very short clips (less than 3 seconds), arguably 5s
-                # User complained about < 1s clips.
-                # If it is < 3s, it's likely noise or error, reject it or pad it?
-                # Let's reject clips smaller than 2 seconds, and for 2-5s maybe pad?
-                # For now, simplistic filter: MUST be > 3s.
-                if (e - s) < 3.0:
-                    continue
-                
-                h['start_time'] = s
-                h['end_time'] = e
-                valid_highlights.append(h)
-        
-        result['highlights'] = valid_highlights
-        
-    except Exception as e:
-        raise RuntimeError(f"AI Analysis Failed: {e}")
-        
+        s = float(h.get('start_time', 0))
+        e = float(h.get('end_time', 0))
+    except (TypeError, ValueError):
+        return None
+    
+    # Fix inverted times
+    if s > e:
+        s, e = e, s
+    
+    # Filter very short clips (less than 3 seconds), arguably 5s
+    # User complained about < 1s clips.
+    # If it is < 3s, it's likely noise or error, reject it or pad it?
+    # Let's reject clips smaller than 2 seconds, and for 2-5s maybe pad?
+    # For now, simplistic filter: MUST be > 3s.
+    if (e - s) < 3.0:
+        return None
+    
+    h['start_time'] = s
+    h['end_time'] = e
+    return h
+
+def _parse_response_text(response_text: str) -> dict:
+    response_text = response_text.strip()
+    
+    # Strip markdown if present
+    if response_text.startswith("```"):
+        response_text = response_text.strip("`")
+        if response_text.startswith("json"):
+            response_text = response_text[4:]
+    
+    response_text = response_text.strip()
+    
+    result = json.loads(response_text)
+    
+    # Post-process highlights
+    valid_highlights = []
+    for h in result.get('highlights', []):
+        h = _validate_highlight(h)
+        if h:
+            valid_highlights.append(h)
+    
+    result['highlights'] = valid_highlights
+    return result
+
+def _save_result(video_db_id: int, video: dict, result: dict, progress=None):
     # 3. Save Tags
     if progress: progress(0.8, desc="Saving results...")
     
@@ -170,5 +163,151 @@ def analyze_video(video_db_id: int, progress=None):
         print(f"Failed to save analysis file: {e}")
     
     if progress: progress(1.0, desc="Analysis Complete.")
+
+class HighlightStreamParser:
+    """
+    Incrementally pulls complete objects out of the "highlights" array
+    while the JSON response is still arriving.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None # Scan position inside the highlights array (None until found)
+        self.done = False
+
+    def feed(self, text: str) -> List[dict]:
+        self.buffer += text
+        objects = []
+        if self.done:
+            return objects
+
+        if self.pos is None:
+            key = self.buffer.find('"highlights"')
+            if key == -1:
+                return objects
+            bracket = self.buffer.find('[', key)
+            if bracket == -1:
+                return objects
+            self.pos = bracket + 1
+
+        while True:
+            # Skip separators between objects
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n,":
+                self.pos += 1
+            if self.pos >= len(self.buffer):
+                break
+            if self.buffer[self.pos] == ']':
+                self.done = True
+                break
+            if self.buffer[self.pos] != '{':
+                # Unexpected content; leave it for the final full parse
+                self.done = True
+                break
+
+            end = self._find_object_end(self.pos)
+            if end is None:
+                break # Object not complete yet
+            try:
+                objects.append(json.loads(self.buffer[self.pos:end]))
+            except json.JSONDecodeError as e:
+                print(f"Skipping malformed highlight: {e}")
+            self.pos = end
+        return objects
+
+    def _find_object_end(self, start: int):
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(self.buffer)):
+            ch = self.buffer[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+        return None
+
+def analyze_video(video_db_id: int, progress=None):
+    """
+    Analyze video transcript using Gemini.
+    Generates tags, summary, and highlights.
+    Updates DB with tags and analysis result.
+    """
+    video, prompt, transcript_text = _build_prompt(video_db_id, progress=progress)
+
+    # 2. Call AI
+    if progress: progress(0.3, desc="Calling Gemini API...")
+    
+    try:
+        client = get_gemini_client()
+        model_name = get_model_name()
+        
+        with telemetry.timed("gemini.generate", model_name):
+            response = client.models.generate_content(
+                model=model_name,
+                contents=[prompt, transcript_text]
+            )
+        result = _parse_response_text(response.text)
+        
+    except Exception as e:
+        raise RuntimeError(f"AI Analysis Failed: {e}")
+    
+    _save_result(video_db_id, video, result, progress=progress)
     
     return result
+
+def analyze_video_stream(video_db_id: int, progress=None):
+    """
+    Streaming variant of analyze_video.
+    Yields (highlights_so_far, result) tuples. `result` is None until the
+    response is complete; the last yield carries the full saved result.
+    """
+    video, prompt, transcript_text = _build_prompt(video_db_id, progress=progress)
+
+    if progress: progress(0.3, desc="Calling Gemini API (streaming)...")
+    
+    parser = HighlightStreamParser()
+    highlights = []
+    full_text = ""
+    try:
+        client = get_gemini_client()
+        model_name = get_model_name()
+        
+        started = time.perf_counter()
+        stream = client.models.generate_content_stream(
+            model=model_name,
+            contents=[prompt, transcript_text]
+        )
+        for chunk in stream:
+            text = chunk.text or ""
+            full_text += text
+            new_highlights = []
+            for h in parser.feed(text):
+                h = _validate_highlight(h)
+                if h:
+                    new_highlights.append(h)
+            if new_highlights:
+                highlights.extend(new_highlights)
+                if progress: progress(0.5, desc=f"Received {len(highlights)} highlights...")
+                yield highlights, None
+        
+        # Whole stream, from request to the last chunk
+        telemetry.record("gemini.stream", time.perf_counter() - started, model_name)
+        result = _parse_response_text(full_text)
+        
+    except Exception as e:
+        raise RuntimeError(f"AI Analysis Failed: {e}")
+    
+    _save_result(video_db_id, video, result, progress=progress)
+    
+    yield result['highlights'], result
@@ -0,0 +1,218 @@
+import os
+import re
+import gzip
+import time
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from app.core import database, utils, telemetry
+
+BACKUP_PREFIX = "db-"
+BACKUP_SUFFIX = ".sqlite3.gz"
+_NAME_RE = re.compile(r'^db-(\d{8}-\d{6})(?:-(\w+))?\.sqlite3\.gz$')
+
+# A writer committing mid-copy restarts the backup from page 0. After MAX_RESTARTS in one round the
+# copy starts over with steps 4x larger and pauses 2x longer, up to MAX_STEP_PAGES per step (64 MB of
+# 4 KB pages: short enough for writers' busy timeout), giving up after MAX_ROUNDS
+MAX_RESTARTS = 5
+MAX_ROUNDS = 4
+MAX_STEP_PAGES = 16384
+
+# Safety snapshots taken by restore_backup; rotated separately from regular snapshots
+PRERESTORE_LABEL = "prerestore"
+
+class _TooManyRestarts(Exception):
+    pass
+
+def get_backup_settings():
+    """
+    Returns (backup directory, snapshots kept, pages per step, pause between steps in seconds).
+    """
+    config = utils.load_config()
+    return (
+        config.get("backup_dir", os.path.join("data", "backups")),
+        int(config.get("backup_keep", 7)),
+        int(config.get("backup_pages_per_step", 1024)),
+        float(config.get("backup_step_sleep_ms", 10)) / 1000.0,
+    )
+
+def _copy(src, dst, pages: int, sleep: float, progress=None):
+    restarts = [0]
+    round_restarts = [0]
+    last_remaining = [None]
+
+    def on_step(status, remaining, total):
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            restarts[0] += 1
+            round_restarts[0] += 1
+            if round_restarts[0] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining[0] = remaining
+        if progress and total:
+            progress(0.9 * (1 - remaining / total), desc=f"Copying database pages ({total - remaining}/{total})...")
+
+    for _ in range(MAX_ROUNDS):
+        try:
+            src.backup(dst, pages=pages, progress=on_step, sleep=sleep)
+            return restarts[0]
+        except _TooManyRestarts:
+            # Never one step for the whole database: that holds the lock long enough to time writers out
+            pages = min(pages * 4, MAX_STEP_PAGES)
+            sleep *= 2
+            round_restarts[0] = 0
+            last_remaining[0] = None
+            print(f"Backup restarted {restarts[0]} times under concurrent writes; retrying with {pages} pages per step.")
+    raise RuntimeError(f"Backup gave up after {restarts[0]} restarts under concurrent writes; try again when the library is idle.")
+
+def verify_snapshot(db_path: str) -> str:
+    """
+    Integrity check of an uncompressed snapshot, including the FTS index. Returns "ok" or the first problem.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            return result
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'subtitles_fts' in tables:
+            conn.execute("INSERT INTO subtitles_fts(subtitles_fts) VALUES('integrity-check')")
+        return 'ok'
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    finally:
+        conn.close()
+
+def create_backup(label: str = None, progress=None, protect=()) -> str:
+    """
+    Snapshot the live database without stopping the app, verify it, gzip it into the backup directory
+    and apply the retention policy (never removing the paths in `protect`). Returns the path of the new snapshot.
+    """
+    backup_dir, keep, pages, sleep = get_backup_settings()
+    os.makedirs(backup_dir, exist_ok=True)
+    name = BACKUP_PREFIX + datetime.now().strftime("%Y%m%d-%H%M%S")
+    # Labels with no word characters left get no suffix (a bare "-" would not match _NAME_RE)
+    label = re.sub(r'\W', '', label or '')
+    if label:
+        name += "-" + label
+    path = os.path.join(backup_dir, name + BACKUP_SUFFIX)
+
+    started = time.perf_counter()
+    fd, tmp_db = tempfile.mkstemp(suffix=".sqlite3", dir=backup_dir)
+    os.close(fd)
+    try:
+        src = database.get_db_connection()
+        dst = sqlite3.connect(tmp_db)
+        try:
+            # Each step holds only a shared lock, so searches keep running during the copy
+            restarts = _copy(src, dst, pages, sleep, progress)
+        finally:
+            dst.close()
+            src.close()
+
+        if progress: progress(0.9, desc="Verifying snapshot...")
+        result = verify_snapshot(tmp_db)
+        if result != 'ok':
+            raise RuntimeError(f"Snapshot failed verification: {result}")
+
+        if progress: progress(0.95, desc="Compressing snapshot...")
+        with open(tmp_db, 'rb') as f_in, gzip.open(path + ".tmp", 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(path + ".tmp", path)
+    finally:
+        for p in (tmp_db, path + ".tmp"):
+            if os.path.exists(p):
+                os.remove(p)
+
+    telemetry.record("db.backup", time.perf_counter() - started, f"{restarts} restarts")
+    removed = prune_backups(keep, protect=protect)
+    if progress: progress(1.0, desc="Backup complete.")
+    print(f"Backup written to {path} ({os.path.getsize(path) / 1e6:.1f} MB, {len(removed)} old snapshots removed)")
+    return path
+
+def list_backups():
+    """
+    Snapshots in the backup directory, newest first: [{'path', 'name', 'created', 'label', 'size'}].
+    """
+    backup_dir = get_backup_settings()[0]
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        m = _NAME_RE.match(name)
+        if not m:
+            continue
+        path = os.path.join(backup_dir, name)
+        backups.append({
+            'path': path,
+            'name': name,
+            'created': datetime.strptime(m.group(1), "%Y%m%d-%H%M%S"),
+            'label': m.group(2),
+            'size': os.path.getsize(path),
+        })
+    return sorted(backups, key=lambda b: (b['created'], b['name']), reverse=True)
+
+def prune_backups(keep: int, protect=()):
+    """
+    Delete all but the newest `keep` snapshots, counting regular and pre-restore snapshots separately
+    (a series of restores must not rotate out the snapshots being restored). Paths in `protect` are
+    never removed. Returns the removed paths.
+    """
+    protect = {os.path.abspath(p) for p in protect}
+    backups = list_backups()
+    regular = [b for b in backups if b['label'] != PRERESTORE_LABEL]
+    prerestore = [b for b in backups if b['label'] == PRERESTORE_LABEL]
+    removed = []
+    for b in regular[max(keep, 1):] + prerestore[max(keep, 1):]:
+        if os.path.abspath(b['path']) in protect:
+            continue
+        try:
+            os.remove(b['path'])
+            removed.append(b['path'])
+        except OSError as e:
+            print(f"Could not remove old backup {b['path']}: {e}")
+    return removed
+
+def restore_backup(path: str, progress=None) -> str:
+    """
+    Decompress and verify a snapshot, back up the current database, then copy the snapshot
+    over it through the backup API (open connections see the restored data).
+    Returns the path of the safety backup taken first.
+    """
+    backup_dir = get_backup_settings()[0]
+    os.makedirs(backup_dir, exist_ok=True)
+    fd, tmp_db = tempfile.mkstemp(suffix=".sqlite3", dir=backup_dir)
+    os.close(fd)
+    try:
+        if progress: progress(0.0, desc="Decompressing snapshot...")
+        with gzip.open(path, 'rb') as f_in, open(tmp_db, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        result = verify_snapshot(tmp_db)
+        if result != 'ok':
+            raise RuntimeError(f"Snapshot {path} failed verification: {result}")
+
+        safety = create_backup(label=PRERESTORE_LABEL, protect=[path]) if os.path.exists(database.DB_PATH) else None
+
+        if progress: progress(0.5, desc="Restoring...")
+        src = sqlite3.connect(tmp_db)
+        dst = database.get_db_connection()
+        try:
+            # One step: the live database switches to the snapshot in a single transaction
+            src.backup(dst)
+            result = dst.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                raise RuntimeError(f"Restored database failed verification: {result} (previous state: {safety})")
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        if os.path.exists(tmp_db):
+            os.remove(tmp_db)
+
+    # An older snapshot may predate tables and columns the running code expects
+    database.init_db()
+    # Per-video subtitle indexes may describe rows that changed
+    from app.core import subtitle_index
+    subtitle_index.invalidate_all()
+    if progress: progress(1.0, desc="Restore complete.")
+    return safety
@@ -0,0 +1,101 @@
+import os
+import json
+from app.core import database
+
+# Messages per INSERT transaction while streaming
+BATCH_SIZE = 500
+
+def _to_row(message: dict) -> dict:
+    author = message.get('author')
+    if isinstance(author, dict):
+        author = author.get('name')
+    return {
+        'time_text': message.get('time_text'),
+        'time_in_seconds': message.get('time_in_seconds'),
+        'message': message.get('message'),
+        'author': author
+    }
+
+def download_chat(url: str, video_db_id: int, progress=None) -> int:
+    """
+    Stream live chat replay / comments into the chat_messages table in batches.
+    Replaces any chat previously stored for the video. Returns the message count.
+    """
+    from chat_downloader import ChatDownloader
+
+    chat_stream = ChatDownloader().get_chat(url, message_groups=['messages', 'superchat'])
+
+    database.delete_chat_messages(video_db_id)
+    conn = database.get_db_connection()
+    count = 0
+    batch = []
+    try:
+        for message in chat_stream:
+            batch.append(_to_row(message))
+            if len(batch) >= BATCH_SIZE:
+                database.add_chat_messages(video_db_id, batch, conn=conn)
+                count += len(batch)
+                batch = []
+                if progress: progress(0.98, desc=f"Downloading Chat/Comments... ({count})")
+        if batch:
+            database.add_chat_messages(video_db_id, batch, conn=conn)
+            count += len(batch)
+    finally:
+        conn.close()
+    return count
+
+def import_comments_json(video_db_id: int, comments_file: str) -> int:
+    """
+    Import a legacy comments.json (list of message dicts) into chat_messages.
+    """
+    with open(comments_file, 'r', encoding='utf-8') as f:
+        comments_data = json.load(f)
+
+    database.delete_chat_messages(video_db_id)
+    conn = database.get_db_connection()
+    try:
+        for i in range(0, len(comments_data), BATCH_SIZE):
+            batch = [_to_row(m) for m in comments_data[i:i + BATCH_SIZE]]
+            database.add_chat_messages(video_db_id, batch, conn=conn)
+    finally:
+        conn.close()
+    return len(comments_data)
+
+def import_existing_comments(progress=None) -> str:
+    """
+    Import comments.json files next to library videos that have no chat rows yet.
+    """
+    imported = 0
+    videos = database.get_all_videos()
+    for i, v in enumerate(videos):
+        if not v.get('file_path'):
+            continue
+        comments_file = os.path.join(os.path.dirname(v['file_path']), "comments.json")
+        if not os.path.exists(comments_file):
+            continue
+        if database.count_chat_messages(v['id']) > 0:
+            continue
+        if progress: progress(i / len(videos), desc=f"Importing chat for {v['title']}...")
+        try:
+            import_comments_json(v['id'], comments_file)
+            imported += 1
+        except Exception as e:
+            print(f"Failed to import {comments_file}: {e}")
+    return f"Imported chat for {imported} videos."
+
+def sample_chat(video_db_id: int, max_messages: int = 50, bucket_seconds: float = 60.0, top_buckets: int = 5):
+    """
+    Messages from the busiest parts of the stream, for use as AI context.
+    """
+    counts = database.get_chat_counts(video_db_id, bucket_seconds=bucket_seconds)
+    if not counts:
+        return []
+    busiest = sorted(counts, key=lambda bc: bc[1], reverse=True)[:top_buckets]
+    per_bucket = max(1, max_messages // len(busiest))
+
+    messages = []
+    for bucket_start, _ in sorted(busiest):
+        messages.extend(database.get_chat_messages(
+            video_db_id, start=bucket_start, end=bucket_start + bucket_seconds, limit=per_bucket
+        ))
+    return messages
@@ -0,0 +1,79 @@
+from typing import List, Dict, Tuple
+from app.core import database, utils
+
+def get_planner_settings():
+    config = utils.load_config()
+    return float(config.get("clip_padding", 1.0)), float(config.get("clip_merge_gap", 5.0))
+
+def plan_clips(rows: List[Tuple[int, float, float]], padding: float = None, merge_gap: float = None):
+    """
+    Turn (video_db_id, start, end) rows into a minimal clip list for create_montage.
+    - Source paths are resolved with a single query.
+    - Intervals are padded, sorted and merged per source when they overlap
+      or are within `merge_gap` seconds of each other.
+    - Clips are grouped by source and ordered by time to avoid seeking back and forth.
+    Returns (clips, report).
+    """
+    default_padding, default_gap = get_planner_settings()
+    if padding is None:
+        padding = default_padding
+    if merge_gap is None:
+        merge_gap = default_gap
+
+    videos = database.get_videos_by_ids([r[0] for r in rows])
+
+    intervals = {} # video_db_id -> [(start, end), ...]
+    source_order = []
+    for video_db_id, start, end in rows:
+        video = videos.get(int(video_db_id))
+        if not video or not video.get('file_path'):
+            continue
+        start, end = float(start), float(end)
+        if start > end:
+            start, end = end, start
+        start = max(0.0, start - padding)
+        end = end + padding
+        if video.get('duration'):
+            end = min(end, float(video['duration']))
+        if end <= start:
+            # Starts past the end of the video (stale timestamps)
+            continue
+        if video['id'] not in intervals:
+            intervals[video['id']] = []
+            source_order.append(video['id'])
+        intervals[video['id']].append((start, end))
+
+    seconds_before = sum(e - s for spans in intervals.values() for s, e in spans)
+
+    clips = []
+    bridged = 0.0 # Footage added by joining near-adjacent clips
+    for video_db_id in source_order:
+        merged = []
+        for s, e in sorted(intervals[video_db_id]):
+            if merged and s <= merged[-1][1] + merge_gap:
+                bridged += max(0.0, s - merged[-1][1])
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        path = videos[video_db_id]['file_path']
+        for s, e in merged:
+            clips.append({'video_path': path, 'start': s, 'end': e})
+
+    seconds_after = sum(c['end'] - c['start'] for c in clips)
+    report = {
+        'input_clips': len(rows),
+        'output_clips': len(clips),
+        'seconds_before': round(seconds_before, 1),
+        'seconds_after': round(seconds_after, 1),
+        'seconds_bridged': round(bridged, 1),
+        # Overlapping footage that would otherwise have been decoded and encoded twice
+        'seconds_saved': round(seconds_before - (seconds_after - bridged), 1),
+    }
+    return clips, report
+
+def format_report(report: Dict) -> str:
+    return (
+        f"{report['input_clips']} clips -> {report['output_clips']} after merging; "
+        f"{report['seconds_saved']}s of redundant encoding avoided "
+        f"({report['seconds_before']}s -> {report['seconds_after']}s, {report['seconds_bridged']}s of gaps bridged)."
+    )
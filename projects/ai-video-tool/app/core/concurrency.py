@@ -0,0 +1,111 @@
+import time
+import inspect
+import threading
+import functools
+from collections import deque
+from app.core import utils
+
+# group -> (concurrent workers, requests allowed to wait). Overridable with "concurrency_groups" in config.json.
+DEFAULT_GROUPS = {
+    'read': (8, 64),        # Gallery, tables, polling; Gradio's default group
+    'search': (4, 16),      # Search-as-you-type; several in flight so newer keystrokes interrupt older ones
+    'preview': (2, 8),      # Clip previews cut by ffmpeg
+    'ai': (1, 4),           # Gemini analysis, signal extraction
+    'render': (2, 8),       # Montage exports (waiting on the render queue)
+    'maintenance': (1, 1),  # Scans and library-wide batch jobs
+}
+
+# Admitted requests that never start (client went away while queued) stop counting after this long
+STALE_ADMISSION_SECONDS = 600
+
+class GroupSaturated(Exception):
+    pass
+
+def get_group_settings(group: str):
+    """
+    Returns (concurrency_limit, queue_size) for a group.
+    """
+    limit, queue_size = DEFAULT_GROUPS[group]
+    override = utils.load_config().get("concurrency_groups", {}).get(group, {})
+    return int(override.get("limit", limit)), int(override.get("queue_size", queue_size))
+
+class _GroupState:
+    def __init__(self):
+        self.waiting = deque() # admission timestamps, oldest first
+        self.running = 0
+
+_groups = {}
+_lock = threading.Lock()
+_last_finished = {} # group -> time its latest request finished
+
+def _state(group: str) -> _GroupState:
+    if group not in _groups:
+        _groups[group] = _GroupState()
+    return _groups[group]
+
+def admit(group: str):
+    """
+    Reserve a place in the group or raise GroupSaturated at once, before the request is queued.
+    """
+    limit, queue_size = get_group_settings(group)
+    now = time.time()
+    with _lock:
+        state = _state(group)
+        while state.waiting and now - state.waiting[0] > STALE_ADMISSION_SECONDS:
+            state.waiting.popleft()
+        if state.running + len(state.waiting) >= limit + queue_size:
+            raise GroupSaturated(f"'{group}' is busy ({state.running} running, {len(state.waiting)} waiting). Please retry later.")
+        state.waiting.append(now)
+
+def _started(group: str):
+    with _lock:
+        state = _state(group)
+        if state.waiting:
+            state.waiting.popleft()
+        state.running += 1
+
+def _finished(group: str):
+    with _lock:
+        _state(group).running -= 1
+        _last_finished[group] = time.time()
+
+def wrap(group: str, fn):
+    """
+    Track `fn` as running in the group. Generators are counted until they are exhausted or closed.
+    Signature is preserved (functools.wraps), so Gradio still injects Progress / Request arguments.
+    """
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(*args, **kwargs):
+            _started(group)
+            try:
+                yield from fn(*args, **kwargs)
+            finally:
+                _finished(group)
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        _started(group)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _finished(group)
+    return wrapper
+
+def idle_seconds(ignore: tuple = ()) -> float:
+    """
+    Seconds since a tracked request outside the `ignore` groups last finished; 0 while one is running.
+    """
+    with _lock:
+        if any(s.running for g, s in _groups.items() if g not in ignore):
+            return 0.0
+        latest = max((t for g, t in _last_finished.items() if g not in ignore), default=None)
+    return float('inf') if latest is None else time.time() - latest
+
+def snapshot() -> dict:
+    """
+    group -> (running, waiting), for status displays.
+    """
+    with _lock:
+        return {g: (s.running, len(s.waiting)) for g, s in _groups.items()}
@@ -1,6 +1,8 @@
 import sqlite3
 import os
+import glob
 from typing import List, Dict, Optional, Tuple
+from app.core import telemetry
 
 DB_PATH = os.path.join("data", "db.sqlite3")
 
@@ -11,12 +13,22 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+def _ensure_column(c, table: str, column: str, decl: str):
+    """
+    Add a column to an existing table created by an older version of init_db.
+    """
+    c.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
 def init_db():
     conn = get_db_connection()
     c = conn.cursor()
     
     # Enable Foreign Keys
     c.execute("PRAGMA foreign_keys = ON;")
+    # Lets maintenance return free pages in slices; only takes effect on a new (empty) database
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL;")
 
     # Videos Table
     c.execute('''
@@ -30,9 +42,17 @@ def init_db():
             thumbnail_path TEXT,
             duration REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            analysis_result TEXT
+            analysis_result TEXT,
+            proxy_path TEXT,
+            gallery_thumb_path TEXT,
+            sprite_path TEXT,
+            sprite_layout TEXT
         )
     ''')
+    _ensure_column(c, 'videos', 'proxy_path', 'TEXT')
+    _ensure_column(c, 'videos', 'gallery_thumb_path', 'TEXT')
+    _ensure_column(c, 'videos', 'sprite_path', 'TEXT')
+    _ensure_column(c, 'videos', 'sprite_layout', 'TEXT')
     
     # Subtitles Table
     c.execute('''
@@ -92,6 +112,95 @@ def init_db():
         )
     ''')
 
+    # Chat Messages Table (live chat replay / comments)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_id INTEGER,
+            time_in_seconds REAL,
+            time_text TEXT,
+            author TEXT,
+            message TEXT,
+            FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_video_time ON chat_messages (video_id, time_in_seconds)')
+
+    # Ingest Stages Table (post-download pipeline status per video)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_stages (
+            video_id INTEGER,
+            stage TEXT,
+            status TEXT,
+            message TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (video_id, stage),
+            FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Render Jobs Table (background montage exports)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS render_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            clips_json TEXT,
+            mode TEXT DEFAULT 'encode',
+            status TEXT DEFAULT 'queued',
+            progress REAL DEFAULT 0,
+            fps REAL,
+            speed REAL,
+            eta REAL,
+            message TEXT,
+            output_path TEXT,
+            progressive INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _ensure_column(c, 'render_jobs', 'progressive', 'INTEGER DEFAULT 0')
+
+    # Download Jobs Table (persistent download queue)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS download_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            format_mode TEXT DEFAULT 'video',
+            resolution TEXT DEFAULT 'best',
+            status TEXT DEFAULT 'queued',
+            progress REAL DEFAULT 0,
+            message TEXT,
+            video_db_id INTEGER,
+            video_uid TEXT,
+            auto_analyze INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _ensure_column(c, 'download_jobs', 'video_uid', 'TEXT')
+    _ensure_column(c, 'download_jobs', 'auto_analyze', 'INTEGER DEFAULT 0')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_download_jobs_status ON download_jobs (status, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_download_jobs_uid ON download_jobs (video_uid)')
+
+    # Persisted latency samples (only written when telemetry_persist is enabled)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS perf_samples (
+            ts REAL NOT NULL,
+            op TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            detail TEXT
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_perf_samples_ts ON perf_samples (ts)')
+
+    # Counters and timestamps of the scheduled maintenance (app/core/maintenance.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            key TEXT PRIMARY KEY,
+            value REAL
+        )
+    ''')
+
     conn.commit()
     conn.close()
 
@@ -116,17 +225,29 @@ def add_video(domain, channel_id, video_id, title, file_path, duration, thumbnai
     finally:
         conn.close()
 
+def _add_write_volume(c, rows: int):
+    c.execute('''
+        INSERT INTO maintenance_state (key, value) VALUES ('writes_since_maintenance', ?)
+        ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
+    ''', (rows,))
+
 def add_subtitles(video_id: int, segments: List[Dict]):
     conn = get_db_connection()
     c = conn.cursor()
     data = [(video_id, s['start'], s['end'], s['text']) for s in segments]
     c.execute('DELETE FROM subtitles WHERE video_id = ?', (video_id,))
+    deleted = c.rowcount
     c.executemany('''
         INSERT INTO subtitles (video_id, start_time, end_time, text)
         VALUES (?, ?, ?, ?)
     ''', data)
+    # Every deleted and inserted row leaves work for the FTS merge
+    _add_write_volume(c, deleted + len(data))
     conn.commit()
     conn.close()
+    # Imported here: subtitle_index depends on this module
+    from app.core import subtitle_index
+    subtitle_index.invalidate(video_id)
 
 def get_subtitles(video_id: int) -> List[Dict]:
     conn = get_db_connection()
@@ -136,6 +257,31 @@ def get_subtitles(video_id: int) -> List[Dict]:
     conn.close()
     return [dict(row) for row in rows]
 
+def get_subtitle_times(video_id: int) -> List[Tuple]:
+    # (id, start_time, end_time) only; the text is not needed to build the timing index
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT id, start_time, end_time FROM subtitles WHERE video_id = ? ORDER BY start_time ASC, id ASC', (video_id,))
+    rows = [tuple(row) for row in c.fetchall()]
+    conn.close()
+    return rows
+
+def get_subtitles_by_ids(subtitle_ids: List[int]) -> List[Dict]:
+    if not subtitle_ids:
+        return []
+    conn = get_db_connection()
+    c = conn.cursor()
+    rows = []
+    # Stay below SQLite's host parameter limit
+    chunk_size = 500
+    for i in range(0, len(subtitle_ids), chunk_size):
+        chunk = subtitle_ids[i:i + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'SELECT * FROM subtitles WHERE id IN ({placeholders})', chunk)
+        rows.extend(dict(row) for row in c.fetchall())
+    conn.close()
+    return sorted(rows, key=lambda r: (r['start_time'], r['id']))
+
 def search_subtitles(query: str) -> List[Dict]:
     conn = get_db_connection()
     c = conn.cursor()
@@ -167,6 +313,129 @@ def search_subtitles(query: str) -> List[Dict]:
     finally:
         conn.close()
 
+def search_subtitle_ids(conn, match_expr: str, limit: int, offset: int = 0, candidate_ids: List[int] = None) -> List[int]:
+    """
+    Matching subtitle ids in rowid order, which FTS5 streams without scoring every match,
+    so a LIMIT returns quickly even for very common prefixes.
+    `candidate_ids` restricts the match to a known superset (e.g. the complete results of a shorter prefix).
+    """
+    c = conn.cursor()
+    sql = 'SELECT rowid FROM subtitles_fts WHERE subtitles_fts MATCH ?'
+    if candidate_ids is None:
+        c.execute(sql + ' ORDER BY rowid LIMIT ? OFFSET ?', (match_expr, limit, offset))
+        return [r[0] for r in c.fetchall()]
+
+    # Stay below SQLite's host parameter limit; sorted chunks keep the rowid order
+    found = []
+    candidate_ids = sorted(candidate_ids)
+    chunk_size = 500
+    for i in range(0, len(candidate_ids), chunk_size):
+        chunk = candidate_ids[i:i + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(sql + f' AND rowid IN ({placeholders}) ORDER BY rowid', [match_expr] + chunk)
+        found.extend(r[0] for r in c.fetchall())
+        if len(found) >= offset + limit:
+            break
+    return found[offset:offset + limit]
+
+def get_search_rows(conn, subtitle_ids: List[int]) -> List[Dict]:
+    """
+    Display rows (same shape as search_subtitles) for one page of ids, in the given order.
+    """
+    if not subtitle_ids:
+        return []
+    c = conn.cursor()
+    placeholders = ','.join(['?'] * len(subtitle_ids))
+    c.execute(f'''
+        SELECT 
+            s.id as subtitle_id,
+            s.video_id,
+            s.start_time,
+            s.end_time,
+            s.text,
+            v.title as video_title,
+            v.file_path,
+            v.video_id as video_uid
+        FROM subtitles s
+        JOIN videos v ON s.video_id = v.id
+        WHERE s.id IN ({placeholders})
+    ''', subtitle_ids)
+    rows = {row['subtitle_id']: dict(row) for row in c.fetchall()}
+    return [rows[i] for i in subtitle_ids if i in rows]
+
+def delete_chat_messages(video_id: int):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('DELETE FROM chat_messages WHERE video_id = ?', (video_id,))
+    conn.commit()
+    conn.close()
+
+def add_chat_messages(video_id: int, messages: List[Dict], conn=None):
+    """
+    Insert a batch of chat messages. Pass `conn` to reuse one connection while streaming.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    data = [(video_id, m.get('time_in_seconds'), m.get('time_text'), m.get('author'), m.get('message'))
+            for m in messages]
+    conn.executemany('''
+        INSERT INTO chat_messages (video_id, time_in_seconds, time_text, author, message)
+        VALUES (?, ?, ?, ?, ?)
+    ''', data)
+    conn.commit()
+    if own_conn:
+        conn.close()
+
+def count_chat_messages(video_id: int) -> int:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*) FROM chat_messages WHERE video_id = ?', (video_id,))
+    count = c.fetchone()[0]
+    conn.close()
+    return count
+
+def get_chat_messages(video_id: int, start: float = None, end: float = None, limit: int = None) -> List[Dict]:
+    """
+    Chat messages in [start, end) seconds, ordered by time. Uses the (video_id, time_in_seconds) index.
+    """
+    sql = 'SELECT time_in_seconds, time_text, author, message FROM chat_messages WHERE video_id = ?'
+    params = [video_id]
+    if start is not None:
+        sql += ' AND time_in_seconds >= ?'
+        params.append(start)
+    if end is not None:
+        sql += ' AND time_in_seconds < ?'
+        params.append(end)
+    sql += ' ORDER BY time_in_seconds'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(sql, params)
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_chat_counts(video_id: int, bucket_seconds: float = 60.0) -> List[Tuple[float, int]]:
+    """
+    Message counts per time bucket: [(bucket_start_seconds, count), ...]
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT CAST(time_in_seconds / ? AS INTEGER) AS bucket, COUNT(*) AS n
+        FROM chat_messages
+        WHERE video_id = ? AND time_in_seconds IS NOT NULL
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', (bucket_seconds, video_id))
+    rows = c.fetchall()
+    conn.close()
+    return [(r['bucket'] * bucket_seconds, r['n']) for r in rows]
+
 def get_all_videos():
     conn = get_db_connection()
     c = conn.cursor()
@@ -175,6 +444,39 @@ def get_all_videos():
     conn.close()
     return [dict(row) for row in rows]
 
+def get_video_by_uid(video_uid: str):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM videos WHERE video_id = ?', (video_uid,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_archived_video_uids(video_uids: List[str]) -> set:
+    """
+    Download archive: which of the given yt-dlp IDs are already ingested
+    or waiting in the download queue.
+    """
+    found = set()
+    if not video_uids:
+        return found
+    conn = get_db_connection()
+    c = conn.cursor()
+    # Stay below SQLite's host parameter limit
+    chunk_size = 500
+    for i in range(0, len(video_uids), chunk_size):
+        chunk = video_uids[i:i + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'SELECT video_id FROM videos WHERE video_id IN ({placeholders})', chunk)
+        found.update(r[0] for r in c.fetchall())
+        c.execute(f'''
+            SELECT video_uid FROM download_jobs
+            WHERE video_uid IN ({placeholders}) AND status IN ('queued', 'running')
+        ''', chunk)
+        found.update(r[0] for r in c.fetchall())
+    conn.close()
+    return found
+
 def get_video_by_id(db_id: int):
     conn = get_db_connection()
     c = conn.cursor()
@@ -183,6 +485,69 @@ def get_video_by_id(db_id: int):
     conn.close()
     return dict(row) if row else None
 
+def get_videos_by_ids(db_ids: List[int]) -> Dict[int, Dict]:
+    """
+    Fetch many videos in one query. Returns {id: video}.
+    """
+    ids = list(dict.fromkeys(int(i) for i in db_ids))
+    if not ids:
+        return {}
+    conn = get_db_connection()
+    c = conn.cursor()
+    result = {}
+    chunk_size = 500
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'SELECT * FROM videos WHERE id IN ({placeholders})', chunk)
+        for row in c.fetchall():
+            result[row['id']] = dict(row)
+    conn.close()
+    return result
+
+def update_video_thumbnail(video_id: int, thumbnail_path: str):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('UPDATE videos SET thumbnail_path = ? WHERE id = ?', (thumbnail_path, video_id))
+    conn.commit()
+    conn.close()
+
+def update_video_thumbnails(video_id: int, gallery_thumb_path: str, sprite_path: str = None, sprite_layout: str = None):
+    """
+    sprite_layout: JSON tile geometry of the sheets at sprite_path (see thumbnails.make_sprite_sheets).
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('UPDATE videos SET gallery_thumb_path = ?, sprite_path = ?, sprite_layout = ? WHERE id = ?',
+              (gallery_thumb_path, sprite_path, sprite_layout, video_id))
+    conn.commit()
+    conn.close()
+
+def update_video_proxy(video_id: int, proxy_path: str):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('UPDATE videos SET proxy_path = ? WHERE id = ?', (proxy_path, video_id))
+    conn.commit()
+    conn.close()
+
+def set_ingest_stage(video_id: int, stage: str, status: str, message: str = None):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT OR REPLACE INTO ingest_stages (video_id, stage, status, message, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (video_id, stage, status, message))
+    conn.commit()
+    conn.close()
+
+def get_ingest_stages(video_id: int) -> List[Dict]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM ingest_stages WHERE video_id = ?', (video_id,))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
 def update_video_analysis(video_id: int, analysis_json: str):
     conn = get_db_connection()
     c = conn.cursor()
@@ -195,12 +560,16 @@ def delete_video(db_id: int):
     c = conn.cursor()
     
     # Get file paths first
-    c.execute('SELECT file_path, thumbnail_path FROM videos WHERE id = ?', (db_id,))
+    c.execute('SELECT file_path, thumbnail_path, proxy_path, gallery_thumb_path, sprite_path FROM videos WHERE id = ?', (db_id,))
     row = c.fetchone()
     
     if row:
         file_path = row['file_path']
         thumbnail_path = row['thumbnail_path']
+        proxy_path = row['proxy_path']
+        generated = [row['gallery_thumb_path']]
+        if row['sprite_path']:
+            generated += glob.glob(row['sprite_path'].replace('%03d', '*'))
         
         # Delete Video File
         if file_path and os.path.exists(file_path):
@@ -218,9 +587,37 @@ def delete_video(db_id: int):
             except OSError as e:
                 print(f"Error deleting thumbnail {thumbnail_path}: {e}")
 
+        # Delete Proxy
+        if proxy_path and os.path.exists(proxy_path):
+            try:
+                os.remove(proxy_path)
+                print(f"Deleted proxy: {proxy_path}")
+            except OSError as e:
+                print(f"Error deleting proxy {proxy_path}: {e}")
+
+        # Delete gallery thumbnail, sprite sheets and index sidecars (waveform peaks, keyframes)
+        if file_path:
+            stem = os.path.splitext(file_path)[0]
+            generated += [stem + '.peaks.bin', stem + '.keyframes.npy', stem + '.keyframes.v2.npy']
+        for path in generated:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Error deleting {path}: {e}")
+
+    # Explicit: foreign keys (and so ON DELETE CASCADE) are off on these connections.
+    # Each row also deletes its FTS entry, which leaves work for the FTS merge like an insert does
+    c.execute('DELETE FROM subtitles WHERE video_id = ?', (db_id,))
+    _add_write_volume(c, c.rowcount)
+    c.execute('DELETE FROM chat_messages WHERE video_id = ?', (db_id,))
+    c.execute('DELETE FROM ingest_stages WHERE video_id = ?', (db_id,))
     c.execute('DELETE FROM videos WHERE id = ?', (db_id,))
     conn.commit()
     conn.close()
+
+    from app.core import subtitle_index
+    subtitle_index.invalidate(db_id)
     
     # Cleanup unused tags
     delete_unused_tags()
@@ -277,6 +674,28 @@ def get_video_tags(video_id: int) -> List[str]:
     conn.close()
     return [r['name'] for r in rows]
 
+def get_tags_for_videos(video_ids: List[int]) -> Dict[int, List[str]]:
+    # One query per chunk instead of get_video_tags() per row
+    result = {vid: [] for vid in video_ids}
+    if not video_ids:
+        return result
+    conn = get_db_connection()
+    c = conn.cursor()
+    chunk_size = 500
+    for i in range(0, len(video_ids), chunk_size):
+        chunk = video_ids[i:i + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'''
+            SELECT vt.video_id, t.name
+            FROM tags t
+            JOIN video_tags vt ON t.id = vt.tag_id
+            WHERE vt.video_id IN ({placeholders})
+        ''', chunk)
+        for row in c.fetchall():
+            result[row['video_id']].append(row['name'])
+    conn.close()
+    return result
+
 def get_all_tags() -> List[str]:
     conn = get_db_connection()
     c = conn.cursor()
@@ -312,5 +731,200 @@ def get_videos_by_tags(tags: List[str]) -> List[Dict]:
     conn.close()
     return [dict(row) for row in rows]
 
+def add_download_job(url: str, format_mode: str = 'video', resolution: str = 'best', video_uid: str = None,
+                     auto_analyze: bool = False) -> int:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO download_jobs (url, format_mode, resolution, video_uid, auto_analyze)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (url, format_mode, resolution, video_uid, int(auto_analyze)))
+    job_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+def get_download_job(job_id: int) -> Optional[Dict]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM download_jobs WHERE id = ?', (job_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_download_jobs(limit: int = 200) -> List[Dict]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM download_jobs ORDER BY id DESC LIMIT ?', (limit,))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def update_download_job(job_id: int, **fields):
+    if not fields:
+        return
+    columns = ", ".join(f"{k} = ?" for k in fields)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f'UPDATE download_jobs SET {columns}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+              (*fields.values(), job_id))
+    conn.commit()
+    conn.close()
+
+def claim_next_download_job() -> Optional[Dict]:
+    """
+    Atomically move the oldest queued job to 'running' and return it.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        # IMMEDIATE takes the write lock up front so two workers never claim the same job
+        c.execute('BEGIN IMMEDIATE')
+        c.execute("SELECT * FROM download_jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+        row = c.fetchone()
+        if not row:
+            conn.commit()
+            return None
+        c.execute('''
+            UPDATE download_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (row['id'],))
+        conn.commit()
+        job = dict(row)
+        job['status'] = 'running'
+        return job
+    finally:
+        conn.close()
+
+def requeue_interrupted_download_jobs() -> int:
+    """
+    Jobs left 'running' by a previous process (crash / restart) go back to the queue.
+    yt-dlp resumes from the .part files they left behind.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("UPDATE download_jobs SET status = 'queued', message = 'Resuming after restart' WHERE status = 'running'")
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def add_render_job(name: str, clips_json: str, mode: str = 'encode', progressive: bool = False) -> int:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO render_jobs (name, clips_json, mode, progressive)
+        VALUES (?, ?, ?, ?)
+    ''', (name, clips_json, mode, int(progressive)))
+    job_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+def get_render_job(job_id: int) -> Optional[Dict]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM render_jobs WHERE id = ?', (job_id,))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_render_jobs(limit: int = 100, status: str = None) -> List[Dict]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    if status:
+        c.execute('SELECT * FROM render_jobs WHERE status = ? ORDER BY id LIMIT ?', (status, limit))
+    else:
+        c.execute('SELECT * FROM render_jobs ORDER BY id DESC LIMIT ?', (limit,))
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def update_render_job(job_id: int, **fields):
+    if not fields:
+        return
+    columns = ", ".join(f"{k} = ?" for k in fields)
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f'UPDATE render_jobs SET {columns}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+              (*fields.values(), job_id))
+    conn.commit()
+    conn.close()
+
+def fail_interrupted_ingest_stages() -> int:
+    """
+    Mark stages left 'pending' / 'running' by a previous process as failed; nothing is working on them anymore.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("""
+        UPDATE ingest_stages SET status = 'failed', message = 'Interrupted by app restart', updated_at = CURRENT_TIMESTAMP
+        WHERE status IN ('pending', 'running')
+    """)
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def requeue_interrupted_render_jobs() -> int:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("UPDATE render_jobs SET status = 'queued', progress = 0, message = 'Restarted after app restart' WHERE status = 'running'")
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def add_perf_samples(samples: List[Tuple], keep_days: float = 7.0):
+    """
+    samples: (ts, op, seconds, detail). Samples older than keep_days are pruned in the same transaction.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.executemany('INSERT INTO perf_samples (ts, op, seconds, detail) VALUES (?, ?, ?, ?)', samples)
+    c.execute('DELETE FROM perf_samples WHERE ts < ?', (samples[-1][0] - keep_days * 86400,))
+    conn.commit()
+    conn.close()
+
+def get_perf_samples(since: float, limit: int = 200000) -> List[Tuple]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT op, seconds FROM perf_samples WHERE ts >= ? ORDER BY ts DESC LIMIT ?', (since, limit))
+    rows = [tuple(r) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+def get_maintenance_state() -> Dict[str, float]:
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT key, value FROM maintenance_state')
+    state = {row['key']: row['value'] for row in c.fetchall()}
+    conn.close()
+    return state
+
+def finish_maintenance(writes_handled: float, finished_at: float):
+    """
+    Record a maintenance run. Only the writes it saw are subtracted; later ones stay counted.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE maintenance_state SET value = MAX(0, value - ?) WHERE key = 'writes_since_maintenance'
+    ''', (writes_handled,))
+    c.execute('''
+        INSERT INTO maintenance_state (key, value) VALUES ('last_maintenance', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (finished_at,))
+    conn.commit()
+    conn.close()
+
+# Time every public query function as "db.<name>". Excluded: the telemetry writers themselves, and the
+# maintenance bookkeeping, which must not count as user activity when it checks for idle time.
+for _name, _fn in list(globals().items()):
+    if (callable(_fn) and not _name.startswith('_') and getattr(_fn, '__module__', None) == __name__
+            and _name not in ('get_db_connection', 'init_db', 'add_perf_samples', 'get_perf_samples',
+                              'get_maintenance_state', 'finish_maintenance')):
+        globals()[_name] = telemetry.instrument(f"db.{_name}")(_fn)
+
 init_db()
 
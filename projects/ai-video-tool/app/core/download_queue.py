@@ -0,0 +1,135 @@
+import threading
+import time
+from app.core import database, downloader, utils
+
+# Minimum interval between progress writes to the DB (seconds)
+PROGRESS_WRITE_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_workers = []
+_wakeup = threading.Event()
+_cancel_events = {} # job_id -> threading.Event for running jobs
+
+class DownloadCancelled(Exception):
+    pass
+
+def get_worker_count() -> int:
+    config = utils.load_config()
+    return max(1, int(config.get("download_workers", 2)))
+
+def start_workers(count: int = None):
+    """
+    Start the background download workers (idempotent).
+    Jobs interrupted by a previous shutdown are re-queued first.
+    """
+    with _lock:
+        if _workers:
+            return len(_workers)
+
+        resumed = database.requeue_interrupted_download_jobs()
+        if resumed:
+            print(f"Resuming {resumed} interrupted download jobs.")
+
+        if count is None:
+            count = get_worker_count()
+        for i in range(count):
+            t = threading.Thread(target=_worker_loop, name=f"download-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+    return count
+
+def enqueue(url: str, format_mode: str = 'video', resolution: str = 'best', video_uid: str = None,
+            auto_analyze: bool = False) -> int:
+    job_id = database.add_download_job(url, format_mode, resolution, video_uid=video_uid, auto_analyze=auto_analyze)
+    _wakeup.set()
+    return job_id
+
+def enqueue_url(url: str, format_mode: str = 'video', resolution: str = 'best', auto_analyze: bool = False):
+    """
+    Expand playlist / channel URLs into one job per video.
+    Videos already in the library or already queued are skipped.
+    Returns (queued_job_ids, skipped_count).
+    """
+    entries = downloader.expand_url(url)
+    uids = [e['id'] for e in entries if e.get('id')]
+    archived = database.get_archived_video_uids(uids)
+
+    job_ids = []
+    skipped = 0
+    seen = set()
+    for e in entries:
+        uid = e.get('id')
+        if uid and (uid in archived or uid in seen):
+            skipped += 1
+            continue
+        seen.add(uid)
+        job_ids.append(enqueue(e['url'] or url, format_mode, resolution, video_uid=uid, auto_analyze=auto_analyze))
+    return job_ids, skipped
+
+def cancel(job_id: int) -> bool:
+    job = database.get_download_job(job_id)
+    if not job or job['status'] not in ('queued', 'running'):
+        return False
+
+    database.update_download_job(job_id, status='cancelled', message='Cancelled')
+    event = _cancel_events.get(job_id)
+    if event:
+        event.set()
+    return True
+
+def list_jobs(limit: int = 200):
+    return database.get_download_jobs(limit=limit)
+
+def _make_progress(job_id: int, cancel_event: threading.Event):
+    last_write = [0.0]
+
+    def progress(value, desc=None):
+        # Called from yt-dlp's progress hook; raising here aborts the download
+        # and keeps the .part file for a later resume.
+        if cancel_event.is_set():
+            raise DownloadCancelled()
+        now = time.monotonic()
+        if now - last_write[0] < PROGRESS_WRITE_INTERVAL and value < 1.0:
+            return
+        last_write[0] = now
+        database.update_download_job(job_id, progress=float(value), message=desc)
+
+    return progress
+
+def _run_job(job: dict):
+    job_id = job['id']
+    cancel_event = threading.Event()
+    _cancel_events[job_id] = cancel_event
+    try:
+        # Cancelled between claim and registration of the event
+        current = database.get_download_job(job_id)
+        if current and current['status'] == 'cancelled':
+            return
+        msg, db_id = downloader.download_video(
+            job['url'],
+            format_mode=job['format_mode'],
+            resolution=job['resolution'],
+            progress=_make_progress(job_id, cancel_event),
+            auto_analyze=bool(job.get('auto_analyze'))
+        )
+        if cancel_event.is_set():
+            raise DownloadCancelled()
+        database.update_download_job(job_id, status='done', progress=1.0, message=msg, video_db_id=db_id)
+    except DownloadCancelled:
+        database.update_download_job(job_id, status='cancelled', message='Cancelled')
+    except Exception as e:
+        if cancel_event.is_set():
+            database.update_download_job(job_id, status='cancelled', message='Cancelled')
+        else:
+            database.update_download_job(job_id, status='failed', message=str(e))
+    finally:
+        _cancel_events.pop(job_id, None)
+
+def _worker_loop():
+    while True:
+        job = database.claim_next_download_job()
+        if not job:
+            _wakeup.wait(timeout=5.0)
+            _wakeup.clear()
+            continue
+        _run_job(job)
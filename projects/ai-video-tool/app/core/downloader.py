@@ -1,13 +1,90 @@
 import os
 import yt_dlp
+from typing import List, Dict
 from app.core import database
 from app.core import utils
+from app.core import ingest
+from app.core import telemetry
 
-def download_video(url: str, format_mode: str = 'video', resolution: str = 'best', progress=None):
+def expand_url(url: str, max_depth: int = 2) -> List[Dict]:
+    """
+    Expand a playlist / channel URL into its video entries without downloading.
+    Returns [{'id': ..., 'url': ..., 'title': ...}, ...]. A single video URL yields one entry.
+    """
+    single_id = _single_video_id(url)
+    if single_id:
+        # Nothing to expand: the download itself does the only extraction
+        return [{'id': single_id, 'url': url, 'title': None}]
+
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'ignoreerrors': True,
+        # Only list entries; do not resolve formats for every video
+        'extract_flat': 'in_playlist',
+    }
+    entries = []
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with telemetry.timed("ytdlp.expand", url):
+            info = ydl.extract_info(url, download=False)
+        if not info:
+            raise Exception(f"Failed to fetch info: {url}")
+        _collect_entries(ydl, info, entries, max_depth)
+    return entries
+
+def _single_video_id(url: str):
+    """
+    Video id of a URL whose extractor only ever returns one video, from the URL pattern alone (no request).
+    None for playlists, channels and sites yt-dlp cannot classify up front.
+    """
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == 'Generic':
+            return None
+        if ie.suitable(url):
+            if getattr(ie, '_RETURN_TYPE', None) != 'video':
+                return None
+            try:
+                return ie.get_temp_id(url)
+            except Exception:
+                return None
+    return None
+
+def _collect_entries(ydl, info: Dict, entries: List[Dict], depth: int):
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        entries.append({
+            'id': info.get('id'),
+            'url': info.get('webpage_url') or info.get('url'),
+            'title': info.get('title'),
+        })
+        return
+
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        # Channel pages list their tabs (Videos / Live / Shorts) as nested playlists
+        ie_key = entry.get('ie_key') or ''
+        if entry.get('_type') == 'url' and ('Tab' in ie_key or 'Playlist' in ie_key) and depth > 0:
+            sub_info = ydl.extract_info(entry['url'], download=False)
+            if sub_info:
+                _collect_entries(ydl, sub_info, entries, depth - 1)
+            continue
+        if entry.get('_type') == 'playlist' and depth > 0:
+            _collect_entries(ydl, entry, entries, depth - 1)
+            continue
+        entries.append({
+            'id': entry.get('id'),
+            'url': entry.get('url') or entry.get('webpage_url'),
+            'title': entry.get('title'),
+        })
+
+def download_video(url: str, format_mode: str = 'video', resolution: str = 'best', progress=None, skip_existing: bool = True,
+                   auto_analyze: bool = False):
     """
     Download video using yt_dlp.
     format_mode: 'video' or 'audio'
     resolution: 'best', '1080p', '720p', '480p'
+    skip_existing: Return early if the video is already in the library (download archive).
+    auto_analyze: Run AI analysis once the background subtitle/chat stages finish.
     """
     
     # Base options
@@ -23,6 +100,10 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
         'subtitlesformat': 'vtt', # Download as VTT for easier parsing
         # Do not fail if subtitles (or other formats) are missing/error 429
         'ignoreerrors': True,
+        # Resume from .part files left by an interrupted download
+        'continuedl': True,
+        # Fetch DASH/HLS fragments in parallel
+        'concurrent_fragment_downloads': int(utils.load_config().get("concurrent_fragments", 4)),
     }
     
     # Configure Format
@@ -51,13 +132,18 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
     # Hook for progress
     def progress_hook(d):
         if d['status'] == 'downloading':
-            p = d.get('_percent_str', '0%').replace('%','')
-            try:
-                val = float(p) / 100.0
-                if progress:
-                    progress(val, desc=f"Downloading: {d.get('_percent_str')}")
-            except:
-                pass
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total:
+                val = d.get('downloaded_bytes', 0) / total
+            else:
+                p = d.get('_percent_str', '0%').replace('%','')
+                try:
+                    val = float(p) / 100.0
+                except:
+                    return
+            # Not wrapped in try: a queued job cancels the download by raising from progress()
+            if progress:
+                progress(min(val, 1.0), desc=f"Downloading: {d.get('_percent_str', '').strip()}")
         elif d['status'] == 'finished':
             if progress:
                 progress(1.0, desc="Download complete, processing...")
@@ -67,7 +153,10 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # 1. Extract Info
-            info = ydl.extract_info(url, download=False)
+            with telemetry.timed("ytdlp.extract_info", url):
+                info = ydl.extract_info(url, download=False)
+            if not info:
+                raise Exception("No info returned")
             
             domain = utils.sanitize_filename(info.get('webpage_url_domain', 'unknown'))
             channel_id = utils.sanitize_filename(info.get('channel_id', info.get('uploader_id', 'unknown')))
@@ -86,6 +175,11 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
     except Exception as e:
         raise Exception(f"Failed to fetch info: {e}")
 
+    if skip_existing:
+        existing = database.get_video_by_uid(video_id)
+        if existing and existing.get('file_path') and os.path.exists(existing['file_path']):
+            return f"Already in library: {existing['title']}", existing['id']
+
     # Re-instantiate with correct path
     ydl_opts['outtmpl'] = os.path.join(save_dir, f"{video_id}.%(ext)s")
     
@@ -94,7 +188,9 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
 
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         if progress: progress(0, desc="Starting download...")
-        ydl.download([url])
+        # Reuse the extracted info instead of letting download() fetch it a second time
+        with telemetry.timed("ytdlp.download", url):
+            ydl.process_ie_result(info, download=True)
         
     # Check what file was created.
     expected_path = os.path.join(save_dir, f"{video_id}.mp4")
@@ -102,22 +198,12 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
     final_path = expected_path
     if not os.path.exists(expected_path):
         for f in os.listdir(save_dir):
-            if f.startswith(video_id) and f.endswith('.mp4'):
+            if f.startswith(video_id) and f.endswith('.mp4') and not f.endswith('.proxy.mp4'):
                 final_path = os.path.join(save_dir, f)
                 break
     
-    # Check for thumbnail
-    thumbnail_path = None
-    # yt-dlp saves thumbnail as video_id.jpg or .webp
-    # We should look for it.
-    possible_exts = ['.jpg', '.jpeg', '.webp', '.png']
-    for ext in possible_exts:
-        t_path = os.path.join(save_dir, f"{video_id}{ext}")
-        if os.path.exists(t_path):
-            thumbnail_path = os.path.abspath(t_path)
-            break
-
     # Add to Database
+    # Thumbnail, subtitles and chat are handled by the background ingest stages
     db_id = database.add_video(
         domain=domain,
         channel_id=channel_id,
@@ -125,82 +211,14 @@ def download_video(url: str, format_mode: str = 'video', resolution: str = 'best
         title=title,
         file_path=os.path.abspath(final_path), # Absolute path is safer
         duration=duration,
-        thumbnail_path=thumbnail_path
+        thumbnail_path=None
     )
 
-    # Check for subtitles and import
-    subtitle_path = None
-    # Preferences: ja.vtt > en.vtt > any.vtt
-    # Check simple lang codes first
-    for lang in ['ja', 'en', 'live_chat']: 
-        s_path = os.path.join(save_dir, f"{video_id}.{lang}.vtt")
-        if os.path.exists(s_path):
-            subtitle_path = s_path
-            break
-            
-    # Fallback to any vtt starting with video_id
-    if not subtitle_path:
-        for f in os.listdir(save_dir):
-            if f.startswith(video_id) and f.endswith(".vtt"):
-                subtitle_path = os.path.join(save_dir, f)
-                break
-    
-    extracted_subs_count = 0
-    if subtitle_path and db_id:
-        if progress: progress(0.95, desc="Importing subtitles...")
-        try:
-            segments = utils.parse_vtt_file(subtitle_path)
-            if segments:
-                database.add_subtitles(db_id, segments)
-                extracted_subs_count = len(segments)
-        except Exception as e:
-            print(f"Failed to parse subtitles: {e}")
-    
-    # Download Comments/Chat
-    chat_file = os.path.join(save_dir, "comments.json")
-    chat_log_count = 0
-    
-    # Try chat-downloader specifically if possible, otherwise rely on yt-dlp if it were enabled (but it's slow).
-    # The user specifically asked for chat-downloader.
-    try:
-        from chat_downloader import ChatDownloader
-        if progress: progress(0.98, desc="Downloading Chat/Comments...")
-        
-        # Limit to top N or first N to avoid getting stuck on 10h streams
-        # Or maybe filter by time?
-        # For now, let's grab top 500 messages or so if possible.
-        # ChatDownloader iterates.
-        
-        chat_data = []
-        downloader_chat = ChatDownloader()
-        try:
-            # We need the URL again.
-            chat_stream = downloader_chat.get_chat(url, message_groups=['messages', 'superchat']) # get messages
-            
-            count = 0
-            for message in chat_stream:
-                chat_data.append({
-                    'time_text': message.get('time_text'),
-                    'time_in_seconds': message.get('time_in_seconds'),
-                    'message': message.get('message'),
-                    'author': message.get('author', {}).get('name')
-                })
-                count += 1
-                if count >= 1000: # Limit to 1000 comments for performance
-                    break
-            
-            if chat_data:
-                with open(chat_file, 'w', encoding='utf-8') as f:
-                    json.dump(chat_data, f, indent=4, ensure_ascii=False)
-                chat_log_count = len(chat_data)
-                
-        except Exception as e_chat:
-            print(f"Chat download (stream) failed: {e_chat}")
-            # Fallback to simple requests if video? ChatDownloader handles VODs too.
-            
-    except ImportError:
-        print("chat-downloader not installed. subprocess call?")
-    except Exception as e:
-        print(f"Chat download error: {e}")
+    if db_id:
+        ingest.submit_post_download(
+            db_id, save_dir, video_id,
+            info.get('webpage_url') or url,
+            auto_analyze_enabled=auto_analyze
+        )
 
-    return f"Successfully downloaded: {title}. Imported {extracted_subs_count} subtitle segments. Saved {chat_log_count} comments.", db_id
+    return f"Successfully downloaded: {title}. Subtitles, chat and thumbnail are being processed in the background.", db_id
@@ -1,20 +1,136 @@
 import ffmpeg
 import os
-from app.core import utils
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.core import utils, keyframes, telemetry
 
-def create_montage(clips, output_filename="montage.mp4", progress=None, fast_preview=False):
+# Pieces shorter than this are dropped instead of being encoded (about one frame)
+MIN_PIECE_DURATION = 0.04
+
+# Segment length for progressive (HLS) output
+HLS_SEGMENT_SECONDS = 4
+
+class SmartCutUnsupported(Exception):
+    pass
+
+class RenderCancelled(Exception):
+    pass
+
+def format_eta(seconds: float) -> str:
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h:d}:{m:02d}:{s:02d}"
+
+def run_ffmpeg(out, duration: float = None, progress=None, cancel_event=None, stats_callback=None,
+               progress_range=(0.0, 1.0)):
+    """
+    Run an ffmpeg-python output node, parsing `-progress pipe:1` for live stats.
+    Only the tail of stderr is kept, so long renders do not buffer their whole log.
+    duration: Expected output duration in seconds (for percent / ETA).
+    cancel_event: threading.Event; when set the process is terminated and RenderCancelled is raised.
+    stats_callback: Called with {'fraction', 'fps', 'speed', 'eta', 'out_time'} on each progress block.
+    progress_range: Sub-range of the overall progress bar this run maps onto.
+    """
+    out = out.global_args('-progress', 'pipe:1', '-nostats')
+    started = time.monotonic()
+    proc = out.run_async(pipe_stdout=True, pipe_stderr=True, overwrite_output=True)
+
+    stderr_tail = deque(maxlen=50)
+    def drain_stderr():
+        for line in proc.stderr:
+            stderr_tail.append(line.decode('utf-8', errors='ignore').rstrip())
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    lo, hi = progress_range
+    block = {}
+    try:
+        for raw in proc.stdout:
+            if cancel_event is not None and cancel_event.is_set():
+                proc.terminate()
+                proc.wait()
+                raise RenderCancelled()
+
+            key, _, value = raw.decode('utf-8', errors='ignore').strip().partition('=')
+            if key != 'progress':
+                block[key] = value
+                continue
+
+            # End of one progress block
+            out_time = 0.0
+            try:
+                out_time = int(block.get('out_time_us') or block.get('out_time_ms') or 0) / 1_000_000
+            except ValueError:
+                pass
+            speed_str = (block.get('speed') or '').rstrip('x').strip()
+            try:
+                speed = float(speed_str)
+            except ValueError:
+                speed = None
+            try:
+                fps = float(block.get('fps') or 0)
+            except ValueError:
+                fps = 0.0
+
+            fraction = min(1.0, out_time / duration) if duration else 0.0
+            eta = None
+            if duration and speed:
+                eta = max(0.0, (duration - out_time) / speed)
+            elif fraction > 0:
+                elapsed = time.monotonic() - started
+                eta = elapsed * (1 - fraction) / fraction
+
+            stats = {'fraction': fraction, 'fps': fps, 'speed': speed, 'eta': eta, 'out_time': out_time}
+            if stats_callback:
+                stats_callback(stats)
+            if progress:
+                desc = f"Rendering {fraction * 100:.0f}% | {fps:.0f} fps"
+                if speed:
+                    desc += f" | {speed:.2f}x"
+                if eta is not None:
+                    desc += f" | ETA {format_eta(eta)}"
+                progress(lo + (hi - lo) * fraction, desc=desc)
+            block = {}
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        stderr_thread.join(timeout=5)
+        telemetry.record("ffmpeg.render", time.monotonic() - started, f"{duration:.1f}s output" if duration else None)
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise RenderCancelled()
+    if proc.returncode != 0:
+        print("\n".join(stderr_tail))
+        raise RuntimeError("FFmpeg processing failed.")
+
+def create_montage(clips, output_filename="montage.mp4", progress=None, fast_preview=False, mode="encode", output_path=None,
+                   cancel_event=None, stats_callback=None, hls_dir=None):
     """
     Stitch multiple clips together.
     clips: List of dicts {'video_path': str, 'start': float, 'end': float}
     fast_preview: If True, downscale video and use very fast presets.
+    mode: 'encode' re-encodes everything through one filter graph.
+          'smart' stream-copies whole GOPs and re-encodes only the partial GOPs at clip edges.
+          'parallel' encodes each clip to a segment in a process pool, then concatenates without re-encoding.
+    output_path: Explicit destination; overrides the path derived from output_filename.
+    cancel_event / stats_callback: See run_ffmpeg. Used by the render queue.
+    hls_dir: Progressive output. Encode to HLS segments in this directory (playable while
+             rendering), then remux them to a standard MP4 at output_path. Uses the 'encode' path.
     """
     
     if not clips:
         raise ValueError("No clips provided.")
         
     # Output path
-    # Output path
-    if output_filename.startswith("preview_"):
+    if output_path:
+        pass
+    elif output_filename.startswith("preview_"):
         temp_dir = "temp"
         if not os.path.exists(temp_dir):
             os.makedirs(temp_dir)
@@ -40,15 +156,32 @@ def create_montage(clips, output_filename="montage.mp4", progress=None, fast_pre
             
             if progress: progress(0.5, desc="Quick Copying...")
             try:
-                out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+                with telemetry.timed("ffmpeg.copy_preview"):
+                    out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
                 if progress: progress(1.0, desc="Preview Ready.")
                 return output_path
             except ffmpeg.Error as e:
                 print(f"Stream copy failed: {e.stderr.decode('utf-8')}, falling back to encode.")
                 # Fallthrough to normal encoding if copy fails
     
+    if hls_dir:
+        # Segments have to come out of one continuous encode
+        mode = "encode"
+
+    if mode == "smart" and not fast_preview:
+        try:
+            return smart_cut_montage(clips, output_path, progress=progress, cancel_event=cancel_event,
+                                     stats_callback=stats_callback)
+        except SmartCutUnsupported as e:
+            print(f"Smart cut not possible ({e}), falling back to re-encode.")
+
+    if mode == "parallel" and not fast_preview:
+        return parallel_render_montage(clips, output_path, progress=progress, cancel_event=cancel_event,
+                                       stats_callback=stats_callback)
+
     # Build filter complex for multiple clips or if copy not requested/failed
     streams = []
+    total_duration = 0.0
     
     for clip in clips:
         path = clip['video_path']
@@ -76,28 +209,328 @@ def create_montage(clips, output_filename="montage.mp4", progress=None, fast_pre
         
         streams.append(v)
         streams.append(a)
+        total_duration += duration
     
     if not streams:
         raise ValueError("No valid clips found.")
         
     joined = ffmpeg.concat(*streams, v=1, a=1).node
     
-    if fast_preview:
+    if hls_dir:
+        # Drop segments of an earlier attempt at the same job
+        shutil.rmtree(hls_dir, ignore_errors=True)
+        os.makedirs(hls_dir)
+        out = ffmpeg.output(
+            joined[0], joined[1], get_hls_playlist_path(hls_dir),
+            vcodec='libx264', preset='ultrafast', crf=23, acodec='aac',
+            # Short, keyframe-aligned segments so playback can start early
+            force_key_frames=f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})',
+            f='hls', hls_time=HLS_SEGMENT_SECONDS, hls_list_size=0, hls_playlist_type='event',
+            hls_segment_filename=os.path.join(hls_dir, 'segment_%05d.ts')
+        )
+    elif fast_preview:
         # Super fast logic for re-encoding
         out = ffmpeg.output(joined[0], joined[1], output_path, vcodec='libx264', preset='ultrafast', crf=35)
     else:
         # Normal export logic
         out = ffmpeg.output(joined[0], joined[1], output_path, vcodec='libx264', preset='ultrafast', crf=23)
     
-    if progress: progress(0.5, desc="Rendering Montage...")
+    if progress: progress(0.0, desc="Rendering Montage...")
     
     try:
-        out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
-    except ffmpeg.Error as e:
-        # print stderr
-        print(e.stderr.decode('utf-8'))
-        raise RuntimeError("FFmpeg processing failed.")
+        run_ffmpeg(out, duration=total_duration, progress=progress, cancel_event=cancel_event,
+                   stats_callback=stats_callback)
+    except RenderCancelled:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    if hls_dir:
+        # Final remux of the segments to a regular MP4 for download
+        if progress: progress(1.0, desc="Remuxing to MP4...")
+        remux = ffmpeg.output(
+            ffmpeg.input(get_hls_playlist_path(hls_dir)),
+            output_path, c='copy', movflags='+faststart', **{'bsf:a': 'aac_adtstoasc'}
+        )
+        run_ffmpeg(remux, cancel_event=cancel_event)
         
     if progress: progress(1.0, desc="Montage Created.")
     
     return output_path
+
+
+def _probe_stream_params(path: str) -> dict:
+    info = ffmpeg.probe(path)
+    video = next((st for st in info['streams'] if st['codec_type'] == 'video'), None)
+    audio = next((st for st in info['streams'] if st['codec_type'] == 'audio'), None)
+    if not video:
+        raise SmartCutUnsupported(f"No video stream in {path}")
+    return {
+        'vcodec': video.get('codec_name'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'pix_fmt': video.get('pix_fmt'),
+        'profile': (video.get('profile') or '').lower(),
+        'r_frame_rate': video.get('r_frame_rate'),
+        'acodec': audio.get('codec_name') if audio else None,
+        'sample_rate': audio.get('sample_rate') if audio else None,
+        'channels': audio.get('channels') if audio else None,
+    }
+
+def _encode_piece(path, start, duration, out_path, params):
+    """
+    Frame-accurate re-encode of a partial GOP, matching the source stream parameters
+    so it can be joined with stream-copied pieces. x264 writes its own SPS/PPS, which never
+    match the source encoder's; they travel in-band ahead of the piece's first IDR frame.
+    """
+    inp = ffmpeg.input(path, ss=start, t=duration)
+    kwargs = {
+        'vcodec': 'libx264',
+        'preset': 'veryfast',
+        'crf': 18,
+        'pix_fmt': params['pix_fmt'],
+        'r': params['r_frame_rate'],
+        'f': 'mpegts',
+        'bsf:v': 'dump_extra',
+    }
+    if params['profile'] in ('baseline', 'main', 'high'):
+        kwargs['profile:v'] = params['profile']
+    if params['acodec']:
+        kwargs.update({'acodec': 'aac', 'ar': params['sample_rate'], 'ac': params['channels']})
+        out = ffmpeg.output(inp.video, inp.audio, out_path, **kwargs)
+    else:
+        out = ffmpeg.output(inp.video, out_path, **kwargs)
+    with telemetry.timed("ffmpeg.smart_encode_piece"):
+        out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
+def _copy_piece(path, start, duration, out_path):
+    # `start` is a keyframe, so input seeking lands exactly on it.
+    # mp4toannexb puts the source's SPS/PPS in-band ahead of every keyframe
+    inp = ffmpeg.input(path, ss=start, t=duration)
+    out = ffmpeg.output(inp, out_path, c='copy', f='mpegts', **{'bsf:v': 'h264_mp4toannexb'})
+    with telemetry.timed("ffmpeg.smart_copy_piece"):
+        out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
+def plan_smart_cut(kf, start: float, end: float):
+    """
+    Split [start, end) into pieces: [('encode'|'copy', start, end), ...]
+    using the keyframe times `kf`.
+    """
+    first_kf = keyframes.keyframe_at_or_after(kf, start)
+    last_kf = keyframes.keyframe_at_or_before(kf, end)
+    if first_kf is None or last_kf is None or first_kf >= last_kf:
+        # No complete GOP inside the clip
+        return [('encode', start, end)]
+
+    pieces = []
+    if first_kf - start > MIN_PIECE_DURATION:
+        pieces.append(('encode', start, first_kf))
+    pieces.append(('copy', first_kf, last_kf))
+    if end - last_kf > MIN_PIECE_DURATION:
+        pieces.append(('encode', last_kf, end))
+    return pieces
+
+def smart_cut_montage(clips, output_path, progress=None, cancel_event=None, stats_callback=None):
+    """
+    Keyframe-aware montage: stream-copy GOP-aligned interiors, re-encode only clip edges,
+    and join everything with the concat demuxer. All sources must share codec parameters.
+    """
+    valid_clips = [c for c in clips if os.path.exists(c['video_path'])]
+    if not valid_clips:
+        raise ValueError("No valid clips found.")
+
+    params = None
+    for path in dict.fromkeys(c['video_path'] for c in valid_clips):
+        p = _probe_stream_params(path)
+        if p['vcodec'] != 'h264':
+            raise SmartCutUnsupported(f"video codec {p['vcodec']} (h264 required)")
+        if p['acodec'] not in (None, 'aac'):
+            raise SmartCutUnsupported(f"audio codec {p['acodec']} (aac required)")
+        if params is None:
+            params = p
+        elif p != params:
+            raise SmartCutUnsupported("sources have different stream parameters")
+
+    work_dir = os.path.join("temp", f"smartcut_{uuid.uuid4().hex}")
+    os.makedirs(work_dir)
+    try:
+        plan = []
+        for clip in valid_clips:
+            kf = keyframes.get_keyframes(clip['video_path'])
+            for kind, s, e in plan_smart_cut(kf, float(clip['start']), float(clip['end'])):
+                plan.append((kind, clip['video_path'], s, e))
+
+        piece_paths = []
+        for i, (kind, path, s, e) in enumerate(plan):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RenderCancelled()
+            if stats_callback:
+                stats_callback({'fraction': i / (len(plan) + 1), 'fps': 0.0, 'speed': None, 'eta': None, 'out_time': 0.0})
+            if progress: progress(i / (len(plan) + 1), desc=f"Smart cut: piece {i + 1}/{len(plan)} ({kind})")
+            piece_path = os.path.join(work_dir, f"piece_{i:04d}.ts")
+            try:
+                if kind == 'copy':
+                    _copy_piece(path, s, e - s, piece_path)
+                else:
+                    _encode_piece(path, s, e - s, piece_path, params)
+            except ffmpeg.Error as err:
+                print(err.stderr.decode('utf-8', errors='ignore'))
+                raise RuntimeError("FFmpeg processing failed.")
+            piece_paths.append(piece_path)
+
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for piece_path in piece_paths:
+                f.write(f"file '{os.path.abspath(piece_path)}'\n")
+
+        if progress: progress(len(plan) / (len(plan) + 1), desc="Joining pieces...")
+        # avc3: parameter sets stay in-band, so decoders switch between the source's and x264's
+        # at each piece instead of decoding everything with the first piece's avcC
+        out = ffmpeg.output(
+            ffmpeg.input(list_path, f='concat', safe=0),
+            output_path, c='copy', movflags='+faststart', **{'bsf:a': 'aac_adtstoasc', 'tag:v': 'avc3'}
+        )
+        run_ffmpeg(out, cancel_event=cancel_event)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if progress: progress(1.0, desc="Montage Created.")
+    return output_path
+
+
+def get_cpu_budget() -> int:
+    """
+    Cores one render job may use: the CPU count shared between the jobs the render queue runs at once.
+    """
+    # Imported here: render_queue imports this module
+    from app.core import render_queue
+    return max(1, (os.cpu_count() or 2) // render_queue.get_concurrency())
+
+def get_render_workers() -> int:
+    config = utils.load_config()
+    return max(1, int(config.get("render_workers", get_cpu_budget())))
+
+def _render_segment(index, path, start, duration, out_path, width, height, fps, threads):
+    """
+    Encode one clip to a normalized MPEG-TS segment. Runs in a worker process.
+    Returns (index, out_path, elapsed_seconds).
+    """
+    started = time.perf_counter()
+    inp = ffmpeg.input(path, ss=start, t=duration)
+    # Normalize every segment to the same size / rate so they concat without re-encoding
+    v = (
+        inp.video
+        .filter('scale', width, height, force_original_aspect_ratio='decrease')
+        .filter('pad', width, height, '(ow-iw)/2', '(oh-ih)/2')
+        .filter('setsar', 1)
+        .filter('fps', fps)
+    )
+    a = inp.audio.filter('aresample', 48000)
+    out = ffmpeg.output(
+        v, a, out_path,
+        vcodec='libx264', preset='ultrafast', crf=23, pix_fmt='yuv420p', threads=threads,
+        acodec='aac', ac=2, ar=48000, f='mpegts'
+    )
+    try:
+        out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        raise RuntimeError(e.stderr.decode('utf-8', errors='ignore')[-2000:])
+    return index, out_path, time.perf_counter() - started
+
+def parallel_render_montage(clips, output_path, progress=None, max_workers: int = None, cancel_event=None,
+                            stats_callback=None):
+    """
+    Render each clip to its own segment in a process pool sized to this job's share of the CPUs,
+    then join the segments with the concat demuxer (stream copy).
+    At most `max_workers` inputs are open at any time.
+    """
+    valid_clips = [c for c in clips if os.path.exists(c['video_path'])]
+    for c in clips:
+        if c not in valid_clips:
+            print(f"Warning: File not found {c['video_path']}, skipping.")
+    if not valid_clips:
+        raise ValueError("No valid clips found.")
+
+    # Output format follows the first source
+    first = ffmpeg.probe(valid_clips[0]['video_path'])
+    v_stream = next(st for st in first['streams'] if st['codec_type'] == 'video')
+    width, height = v_stream['width'], v_stream['height']
+    fps = v_stream.get('r_frame_rate', '30')
+
+    if max_workers is None:
+        max_workers = get_render_workers()
+    max_workers = min(max_workers, len(valid_clips))
+    # Share this job's cores between workers instead of letting each x264 grab all of them
+    threads = max(1, get_cpu_budget() // max_workers)
+
+    work_dir = os.path.join("temp", f"parallel_{uuid.uuid4().hex}")
+    os.makedirs(work_dir)
+    try:
+        segments = [None] * len(valid_clips)
+        timings = []
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = []
+            for i, clip in enumerate(valid_clips):
+                start = float(clip['start'])
+                duration = float(clip['end']) - start
+                seg_path = os.path.join(work_dir, f"segment_{i:04d}.ts")
+                futures.append(pool.submit(
+                    _render_segment, i, clip['video_path'], start, duration, seg_path,
+                    width, height, fps, threads
+                ))
+
+            done = 0
+            for future in as_completed(futures):
+                if cancel_event is not None and cancel_event.is_set():
+                    # Queued segments are dropped; segments already encoding finish in their worker
+                    for f in futures:
+                        f.cancel()
+                    raise RenderCancelled()
+                try:
+                    index, seg_path, elapsed = future.result()
+                except Exception as e:
+                    print(e)
+                    raise RuntimeError("FFmpeg processing failed.")
+                segments[index] = seg_path
+                timings.append((index, elapsed))
+                done += 1
+                print(f"Segment {index + 1}/{len(valid_clips)} rendered in {elapsed:.1f}s")
+                if stats_callback:
+                    stats_callback({'fraction': done / (len(valid_clips) + 1), 'fps': 0.0, 'speed': None, 'eta': None, 'out_time': 0.0})
+                if progress: progress(done / (len(valid_clips) + 1), desc=f"Segment {index + 1} rendered in {elapsed:.1f}s ({done}/{len(valid_clips)})")
+
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for seg_path in segments:
+                f.write(f"file '{os.path.abspath(seg_path)}'\n")
+
+        if progress: progress(len(valid_clips) / (len(valid_clips) + 1), desc="Joining segments...")
+        out = ffmpeg.output(
+            ffmpeg.input(list_path, f='concat', safe=0),
+            output_path, c='copy', movflags='+faststart', **{'bsf:a': 'aac_adtstoasc'}
+        )
+        run_ffmpeg(out, cancel_event=cancel_event)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total = sum(t for _, t in timings)
+    print(f"Parallel render: {len(timings)} segments, {total:.1f}s CPU-side encode time, {max_workers} workers.")
+    if progress: progress(1.0, desc="Montage Created.")
+    return output_path
+
+
+def get_hls_playlist_path(hls_dir: str) -> str:
+    return os.path.join(hls_dir, "index.m3u8")
+
+def list_hls_segments(hls_dir: str):
+    """
+    Completed segments listed in the playlist so far, and whether the playlist is final.
+    The HLS muxer only adds a segment to the playlist after it is fully written.
+    """
+    playlist = get_hls_playlist_path(hls_dir)
+    if not os.path.exists(playlist):
+        return [], False
+    with open(playlist, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    segments = [os.path.join(hls_dir, line) for line in lines if line and not line.startswith('#')]
+    return segments, '#EXT-X-ENDLIST' in lines
@@ -0,0 +1,225 @@
+import os
+import threading
+import ffmpeg
+from concurrent.futures import ThreadPoolExecutor
+from app.core import database, utils, chat, proxy, thumbnails, waveform, telemetry
+
+# Post-download stages, in display order. 'register' runs synchronously in the downloader.
+STAGES = ['register', 'subtitles', 'chat', 'thumbnail', 'proxy', 'waveform', 'analysis']
+
+_executor = None
+_executor_lock = threading.Lock()
+# Videos with a waveform build queued or running in this process
+_waveform_pending = set()
+_waveform_lock = threading.Lock()
+
+def get_executor(max_workers: int = None) -> ThreadPoolExecutor:
+    """
+    Shared ingest executor. `max_workers` overrides "ingest_workers" but only before the first call.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            interrupted = database.fail_interrupted_ingest_stages()
+            if interrupted:
+                print(f"Marked {interrupted} interrupted ingest stages as failed.")
+            if max_workers is None:
+                max_workers = int(utils.load_config().get("ingest_workers", 4))
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, max_workers),
+                thread_name_prefix="ingest"
+            )
+    return _executor
+
+def find_subtitle_file(save_dir: str, video_id: str):
+    # Preferences: ja.vtt > en.vtt > any.vtt
+    # Check simple lang codes first
+    for lang in ['ja', 'en', 'live_chat']:
+        s_path = os.path.join(save_dir, f"{video_id}.{lang}.vtt")
+        if os.path.exists(s_path):
+            return s_path
+
+    # Fallback to any vtt starting with video_id
+    for f in os.listdir(save_dir):
+        if f.startswith(video_id) and f.endswith(".vtt"):
+            return os.path.join(save_dir, f)
+    return None
+
+def import_subtitles(db_id: int, save_dir: str, video_id: str) -> str:
+    subtitle_path = find_subtitle_file(save_dir, video_id)
+    if not subtitle_path:
+        return "No subtitles"
+    segments = utils.parse_vtt_file(subtitle_path)
+    if segments:
+        database.add_subtitles(db_id, segments)
+    return f"{len(segments)} segments"
+
+def fetch_chat(db_id: int, url: str) -> str:
+    # Streamed into the chat_messages table in batches; no cap, so long streams are stored in full.
+    count = chat.download_chat(url, db_id)
+    return f"{count} messages"
+
+def _make_gallery_thumbnail(video: dict, thumbnail_path: str):
+    # Small WebP for the gallery; the original stays around for full-size use
+    gallery = thumbnails.make_gallery_thumbnail(video['id'], video['file_path'], thumbnail_path, video.get('duration'))
+    database.update_video_thumbnails(video['id'], os.path.abspath(gallery), video.get('sprite_path'), video.get('sprite_layout'))
+    # A re-download or new thumbnail changes the key; drop the WebP it replaces
+    thumbnails.remove_stale(video['id'], [gallery, video.get('sprite_path')])
+
+def generate_thumbnail(db_id: int, save_dir: str, video_id: str) -> str:
+    """
+    Use the thumbnail yt-dlp wrote, or grab a frame from the video if there is none.
+    """
+    video = database.get_video_by_id(db_id)
+    if not video or not video.get('file_path') or not os.path.exists(video['file_path']):
+        raise ValueError("Video file not found")
+
+    # yt-dlp saves thumbnail as video_id.jpg or .webp
+    for ext in ['.jpg', '.jpeg', '.webp', '.png']:
+        t_path = os.path.join(save_dir, f"{video_id}{ext}")
+        if os.path.exists(t_path):
+            database.update_video_thumbnail(db_id, os.path.abspath(t_path))
+            _make_gallery_thumbnail(video, t_path)
+            return "From yt-dlp"
+
+    t_path = os.path.join(save_dir, f"{video_id}.jpg")
+    seek = (video.get('duration') or 0) * 0.1
+    try:
+        with telemetry.timed("ffmpeg.thumbnail"):
+            (
+                ffmpeg
+                .input(video['file_path'], ss=seek)
+                .output(t_path, vframes=1, vf='scale=640:-2')
+                .run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+            )
+    except ffmpeg.Error as e:
+        print(e.stderr.decode('utf-8', errors='ignore'))
+        raise RuntimeError("FFmpeg thumbnail extraction failed.")
+    database.update_video_thumbnail(db_id, os.path.abspath(t_path))
+    _make_gallery_thumbnail(video, t_path)
+    return "Generated from video"
+
+def submit_thumbnail(db_id: int, save_dir: str, video_id: str):
+    """
+    Queue the thumbnail stage alone (backfill for scanned videos).
+    """
+    executor = get_executor()
+    database.set_ingest_stage(db_id, 'thumbnail', 'pending')
+    return executor.submit(_run_stage, db_id, 'thumbnail', generate_thumbnail, db_id, save_dir, video_id)
+
+def build_proxy(db_id: int) -> str:
+    proxy.generate_proxy(db_id)
+    return "Proxy ready"
+
+def submit_proxy(db_id: int):
+    """
+    Queue proxy generation alone (e.g. for videos found by a storage scan).
+    """
+    executor = get_executor()
+    database.set_ingest_stage(db_id, 'proxy', 'pending')
+    return executor.submit(_run_stage, db_id, 'proxy', build_proxy, db_id)
+
+def submit_missing_proxies() -> int:
+    count = 0
+    for v in database.get_all_videos():
+        if v.get('proxy_path') and os.path.exists(v['proxy_path']):
+            continue
+        if not v.get('file_path') or not os.path.exists(v['file_path']):
+            continue
+        submit_proxy(v['id'])
+        count += 1
+    return count
+
+def build_waveform(db_id: int) -> str:
+    video = database.get_video_by_id(db_id)
+    if not video or not video.get('file_path') or not os.path.exists(video['file_path']):
+        raise ValueError("Video file not found")
+    waveform.build_peaks(video['file_path'])
+    return "Peaks ready"
+
+def submit_waveform(db_id: int):
+    """
+    Queue waveform peak extraction alone. Not resubmitted while this process is already building it
+    (in memory: a stage row left 'running' by a crash must not block the build forever).
+    """
+    with _waveform_lock:
+        if db_id in _waveform_pending:
+            return None
+        _waveform_pending.add(db_id)
+    executor = get_executor()
+    database.set_ingest_stage(db_id, 'waveform', 'pending')
+    future = executor.submit(_run_stage, db_id, 'waveform', build_waveform, db_id)
+
+    def on_done(_):
+        with _waveform_lock:
+            _waveform_pending.discard(db_id)
+    future.add_done_callback(on_done)
+    return future
+
+def auto_analyze(db_id: int) -> str:
+    # Imported lazily: the Gemini client is only needed when auto-analysis is enabled
+    from app.core import ai_analyzer
+    result = ai_analyzer.analyze_video(db_id)
+    return f"{len(result.get('highlights', []))} highlights"
+
+def _run_stage(db_id: int, stage: str, func, *args):
+    database.set_ingest_stage(db_id, stage, 'running')
+    try:
+        message = func(*args)
+        database.set_ingest_stage(db_id, stage, 'done', message)
+    except ImportError as e:
+        database.set_ingest_stage(db_id, stage, 'skipped', str(e))
+    except Exception as e:
+        print(f"Ingest stage '{stage}' failed for video {db_id}: {e}")
+        database.set_ingest_stage(db_id, stage, 'failed', str(e))
+
+def submit_post_download(db_id: int, save_dir: str, video_id: str, url: str, auto_analyze_enabled: bool = False):
+    """
+    Run the post-download stages on the background executor.
+    Subtitles, chat, thumbnail, proxy and waveform run concurrently; analysis starts once
+    subtitles and chat are both finished (it needs them as input).
+    """
+    executor = get_executor()
+    database.set_ingest_stage(db_id, 'register', 'done')
+    for stage in ['subtitles', 'chat', 'thumbnail']:
+        database.set_ingest_stage(db_id, stage, 'pending')
+
+    f_subs = executor.submit(_run_stage, db_id, 'subtitles', import_subtitles, db_id, save_dir, video_id)
+    f_chat = executor.submit(_run_stage, db_id, 'chat', fetch_chat, db_id, url)
+    executor.submit(_run_stage, db_id, 'thumbnail', generate_thumbnail, db_id, save_dir, video_id)
+    submit_proxy(db_id)
+    submit_waveform(db_id)
+
+    if not auto_analyze_enabled:
+        database.set_ingest_stage(db_id, 'analysis', 'skipped', 'Auto-analysis disabled')
+        return
+
+    database.set_ingest_stage(db_id, 'analysis', 'pending')
+    remaining = [2]
+    lock = threading.Lock()
+
+    def on_input_done(_):
+        with lock:
+            remaining[0] -= 1
+            ready = remaining[0] == 0
+        if ready:
+            executor.submit(_run_stage, db_id, 'analysis', auto_analyze, db_id)
+
+    f_subs.add_done_callback(on_input_done)
+    f_chat.add_done_callback(on_input_done)
+
+def describe_stages(db_id: int) -> str:
+    stages = {s['stage']: s for s in database.get_ingest_stages(db_id)}
+    parts = []
+    for stage in STAGES:
+        s = stages.get(stage)
+        if not s:
+            continue
+        text = f"{stage}: {s['status']}"
+        if s['message']:
+            text += f" ({s['message']})"
+        parts.append(text)
+    return ", ".join(parts)
+
+def is_finished(db_id: int) -> bool:
+    return all(s['status'] in ('done', 'failed', 'skipped') for s in database.get_ingest_stages(db_id))
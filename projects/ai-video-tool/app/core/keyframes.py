@@ -0,0 +1,80 @@
+import os
+import subprocess
+import threading
+import numpy as np
+from app.core import telemetry
+
+# In-memory cache: video_path -> (mtime, keyframe times)
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_index_path(video_path: str) -> str:
+    # v2: times relative to the container start (older .keyframes.npy files held raw pts)
+    return os.path.splitext(video_path)[0] + ".keyframes.v2.npy"
+
+def probe_keyframes(video_path: str) -> np.ndarray:
+    """
+    Keyframe timestamps (seconds) of the first video stream, relative to the container
+    start_time like ffmpeg's input -ss. Reads packet flags only, so nothing is decoded.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags:format=start_time',
+        '-of', 'csv=print_section=1',
+        video_path
+    ]
+    with telemetry.timed("ffprobe.keyframes", video_path):
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {result.stderr.strip()}")
+
+    times = []
+    start_time = 0.0
+    for line in result.stdout.splitlines():
+        parts = line.split(',')
+        try:
+            if parts[0] == 'format' and len(parts) >= 2:
+                start_time = float(parts[1])
+            elif parts[0] == 'packet' and len(parts) >= 3 and 'K' in parts[2]:
+                times.append(float(parts[1]))
+        except ValueError:
+            continue # pts_time / start_time can be N/A
+    times.sort()
+    return np.asarray(times, dtype=np.float64) - start_time
+
+def get_keyframes(video_path: str) -> np.ndarray:
+    """
+    Cached keyframe index. Stored next to the video and invalidated by mtime.
+    """
+    mtime = os.path.getmtime(video_path)
+    with _cache_lock:
+        cached = _cache.get(video_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    index_path = get_index_path(video_path)
+    keyframes = None
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= mtime:
+        try:
+            keyframes = np.load(index_path)
+        except Exception as e:
+            print(f"Failed to load keyframe index {index_path}: {e}")
+
+    if keyframes is None:
+        keyframes = probe_keyframes(video_path)
+        tmp_path = index_path + ".tmp.npy"
+        np.save(tmp_path, keyframes)
+        os.replace(tmp_path, index_path)
+
+    with _cache_lock:
+        _cache[video_path] = (mtime, keyframes)
+    return keyframes
+
+def keyframe_at_or_after(keyframes: np.ndarray, t: float, eps: float = 1e-3):
+    i = int(np.searchsorted(keyframes, t - eps, side='left'))
+    return float(keyframes[i]) if i < len(keyframes) else None
+
+def keyframe_at_or_before(keyframes: np.ndarray, t: float, eps: float = 1e-3):
+    i = int(np.searchsorted(keyframes, t + eps, side='right'))
+    return float(keyframes[i - 1]) if i > 0 else None
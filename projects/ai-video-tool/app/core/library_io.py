@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import sqlite3
+from datetime import datetime
+from app.core import database
+
+FORMAT_VERSION = 1
+
+# Unit separator: cannot appear in a tag typed into the UI
+_TAG_SEP = '\x1f'
+
+# Columns restored when a video is not in the database yet; title / analysis / tags are always updated
+_VIDEO_COLUMNS = ['video_id', 'domain', 'channel_id', 'title', 'file_path', 'thumbnail_path', 'duration',
+                  'created_at', 'analysis_result']
+
+def _is_yaml(path: str) -> bool:
+    return path.endswith(('.yaml', '.yml'))
+
+class _Writer:
+    """
+    One record per line (JSON Lines) or per document (YAML multi-document), written as it comes.
+    """
+
+    def __init__(self, f, yaml_format: bool):
+        self.f = f
+        self.dump = None
+        if yaml_format:
+            import yaml
+
+            class _Dumper(getattr(yaml, 'CSafeDumper', yaml.SafeDumper)):
+                pass
+
+            def str_presenter(dumper, data):
+                # Block style keeps multi-line analysis results editable
+                style = '|' if len(data.splitlines()) > 1 else None
+                return dumper.represent_scalar('tag:yaml.org,2002:str', data, style=style)
+            _Dumper.add_representer(str, str_presenter)
+            self.dump = lambda record: yaml.dump(record, Dumper=_Dumper, allow_unicode=True,
+                                                 sort_keys=False, explicit_start=True)
+
+    def write(self, record: dict):
+        if self.dump:
+            self.f.write(self.dump(record))
+        else:
+            self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _iter_records(f, yaml_format: bool):
+    if yaml_format:
+        import yaml
+        # load_all parses one document at a time; the libyaml loader when PyYAML was built with it
+        for doc in yaml.load_all(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+            if doc and 'type' not in doc:
+                # Older single-document exports: {'tags': [...], 'videos': [...]}
+                for tag in doc.get('tags') or []:
+                    yield {'type': 'tag', **tag}
+                for video in doc.get('videos') or []:
+                    yield {'type': 'video', **video}
+            elif doc:
+                yield doc
+        return
+    # readline rather than iteration keeps f.tell() usable for progress
+    for line in iter(f.readline, ''):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def export_library(path: str, progress=None) -> int:
+    """
+    Stream tags and videos (with their tag names) to `path` ('-' for stdout).
+    Videos come from one joined cursor, so memory does not grow with the library.
+    Returns the number of videos written.
+    """
+    conn = database.get_db_connection()
+    c = conn.cursor()
+    total = c.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+
+    to_stdout = path == '-'
+    tmp_path = None if to_stdout else path + ".tmp"
+    f = sys.stdout if to_stdout else open(tmp_path, 'w', encoding='utf-8')
+    count = 0
+    try:
+        writer = _Writer(f, _is_yaml(path))
+        writer.write({'type': 'meta', 'version': FORMAT_VERSION, 'exported_at': datetime.now().isoformat(), 'videos': total})
+        for row in c.execute('SELECT id, name FROM tags ORDER BY id'):
+            writer.write({'type': 'tag', 'id': row['id'], 'name': row['name']})
+
+        # Grouped on the primary key, so SQLite walks videos in order without a temporary table
+        c.execute(f'''
+            SELECT v.*, group_concat(t.name, '{_TAG_SEP}') AS tag_names
+            FROM videos v
+            LEFT JOIN video_tags vt ON vt.video_id = v.id
+            LEFT JOIN tags t ON t.id = vt.tag_id
+            GROUP BY v.id
+            ORDER BY v.id
+        ''')
+        for row in c:
+            record = {'type': 'video'}
+            record.update({k: row[k] for k in row.keys() if k != 'tag_names'})
+            record['tags'] = row['tag_names'].split(_TAG_SEP) if row['tag_names'] else []
+            writer.write(record)
+            count += 1
+            if progress and (count % 500 == 0 or count == total):
+                progress(count / max(total, 1), desc=f"Exported {count}/{total} videos...")
+    finally:
+        conn.close()
+        if not to_stdout:
+            f.close()
+    if tmp_path:
+        os.replace(tmp_path, path)
+    return count
+
+def _tag_id(c, tag_cache: dict, name: str) -> int:
+    tag_id = tag_cache.get(name)
+    if tag_id is None:
+        c.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (name,))
+        tag_id = c.execute('SELECT id FROM tags WHERE name = ?', (name,)).fetchone()[0]
+        tag_cache[name] = tag_id
+    return tag_id
+
+def _apply_video(c, record: dict, tag_cache: dict) -> bool:
+    uid = record.get('video_id')
+    if uid:
+        values = [record.get(col) for col in _VIDEO_COLUMNS]
+        # Upsert on the stable video uid: new rows are restored, existing ones get the editable fields
+        c.execute(f'''
+            INSERT INTO videos ({', '.join(_VIDEO_COLUMNS)})
+            VALUES ({', '.join(['?'] * len(_VIDEO_COLUMNS))})
+            ON CONFLICT(video_id) DO UPDATE SET
+                title = excluded.title,
+                analysis_result = excluded.analysis_result
+        ''', values)
+        db_id = c.execute('SELECT id FROM videos WHERE video_id = ?', (uid,)).fetchone()[0]
+    elif record.get('id'):
+        # Rows without a uid can only be matched by their database id
+        c.execute('UPDATE videos SET title = ?, analysis_result = ? WHERE id = ?',
+                  (record.get('title'), record.get('analysis_result'), record['id']))
+        if c.rowcount == 0:
+            return False
+        db_id = record['id']
+    else:
+        return False
+
+    c.execute('DELETE FROM video_tags WHERE video_id = ?', (db_id,))
+    tag_ids = {_tag_id(c, tag_cache, name.strip()) for name in record.get('tags') or [] if name and name.strip()}
+    c.executemany('INSERT OR IGNORE INTO video_tags (video_id, tag_id) VALUES (?, ?)', [(db_id, t) for t in tag_ids])
+    return True
+
+def _apply_tag(c, record: dict, tag_cache: dict):
+    # Renaming a tag id in the export renames it everywhere
+    if 'id' not in record or 'name' not in record:
+        return
+    try:
+        # Keeps the exported ids when restoring into an empty database
+        c.execute('INSERT OR IGNORE INTO tags (id, name) VALUES (?, ?)', (record['id'], record['name']))
+        c.execute('UPDATE tags SET name = ? WHERE id = ?', (record['name'], record['id']))
+        tag_cache.clear()
+    except sqlite3.IntegrityError:
+        print(f"Skipping duplicate tag name: {record['name']}")
+
+def import_library(path: str, chunk_size: int = 500, progress=None) -> dict:
+    """
+    Stream an export back in ('-' for stdin), committing every `chunk_size` records.
+    Returns {'videos': n, 'tags': n, 'skipped': n}.
+    """
+    from_stdin = path == '-'
+    f = sys.stdin if from_stdin else open(path, 'r', encoding='utf-8')
+    size = 0 if from_stdin else os.path.getsize(path)
+    conn = database.get_db_connection()
+    c = conn.cursor()
+    tag_cache = {}
+    stats = {'videos': 0, 'tags': 0, 'skipped': 0}
+    pending = 0
+    try:
+        c.execute('BEGIN')
+        for record in _iter_records(f, _is_yaml(path)):
+            kind = record.get('type')
+            if kind == 'meta':
+                if record.get('version', FORMAT_VERSION) > FORMAT_VERSION:
+                    raise ValueError(f"Unsupported export version: {record.get('version')}")
+            elif kind == 'tag':
+                _apply_tag(c, record, tag_cache)
+                stats['tags'] += 1
+            elif kind == 'video' and _apply_video(c, record, tag_cache):
+                stats['videos'] += 1
+            else:
+                stats['skipped'] += 1
+
+            pending += 1
+            if pending >= chunk_size:
+                conn.commit()
+                c.execute('BEGIN')
+                pending = 0
+                if progress:
+                    done = f.tell() / size if size and not _is_yaml(path) else 0.5
+                    progress(min(done, 0.99), desc=f"Imported {stats['videos']} videos...")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        if not from_stdin:
+            f.close()
+
+    database.delete_unused_tags()
+    if progress: progress(1.0, desc=f"Imported {stats['videos']} videos.")
+    return stats
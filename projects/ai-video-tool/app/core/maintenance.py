@@ -0,0 +1,198 @@
+import time
+import sqlite3
+import threading
+from app.core import database, utils, telemetry, concurrency
+
+# Work per slice: FTS5 leaf pages merged / free pages released per statement
+MERGE_PAGES = 256
+VACUUM_PAGES = 1024
+# Rows PRAGMA optimize / ANALYZE sample per index, so they stay fast on a large table
+ANALYSIS_LIMIT = 1000
+
+_CHECK_INTERVAL = 60.0
+
+# Operations that do not count as activity: maintenance itself, reads (the UI's polling timers and
+# background workers; reads from user requests are seen through concurrency.idle_seconds instead)
+# and the download workers looking for new jobs
+PASSIVE_OPS = ('maintenance.', 'db.get_', 'db.count_', 'db.claim_next_download_job')
+
+_run_lock = threading.Lock()
+_scheduler_lock = threading.Lock()
+_scheduler = None
+
+def get_maintenance_settings():
+    """
+    Returns (write threshold, max hours between runs, idle seconds required, time budget per run in seconds).
+    """
+    config = utils.load_config()
+    return (
+        int(config.get("maintenance_write_threshold", 200000)),
+        float(config.get("maintenance_interval_hours", 24)),
+        float(config.get("maintenance_idle_seconds", 300)),
+        float(config.get("maintenance_budget_seconds", 60)),
+    )
+
+def get_index_sizes(conn, detailed: bool = True) -> dict:
+    """
+    Bytes per table / index, FTS5 shadow tables summed under the FTS table name,
+    plus '(free)' and '(total)'. Per-object sizes need SQLite's dbstat table.
+    detailed=False returns only '(free)' and '(total)': dbstat reads every page of the file
+    under one shared lock, which blocks writers for the whole scan on a large library.
+    """
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    sizes = {}
+    if detailed:
+        try:
+            for name, size in conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'):
+                if name.startswith('subtitles_fts_'):
+                    name = 'subtitles_fts'
+                sizes[name] = sizes.get(name, 0) + size
+        except sqlite3.OperationalError:
+            pass # dbstat not compiled in
+    sizes['(free)'] = conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size
+    sizes['(total)'] = conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+    return sizes
+
+def _idle_seconds() -> float:
+    # Writes and media work from telemetry; UI requests (including plain gallery and search reads) from concurrency
+    return min(telemetry.idle_seconds(PASSIVE_OPS), concurrency.idle_seconds(ignore=('maintenance',)))
+
+def _busy(started_at: float) -> bool:
+    # Something other than maintenance ran since we started, or a UI request is in progress
+    return _idle_seconds() < time.time() - started_at
+
+def _merge_fts(conn, deadline: float, yield_when_busy: bool, started_at: float) -> dict:
+    slices = 0
+    while True:
+        before = conn.total_changes
+        # Negative N: merge across levels too, i.e. an 'optimize' done N pages at a time
+        conn.execute("INSERT INTO subtitles_fts(subtitles_fts, rank) VALUES('merge', ?)", (-MERGE_PAGES,))
+        slices += 1
+        # Fewer than two changes: nothing was left to merge
+        if conn.total_changes - before < 2:
+            return {'slices': slices, 'complete': True}
+        if time.time() >= deadline or (yield_when_busy and _busy(started_at)):
+            return {'slices': slices, 'complete': False}
+
+def _incremental_vacuum(conn, deadline: float, yield_when_busy: bool, started_at: float) -> dict:
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode != 2:
+        # NONE / FULL: converting needs a one-off full VACUUM (run_maintenance(full=True))
+        return {'mode': mode, 'slices': 0, 'complete': conn.execute('PRAGMA freelist_count').fetchone()[0] == 0}
+    slices = 0
+    while conn.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+        # execute() steps a statement only once, which frees a single page; executescript runs it to the end
+        conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_PAGES});')
+        slices += 1
+        if time.time() >= deadline or (yield_when_busy and _busy(started_at)):
+            return {'mode': mode, 'slices': slices, 'complete': False}
+    return {'mode': mode, 'slices': slices, 'complete': True}
+
+def run_maintenance(budget_seconds: float = None, full: bool = False, yield_when_busy: bool = False, progress=None) -> dict:
+    """
+    FTS5 merge, PRAGMA optimize and incremental vacuum in short slices (each its own transaction,
+    so searches interleave) until done or `budget_seconds` run out.
+    full=True also runs FTS5 'optimize' and, if the file is not in incremental auto-vacuum mode yet,
+    a full VACUUM to convert it. Both block writers for their whole duration.
+    Returns a report with index sizes before and after.
+    """
+    if not _run_lock.acquire(blocking=False):
+        return {'skipped': 'maintenance already running'}
+    try:
+        budget = budget_seconds if budget_seconds is not None else get_maintenance_settings()[3]
+        started_at = time.time()
+        deadline = started_at + budget
+        writes = database.get_maintenance_state().get('writes_since_maintenance', 0)
+
+        conn = database.get_db_connection()
+        # Autocommit: every slice commits on its own
+        conn.isolation_level = None
+        report = {'writes': writes}
+        # Per-object sizes only for runs someone asked for; scheduled runs stay within their time slices
+        detailed = not yield_when_busy
+        try:
+            report['before'] = get_index_sizes(conn, detailed)
+
+            if progress: progress(0.1, desc="Merging FTS index segments...")
+            with telemetry.timed("maintenance.fts_merge"):
+                report['fts_merge'] = _merge_fts(conn, deadline, yield_when_busy, started_at)
+            if full:
+                with telemetry.timed("maintenance.fts_optimize"):
+                    conn.execute("INSERT INTO subtitles_fts(subtitles_fts) VALUES('optimize')")
+                report['fts_merge']['complete'] = True
+
+            if progress: progress(0.5, desc="Updating query planner statistics...")
+            with telemetry.timed("maintenance.optimize"):
+                conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}').fetchall()
+                if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                    conn.execute('ANALYZE')
+                conn.execute('PRAGMA optimize').fetchall()
+
+            if progress: progress(0.7, desc="Releasing free pages...")
+            with telemetry.timed("maintenance.vacuum"):
+                if full and conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    conn.execute('VACUUM')
+                report['vacuum'] = _incremental_vacuum(conn, deadline, yield_when_busy, started_at)
+
+            report['after'] = get_index_sizes(conn, detailed)
+        finally:
+            conn.close()
+
+        report['seconds'] = round(time.time() - started_at, 2)
+        # Without incremental auto-vacuum there is nothing to continue; format_report suggests --full instead
+        report['complete'] = report['fts_merge']['complete'] and (report['vacuum']['complete'] or report['vacuum']['mode'] != 2)
+        # An unfinished merge keeps the write count, so the next idle period continues it
+        database.finish_maintenance(writes if report['fts_merge']['complete'] else 0, time.time())
+        telemetry.record("maintenance.run", report['seconds'], f"complete={report['complete']}")
+        if progress: progress(1.0, desc="Maintenance complete.")
+        print(f"Database maintenance: {format_report(report)}")
+        return report
+    finally:
+        _run_lock.release()
+
+def format_report(report: dict) -> str:
+    if 'skipped' in report:
+        return f"Skipped: {report['skipped']}"
+    mb = lambda n: f"{n / 1e6:.1f} MB"
+    lines = [f"{report['seconds']}s, {int(report['writes'])} subtitle rows written since last run, "
+             f"{'complete' if report['complete'] else 'time budget reached (continues next run)'}"]
+    for name in sorted(report['after'], key=lambda n: -report['after'][n]):
+        before = report['before'].get(name, 0)
+        if max(before, report['after'][name]) < 50000 and not name.startswith('('):
+            continue
+        lines.append(f"  {name}: {mb(before)} -> {mb(report['after'][name])}")
+    if report['vacuum']['mode'] != 2 and report['after']['(free)'] > 0:
+        lines.append("  Free pages are only returned after a full VACUUM (run with full=True / --full).")
+    return "\n".join(lines)
+
+def is_due() -> bool:
+    threshold, interval_hours, _, _ = get_maintenance_settings()
+    state = database.get_maintenance_state()
+    writes = state.get('writes_since_maintenance', 0)
+    last = state.get('last_maintenance', 0)
+    return writes >= threshold or (writes > 0 and time.time() - last >= interval_hours * 3600)
+
+def _scheduler_loop():
+    while True:
+        time.sleep(_CHECK_INTERVAL)
+        try:
+            idle_required = get_maintenance_settings()[2]
+            if _idle_seconds() >= idle_required and is_due():
+                run_maintenance(yield_when_busy=True)
+        except Exception as e:
+            print(f"Database maintenance failed: {e}")
+
+def start_scheduler() -> bool:
+    """
+    Run maintenance in the background when it is due and the app has been idle for a while.
+    Disabled with "maintenance_enabled": false in config.json.
+    """
+    global _scheduler
+    if not utils.load_config().get("maintenance_enabled", True):
+        return False
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_scheduler_loop, name="db-maintenance", daemon=True)
+            _scheduler.start()
+    return True
@@ -0,0 +1,72 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.core import preview_cache, utils
+
+def get_prefetch_settings():
+    """
+    Returns (top_n, workers). Workers are derived from a CPU budget
+    so prefetching never competes with interactive work for every core.
+    """
+    config = utils.load_config()
+    top_n = int(config.get("prefetch_top_n", 5))
+    cpu_fraction = float(config.get("prefetch_cpu_fraction", 0.25))
+    workers = max(1, int((os.cpu_count() or 1) * cpu_fraction))
+    return top_n, workers
+
+class Prefetcher:
+    """
+    Pre-renders previews for the first rows of a result set.
+    Submitting a new result set cancels everything still pending from the previous one.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.generation = 0
+        self.futures = []
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _get_executor(self, workers: int) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"prefetch-{self.name}")
+        return self.executor
+
+    def submit(self, clips):
+        """
+        clips: List of (video_path, start, end) in display order.
+        """
+        top_n, workers = get_prefetch_settings()
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            for f in self.futures:
+                f.cancel() # No-op for jobs already rendering; they finish into the cache
+            executor = self._get_executor(workers)
+            self.futures = [
+                executor.submit(self._render, generation, path, start, end)
+                for path, start, end in clips[:top_n]
+                if path and os.path.exists(path)
+            ]
+        return len(self.futures)
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            for f in self.futures:
+                f.cancel()
+            self.futures = []
+
+    def _render(self, generation, path, start, end):
+        if generation != self.generation:
+            return None # Result set changed while this job was queued
+        try:
+            if preview_cache.lookup(path, start, end):
+                return None
+            return preview_cache.get_preview(path, start, end)
+        except Exception as e:
+            print(f"Prefetch ({self.name}) failed for {path} [{start}-{end}]: {e}")
+            return None
+
+search_prefetcher = Prefetcher("search")
+highlight_prefetcher = Prefetcher("highlights")
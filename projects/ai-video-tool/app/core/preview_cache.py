@@ -0,0 +1,111 @@
+import os
+import hashlib
+import threading
+import uuid
+from app.core import editor, utils
+
+CACHE_DIR = os.path.join("temp", "previews")
+
+# Preview profiles: name -> create_montage kwargs
+PROFILES = {
+    'fast': {'fast_preview': True},
+}
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+_evict_lock = threading.Lock()
+
+def get_budget_bytes() -> int:
+    config = utils.load_config()
+    return int(config.get("preview_cache_mb", 2048)) * 1024 * 1024
+
+def make_key(video_path: str, start: float, end: float, profile: str = 'fast') -> str:
+    """
+    Content address of a preview: source identity (path, size, mtime) + range + profile.
+    Editing the source or the range always produces a new key.
+    """
+    st = os.stat(video_path)
+    ident = f"{os.path.realpath(video_path)}|{st.st_size}|{st.st_mtime_ns}|{float(start):.3f}|{float(end):.3f}|{profile}"
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+def _lock_for(key: str) -> threading.Lock:
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+def lookup(video_path: str, start: float, end: float, profile: str = 'fast'):
+    """
+    Cached preview path or None. Does not render.
+    """
+    path = os.path.join(CACHE_DIR, make_key(video_path, start, end, profile) + ".mp4")
+    if os.path.exists(path):
+        os.utime(path) # Mark as recently used for LRU
+        return path
+    return None
+
+def get_preview(video_path: str, start: float, end: float, profile: str = 'fast', progress=None) -> str:
+    """
+    Return a preview clip, rendering it on a cache miss.
+    Concurrent requests for the same clip wait for one render instead of racing.
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(video_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    key = make_key(video_path, start, end, profile)
+    final_path = os.path.join(CACHE_DIR, f"{key}.mp4")
+
+    with _lock_for(key):
+        if os.path.exists(final_path):
+            os.utime(final_path)
+            return final_path
+
+        # Render under a unique name, then publish atomically: readers never see a partial file
+        tmp_path = os.path.join(CACHE_DIR, f"{key}.{uuid.uuid4().hex}.tmp.mp4")
+        clips = [{'video_path': video_path, 'start': start, 'end': end}]
+        try:
+            editor.create_montage(clips, output_path=tmp_path, progress=progress, **PROFILES[profile])
+            os.replace(tmp_path, final_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    evict()
+    return final_path
+
+def evict(budget_bytes: int = None):
+    """
+    Delete least recently used previews until the cache fits in the disk budget.
+    """
+    if budget_bytes is None:
+        budget_bytes = get_budget_bytes()
+    if not os.path.exists(CACHE_DIR):
+        return 0
+
+    with _evict_lock:
+        entries = []
+        total = 0
+        for name in os.listdir(CACHE_DIR):
+            if name.endswith(".tmp.mp4"):
+                continue # In-flight render
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= budget_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                print(f"Failed to evict preview {path}: {e}")
+        return removed
@@ -0,0 +1,66 @@
+import os
+import ffmpeg
+from app.core import database, utils, telemetry
+
+def get_proxy_height() -> int:
+    config = utils.load_config()
+    return int(config.get("proxy_height", 480))
+
+def get_proxy_file_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + ".proxy.mp4"
+
+def generate_proxy(db_id: int, force: bool = False) -> str:
+    """
+    Encode a low-bitrate, short-GOP proxy of the video for previews and playback.
+    Keyframes every second keep seeking and stream-copy previews accurate.
+    """
+    video = database.get_video_by_id(db_id)
+    if not video or not video.get('file_path') or not os.path.exists(video['file_path']):
+        raise ValueError("Video file not found")
+
+    source = video['file_path']
+    proxy_path = get_proxy_file_path(source)
+    if not force and os.path.exists(proxy_path) and os.path.getmtime(proxy_path) >= os.path.getmtime(source):
+        database.update_video_proxy(db_id, os.path.abspath(proxy_path))
+        return proxy_path
+
+    # No .mp4 extension, so scans never mistake an unfinished proxy for a video
+    tmp_path = os.path.splitext(source)[0] + ".proxy.tmp"
+    inp = ffmpeg.input(source)
+    v = inp.video
+    # Downscale only; never upscale small sources
+    height = get_proxy_height()
+    streams = ffmpeg.probe(source)['streams']
+    src_height = next((st.get('height') for st in streams if st['codec_type'] == 'video'), None)
+    if src_height is None or src_height > height:
+        v = v.filter('scale', -2, height)
+    kwargs = dict(
+        vcodec='libx264', preset='veryfast', crf=28, pix_fmt='yuv420p',
+        force_key_frames='expr:gte(t,n_forced*1)',
+        movflags='+faststart', f='mp4'
+    )
+    if any(st['codec_type'] == 'audio' for st in streams):
+        out = ffmpeg.output(v, inp.audio, tmp_path, acodec='aac', audio_bitrate='96k', **kwargs)
+    else:
+        out = ffmpeg.output(v, tmp_path, **kwargs)
+    try:
+        with telemetry.timed("ffmpeg.proxy", source):
+            out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        print(e.stderr.decode('utf-8', errors='ignore'))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError("FFmpeg proxy generation failed.")
+    os.replace(tmp_path, proxy_path)
+
+    database.update_video_proxy(db_id, os.path.abspath(proxy_path))
+    return proxy_path
+
+def get_playback_path(video: dict) -> str:
+    """
+    Proxy if one exists, otherwise the original file.
+    """
+    proxy_path = video.get('proxy_path')
+    if proxy_path and os.path.exists(proxy_path):
+        return proxy_path
+    return video.get('file_path')
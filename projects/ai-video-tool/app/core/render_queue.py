@@ -0,0 +1,160 @@
+import os
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.core import database, editor, utils
+
+# Minimum interval between progress writes to the DB (seconds)
+PROGRESS_WRITE_INTERVAL = 1.0
+# HLS segments of finished jobs whose page went away are swept after this long (seconds)
+HLS_TTL_SECONDS = 600
+
+_executor = None
+_lock = threading.Lock()
+_cancel_events = {} # job_id -> threading.Event
+
+def get_concurrency() -> int:
+    config = utils.load_config()
+    default = max(1, (os.cpu_count() or 2) // 4)
+    return max(1, int(config.get("render_concurrency", default)))
+
+def start():
+    """
+    Create the executor and resubmit jobs that were queued or interrupted by a restart (idempotent).
+    """
+    global _executor
+    with _lock:
+        if _executor is not None:
+            return
+        _executor = ThreadPoolExecutor(max_workers=get_concurrency(), thread_name_prefix="render")
+
+    resumed = database.requeue_interrupted_render_jobs()
+    if resumed:
+        print(f"Restarting {resumed} interrupted render jobs.")
+    # Nothing from a previous process is still streaming
+    _sweep_hls_dirs(max_age=0)
+    for job in database.get_render_jobs(limit=1000, status='queued'):
+        _submit_existing(job['id'])
+
+def _submit_existing(job_id: int):
+    _cancel_events[job_id] = threading.Event()
+    _executor.submit(_run_job, job_id)
+
+def get_hls_dir(job_id: int) -> str:
+    return os.path.join("temp", "hls", f"job_{job_id}")
+
+def release_hls_dir(job_id: int):
+    """
+    Delete a job's HLS segments. Called by the page streaming them once it has sent the last one;
+    the worker leaves them in place when the job ends so that page can still read the final segments.
+    """
+    shutil.rmtree(get_hls_dir(job_id), ignore_errors=True)
+
+def _sweep_hls_dirs(max_age: float = HLS_TTL_SECONDS):
+    """
+    Remove segment directories of jobs that are no longer rendering and were not touched for
+    `max_age` seconds (their page was closed before it could release them).
+    """
+    root = os.path.join("temp", "hls")
+    if not os.path.isdir(root):
+        return
+    now = time.time()
+    for name in os.listdir(root):
+        if not name.startswith("job_") or not name[4:].isdigit():
+            continue
+        path = os.path.join(root, name)
+        try:
+            if now - os.path.getmtime(path) < max_age:
+                continue
+        except OSError:
+            continue
+        job = database.get_render_job(int(name[4:]))
+        if not job or job['status'] not in ('queued', 'running'):
+            shutil.rmtree(path, ignore_errors=True)
+
+def submit(clips, name: str, mode: str = 'encode', progressive: bool = False) -> int:
+    """
+    Queue a montage export. clips: List of dicts {'video_path', 'start', 'end'}.
+    The output is written to the download directory as `name`.
+    progressive: Also write HLS segments to get_hls_dir(job_id) while rendering.
+    """
+    start()
+    job_id = database.add_render_job(name, json.dumps(clips, ensure_ascii=False), mode, progressive=progressive)
+    _submit_existing(job_id)
+    return job_id
+
+def cancel(job_id: int) -> bool:
+    job = database.get_render_job(job_id)
+    if not job or job['status'] not in ('queued', 'running'):
+        return False
+    event = _cancel_events.get(job_id)
+    if event:
+        event.set()
+    if job['status'] == 'queued':
+        database.update_render_job(job_id, status='cancelled', message='Cancelled')
+    return True
+
+def list_jobs(limit: int = 100):
+    return database.get_render_jobs(limit=limit)
+
+def _run_job(job_id: int):
+    cancel_event = _cancel_events.get(job_id) or threading.Event()
+    job = database.get_render_job(job_id)
+    if not job or job['status'] != 'queued' or cancel_event.is_set():
+        _cancel_events.pop(job_id, None)
+        return
+    # Segments left by an interrupted run would be served ahead of the new ones
+    release_hls_dir(job_id)
+    _sweep_hls_dirs()
+
+    database.update_render_job(job_id, status='running', progress=0, message='Rendering...')
+    last_write = [0.0]
+
+    def on_stats(stats):
+        now = time.monotonic()
+        if now - last_write[0] < PROGRESS_WRITE_INTERVAL:
+            return
+        last_write[0] = now
+        database.update_render_job(
+            job_id, progress=stats['fraction'], fps=stats['fps'], speed=stats['speed'], eta=stats['eta']
+        )
+
+    try:
+        clips = json.loads(job['clips_json'])
+        output_path = editor.create_montage(
+            clips, output_filename=job['name'], mode=job['mode'],
+            cancel_event=cancel_event, stats_callback=on_stats,
+            hls_dir=get_hls_dir(job_id) if job['progressive'] else None
+        )
+        database.update_render_job(
+            job_id, status='done', progress=1.0, eta=0, message='Done',
+            output_path=os.path.abspath(output_path)
+        )
+    except editor.RenderCancelled:
+        database.update_render_job(job_id, status='cancelled', message='Cancelled')
+    except Exception as e:
+        print(f"Render job {job_id} failed: {e}")
+        database.update_render_job(job_id, status='failed', message=str(e))
+    finally:
+        _cancel_events.pop(job_id, None)
+
+def wait(job_id: int, progress=None, poll_interval: float = 1.0):
+    """
+    Block until the job finishes, mirroring its progress onto `progress`. Returns the final job row.
+    """
+    while True:
+        job = database.get_render_job(job_id)
+        if not job or job['status'] not in ('queued', 'running'):
+            return job
+        if progress:
+            desc = f"Render job {job_id}: {job['status']}"
+            if job['fps']:
+                desc += f" | {job['fps']:.0f} fps"
+            if job['speed']:
+                desc += f" | {job['speed']:.2f}x"
+            if job['eta'] is not None and job['status'] == 'running':
+                desc += f" | ETA {editor.format_eta(job['eta'])}"
+            progress(job['progress'] or 0, desc=desc)
+        time.sleep(poll_interval)
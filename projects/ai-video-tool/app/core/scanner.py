@@ -1,7 +1,7 @@
 import os
 import glob
 from pathlib import Path
-from app.core import database, utils
+from app.core import database, utils, chat, ingest
 import yt_dlp
 
 def scan_and_import_videos(progress=None):
@@ -18,7 +18,7 @@ def scan_and_import_videos(progress=None):
 
     for root, dirs, files in os.walk(base_dir):
         for file in files:
-            if file.endswith(".mp4"):
+            if file.endswith(".mp4") and not file.endswith(".proxy.mp4"):
                 file_path = os.path.join(root, file)
                 
                 parts = Path(file_path).parts
@@ -100,6 +100,10 @@ def scan_and_import_videos(progress=None):
                 
                 if db_id:
                     imported_count += 1
+                    # Gallery thumbnail (extracted from the video if there is none), low-res proxy and waveform peaks, built in the background
+                    ingest.submit_thumbnail(db_id, root, video_id)
+                    ingest.submit_proxy(db_id)
+                    ingest.submit_waveform(db_id)
                     # Import subtitles
                     vtt_files = glob.glob(os.path.join(root, "*.vtt"))
                     for vtt in vtt_files:
@@ -109,5 +113,12 @@ def scan_and_import_videos(progress=None):
                                 database.add_subtitles(db_id, segments)
                         except:
                             pass
+                    # Import legacy chat dump
+                    comments_file = os.path.join(root, "comments.json")
+                    if os.path.exists(comments_file):
+                        try:
+                            chat.import_comments_json(db_id, comments_file)
+                        except Exception as e:
+                            errors.append(f"Chat import error for {video_id}: {str(e)}")
 
     return f"Scan complete. Found {found_count} videos, Imported {imported_count} new videos."
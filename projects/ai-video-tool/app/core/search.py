@@ -0,0 +1,134 @@
+import sqlite3
+import time
+import threading
+from collections import OrderedDict
+from app.core import database, utils, telemetry
+
+# Sessions kept at once (one per browser tab); the least recently used is dropped
+MAX_SESSIONS = 256
+# Queries remembered per session for prefix reuse
+MAX_CACHED_QUERIES = 64
+
+def get_search_settings():
+    """
+    Returns (page size, min query length, id cap per query).
+    """
+    config = utils.load_config()
+    return (
+        int(config.get("search_page_size", 50)),
+        int(config.get("search_min_chars", 2)),
+        int(config.get("search_prefix_cache_ids", 2000)),
+    )
+
+def build_match_expr(query: str) -> str:
+    """
+    FTS5 expression for search-as-you-type: every word quoted, the last one as a prefix
+    unless the user already typed a space after it.
+    """
+    tokens = ['"' + t.replace('"', '""') + '"' for t in query.split()]
+    if tokens and not query[-1].isspace():
+        tokens[-1] += '*'
+    return ' '.join(tokens)
+
+class SearchSession:
+    """
+    Incremental search state of one UI session.
+    A newer query interrupts the SQLite statement of an older one, and the complete
+    id lists of earlier (shorter) queries narrow down the longer ones typed after them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.conn = None
+        self.cache = OrderedDict() # query -> {'ids': [...], 'complete': bool}
+
+    def begin(self) -> int:
+        with self.lock:
+            self.generation += 1
+            if self.conn is not None:
+                self.conn.interrupt()
+            return self.generation
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self.generation
+
+    def _cached_prefix(self, query: str):
+        # Longest earlier query whose complete result set must contain this one's
+        best = None
+        for prev, entry in self.cache.items():
+            if entry['complete'] and query.startswith(prev) and (best is None or len(prev) > len(best[0])):
+                best = (prev, entry)
+        return best[1] if best else None
+
+    def _ids_for(self, conn, query: str, cap: int) -> dict:
+        entry = self.cache.get(query)
+        if entry is not None:
+            self.cache.move_to_end(query)
+            return entry
+
+        expr = build_match_expr(query)
+        prefix_entry = self._cached_prefix(query)
+        if prefix_entry is not None:
+            ids = database.search_subtitle_ids(conn, expr, cap + 1, candidate_ids=prefix_entry['ids'])
+        else:
+            ids = database.search_subtitle_ids(conn, expr, cap + 1)
+        entry = {'ids': ids[:cap], 'complete': len(ids) <= cap}
+
+        self.cache[query] = entry
+        while len(self.cache) > MAX_CACHED_QUERIES:
+            self.cache.popitem(last=False)
+        return entry
+
+    def get_page(self, generation: int, query: str, page: int = 0):
+        """
+        Returns (rows, has_more), or None if a newer query superseded this one.
+        """
+        page_size, _, cap = get_search_settings()
+        started = time.perf_counter()
+        conn = database.get_db_connection()
+        with self.lock:
+            if generation != self.generation:
+                conn.close()
+                return None
+            self.conn = conn
+        try:
+            entry = self._ids_for(conn, query, cap)
+            start = page * page_size
+            ids = entry['ids']
+            if entry['complete'] or start + page_size <= len(ids):
+                page_ids = ids[start:start + page_size]
+                has_more = start + page_size < len(ids) or not entry['complete']
+            else:
+                # Past the cached ids of a very common query: page straight from the index
+                page_ids = database.search_subtitle_ids(conn, build_match_expr(query), page_size + 1, offset=start)
+                has_more = len(page_ids) > page_size
+                page_ids = page_ids[:page_size]
+            rows = database.get_search_rows(conn, page_ids)
+            telemetry.record("search.page", time.perf_counter() - started, query)
+            return rows, has_more
+        except sqlite3.OperationalError as e:
+            if 'interrupt' in str(e):
+                telemetry.record("search.interrupted", time.perf_counter() - started, query)
+                return None
+            print(f"Search error: {e}")
+            return [], False
+        finally:
+            with self.lock:
+                if self.conn is conn:
+                    self.conn = None
+            conn.close()
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def get_session(session_id: str) -> SearchSession:
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            session = _sessions[session_id] = SearchSession()
+            while len(_sessions) > MAX_SESSIONS:
+                _sessions.popitem(last=False)
+        else:
+            _sessions.move_to_end(session_id)
+        return session
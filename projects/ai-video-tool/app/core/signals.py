@@ -0,0 +1,231 @@
+import os
+import re
+import ffmpeg
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.core import database
+
+SIGNALS_FILENAME = "signals.npz"
+
+# ebur128 reports momentary loudness every 100ms
+LOUDNESS_HOP = 0.1
+
+# Scene score threshold for the `select` filter (0.0 - 1.0)
+SCENE_THRESHOLD = 0.4
+
+_EBUR128_PATTERN = re.compile(r't:\s*([\d.]+)\s+TARGET:.*?M:\s*(-?[\d.]+|-inf|nan)')
+_SHOWINFO_PATTERN = re.compile(r'pts_time:\s*([\d.]+)')
+
+def get_signals_path(video_path: str) -> str:
+    return os.path.join(os.path.dirname(video_path), SIGNALS_FILENAME)
+
+def extract_loudness(video_path: str) -> np.ndarray:
+    """
+    Momentary loudness (LUFS) sampled every LOUDNESS_HOP seconds.
+    """
+    out = (
+        ffmpeg
+        .input(video_path)
+        .output('-', format='null', vn=None, af='ebur128')
+    )
+    try:
+        _, stderr = out.run(capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        print(e.stderr.decode('utf-8', errors='ignore'))
+        raise RuntimeError("FFmpeg loudness analysis failed.")
+
+    values = []
+    for match in _EBUR128_PATTERN.finditer(stderr.decode('utf-8', errors='ignore')):
+        try:
+            values.append(float(match.group(2)))
+        except ValueError:
+            values.append(-120.0)
+
+    loudness = np.asarray(values, dtype=np.float32)
+    # Silence is reported as -inf / very low values; clamp so statistics stay sane
+    return np.nan_to_num(np.clip(loudness, -70.0, 0.0), nan=-70.0)
+
+def extract_scene_changes(video_path: str, threshold: float = SCENE_THRESHOLD) -> np.ndarray:
+    """
+    Timestamps (seconds) where the `select` scene score exceeds threshold.
+    Frames are downscaled first since scene detection does not need full resolution.
+    """
+    v = ffmpeg.input(video_path).video
+    v = v.filter('scale', 160, -2)
+    v = v.filter('select', f'gt(scene,{threshold})')
+    v = v.filter('showinfo')
+    out = ffmpeg.output(v, '-', format='null')
+    try:
+        _, stderr = out.run(capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        print(e.stderr.decode('utf-8', errors='ignore'))
+        raise RuntimeError("FFmpeg scene detection failed.")
+
+    times = [float(m.group(1)) for m in _SHOWINFO_PATTERN.finditer(stderr.decode('utf-8', errors='ignore'))]
+    return np.asarray(times, dtype=np.float32)
+
+def extract_signals(video_path: str, force: bool = False) -> str:
+    """
+    Extract loudness and scene-change arrays for one video and store them next to it.
+    Returns the path of the .npz file. Skips work if an up-to-date file exists.
+    """
+    signals_path = get_signals_path(video_path)
+    if not force and os.path.exists(signals_path):
+        if os.path.getmtime(signals_path) >= os.path.getmtime(video_path):
+            return signals_path
+
+    loudness = extract_loudness(video_path)
+    scenes = extract_scene_changes(video_path)
+
+    # Write to a temp name first so a crash never leaves a truncated file behind
+    tmp_path = signals_path + ".tmp.npz"
+    np.savez_compressed(tmp_path, loudness=loudness, scenes=scenes, hop=np.float32(LOUDNESS_HOP))
+    os.replace(tmp_path, signals_path)
+    return signals_path
+
+def load_signals(video_path: str):
+    """
+    Returns (loudness, scenes, hop) or None if the video has not been analyzed yet.
+    """
+    signals_path = get_signals_path(video_path)
+    if not os.path.exists(signals_path):
+        return None
+    with np.load(signals_path) as data:
+        return data['loudness'], data['scenes'], float(data['hop'])
+
+def _zscore(x: np.ndarray) -> np.ndarray:
+    std = x.std()
+    if std == 0:
+        return np.zeros_like(x)
+    return (x - x.mean()) / std
+
+def _smooth(x: np.ndarray, window: int) -> np.ndarray:
+    if window <= 1 or len(x) < window:
+        return x
+    kernel = np.ones(window, dtype=np.float32) / window
+    # Pad with edge values; zero padding would read as "loud" on a LUFS (negative) scale
+    left = (window - 1) // 2
+    padded = np.pad(x, (left, window - 1 - left), mode='edge')
+    return np.convolve(padded, kernel, mode='valid')
+
+def find_highlight_candidates(loudness: np.ndarray, scenes: np.ndarray, hop: float = LOUDNESS_HOP,
+                              clip_length: float = 180.0, min_distance: float = None,
+                              scene_weight: float = 0.5, max_candidates: int = 10):
+    """
+    Rank highlight candidates from the loudness curve and scene-change density.
+    Returns a list of dicts shaped like AI highlights:
+    [{'start_time': 100.0, 'end_time': 280.0, 'score': 90, 'description': '...'}, ...]
+    """
+    n = len(loudness)
+    if n < 3:
+        return []
+
+    if min_distance is None:
+        min_distance = clip_length
+
+    # 1. Loudness energy, smoothed over ~5 seconds
+    smooth_window = max(1, int(5.0 / hop))
+    energy = _zscore(_smooth(loudness.astype(np.float32), smooth_window))
+
+    # 2. Scene-change density on the same time grid
+    bins = np.clip((scenes / hop).astype(np.int64), 0, n - 1)
+    density = np.bincount(bins, minlength=n).astype(np.float32)
+    density = _zscore(_smooth(density, max(1, int(30.0 / hop))))
+
+    score = energy + scene_weight * density
+
+    # 3. Local maxima that dominate a min_distance-wide neighbourhood
+    radius = max(1, int(min_distance / 2 / hop))
+    padded = np.pad(score, radius, mode='constant', constant_values=-np.inf)
+    window_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1).max(axis=1)
+    is_peak = (score == window_max) & (score > 0)
+    peak_idx = np.flatnonzero(is_peak)
+    if len(peak_idx) == 0:
+        return []
+
+    # Plateaus produce runs of equal maxima; keep the first of each run
+    keep = np.concatenate(([True], np.diff(peak_idx) > radius))
+    peak_idx = peak_idx[keep]
+
+    order = np.argsort(score[peak_idx])[::-1][:max_candidates]
+    peak_idx = peak_idx[order]
+    peak_scores = score[peak_idx]
+
+    duration = n * hop
+    peak_times = peak_idx * hop
+    # Centre slightly after the peak (40% of the clip before it, 60% after): reactions usually follow the build-up
+    starts = np.clip(peak_times - clip_length * 0.4, 0, None)
+    ends = np.clip(starts + clip_length, None, duration)
+
+    top = peak_scores.max()
+    normalized = np.round(100 * peak_scores / top) if top > 0 else np.zeros_like(peak_scores)
+
+    candidates = []
+    for s, e, sc, t in zip(starts, ends, normalized, peak_times):
+        candidates.append({
+            'start_time': float(round(s, 1)),
+            'end_time': float(round(e, 1)),
+            'score': int(sc),
+            'description': f"音量・シーン変化のピーク ({int(t)}秒付近)"
+        })
+    return candidates
+
+def get_highlight_candidates(video_db_id: int, **kwargs):
+    """
+    Candidates for a video in the DB, extracting signals first if needed.
+    """
+    video = database.get_video_by_id(video_db_id)
+    if not video or not video.get('file_path') or not os.path.exists(video['file_path']):
+        raise ValueError("Video file not found.")
+
+    extract_signals(video['file_path'])
+    loudness, scenes, hop = load_signals(video['file_path'])
+    return find_highlight_candidates(loudness, scenes, hop=hop, **kwargs)
+
+def _extract_worker(video_path: str, force: bool = False):
+    # Top-level so it can be pickled by ProcessPoolExecutor
+    return extract_signals(video_path, force=force)
+
+def score_library(video_ids=None, max_workers: int = None, force: bool = False, progress=None):
+    """
+    Extract signals for many videos in a process pool (CPU only).
+    video_ids: list of DB ids, or None for the whole library.
+    """
+    if video_ids is None:
+        videos = database.get_all_videos()
+    else:
+        videos = [database.get_video_by_id(v) for v in video_ids]
+
+    paths = []
+    for v in videos:
+        path = v.get('file_path') if v else None
+        if not path or not os.path.exists(path):
+            continue
+        if not force and load_signals(path) is not None and \
+                os.path.getmtime(get_signals_path(path)) >= os.path.getmtime(path):
+            continue
+        paths.append(path)
+
+    if not paths:
+        return "All videos are already scored."
+
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) // 2)
+
+    done = 0
+    errors = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_extract_worker, p, force): p for p in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(f"{os.path.basename(path)}: {e}")
+            done += 1
+            if progress: progress(done / len(paths), desc=f"Scoring {done}/{len(paths)}...")
+
+    msg = f"Scored {done - len(errors)}/{len(paths)} videos."
+    if errors:
+        msg += " Errors: " + "; ".join(errors)
+    return msg
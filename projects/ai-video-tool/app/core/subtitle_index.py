@@ -0,0 +1,151 @@
+import os
+import threading
+import numpy as np
+from app.core import database
+
+INDEX_DIR = os.path.join("data", "subtitle_index")
+
+# One record per subtitle row, sorted by start. max_end is the running maximum of end,
+# which keeps interval queries a bisection even when captions overlap.
+SEGMENT_DTYPE = np.dtype([('start', '<f8'), ('end', '<f8'), ('max_end', '<f8'), ('id', '<i8')])
+
+# In-memory cache: video_id -> (mtime_ns, segments, boundaries)
+_cache = {}
+_cache_lock = threading.Lock()
+_build_lock = threading.Lock()
+# Videos whose outdated index could not be deleted (still mapped elsewhere, on Windows)
+_stale = set()
+
+def _paths(video_id: int):
+    base = os.path.join(INDEX_DIR, str(int(video_id)))
+    return base + ".segments.npy", base + ".bounds.npy"
+
+def _compute(video_id: int):
+    rows = database.get_subtitle_times(video_id)
+    segments = np.zeros(len(rows), dtype=SEGMENT_DTYPE)
+    if rows:
+        arr = np.asarray(rows, dtype=np.float64)
+        segments['id'] = arr[:, 0].astype(np.int64)
+        segments['start'] = arr[:, 1]
+        segments['end'] = np.maximum(arr[:, 1], arr[:, 2])
+        segments['max_end'] = np.maximum.accumulate(segments['end'])
+    boundaries = np.unique(np.concatenate([segments['start'], segments['end']]))
+    return segments, boundaries
+
+def build_index(video_id: int):
+    """
+    Pack start/end times (no text) into the on-disk index.
+    """
+    segments, boundaries = _compute(video_id)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    seg_path, bounds_path = _paths(video_id)
+    for path, arr in ((bounds_path, boundaries), (seg_path, segments)):
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, arr)
+        os.replace(tmp_path, path)
+
+def _remove_files(video_id: int) -> bool:
+    removed = True
+    for path in _paths(video_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            removed = False
+    return removed
+
+def invalidate(video_id: int):
+    """
+    Drop the index of a video; it is rebuilt on the next query. Called whenever its subtitles change.
+    """
+    video_id = int(video_id)
+    with _cache_lock:
+        # Dropping the cached memmaps closes them once no query holds them, so Windows can delete the files
+        _cache.pop(video_id, None)
+        if not _remove_files(video_id):
+            _stale.add(video_id)
+
+def invalidate_all():
+    """
+    Drop every index, e.g. after the database was restored from a backup.
+    """
+    with _cache_lock:
+        _cache.clear()
+        if os.path.isdir(INDEX_DIR):
+            for name in os.listdir(INDEX_DIR):
+                try:
+                    os.remove(os.path.join(INDEX_DIR, name))
+                except OSError:
+                    if name.split('.')[0].isdigit():
+                        _stale.add(int(name.split('.')[0]))
+
+def _load(video_id: int):
+    video_id = int(video_id)
+    seg_path, bounds_path = _paths(video_id)
+    try:
+        mtime = os.stat(seg_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    with _cache_lock:
+        stale = video_id in _stale
+        if stale and _remove_files(video_id):
+            _stale.discard(video_id)
+            stale, mtime = False, None
+    if stale:
+        # The outdated files are still mapped; answer from memory until they can go
+        return _compute(video_id)
+
+    with _cache_lock:
+        cached = _cache.get(video_id)
+        if cached and mtime is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+
+    if mtime is None:
+        with _build_lock:
+            if not os.path.exists(seg_path):
+                build_index(video_id)
+        mtime = os.stat(seg_path).st_mtime_ns
+
+    segments = np.load(seg_path, mmap_mode='r')
+    boundaries = np.load(bounds_path, mmap_mode='r')
+    with _cache_lock:
+        _cache[video_id] = (mtime, segments, boundaries)
+    return segments, boundaries
+
+def segments_between(video_id: int, t0: float, t1: float) -> np.ndarray:
+    """
+    Subtitle row ids of segments overlapping [t0, t1), in start order.
+    """
+    segments, _ = _load(video_id)
+    if len(segments) == 0 or t1 <= t0:
+        return np.zeros(0, dtype=np.int64)
+    # Everything before lo ends at or before t0; everything from hi starts at or after t1
+    lo = int(np.searchsorted(segments['max_end'], t0, side='right'))
+    hi = int(np.searchsorted(segments['start'], t1, side='left'))
+    if lo >= hi:
+        return np.zeros(0, dtype=np.int64)
+    window = segments[lo:hi]
+    return np.asarray(window['id'][window['end'] > t0])
+
+def nearest_boundary(video_id: int, t: float, max_distance: float = None):
+    """
+    Closest segment start or end to t, or None (no subtitles / farther than max_distance).
+    """
+    _, boundaries = _load(video_id)
+    if len(boundaries) == 0:
+        return None
+    i = int(np.searchsorted(boundaries, t))
+    candidates = [float(boundaries[j]) for j in (i - 1, i) if 0 <= j < len(boundaries)]
+    best = min(candidates, key=lambda b: abs(b - t))
+    if max_distance is not None and abs(best - t) > max_distance:
+        return None
+    return best
+
+def get_subtitles_between(video_id: int, t0: float, t1: float):
+    """
+    What was said in [t0, t1): the index finds the rows, only their text is fetched.
+    """
+    ids = segments_between(video_id, t0, t1)
+    return database.get_subtitles_by_ids(ids.tolist())
@@ -0,0 +1,185 @@
+import math
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+# Log-spaced latency buckets: 0.1 ms up to ~28 h, four per doubling (~19% resolution)
+_MIN_SECONDS = 1e-4
+_BUCKETS_PER_DOUBLING = 4
+_NUM_BUCKETS = 4 * 30
+
+# Bounds on memory: distinct operation names and recent samples kept for the "slowest" list
+MAX_OPERATIONS = 500
+RECENT_SAMPLES = 2000
+
+# Persisted samples are written in batches by a background thread
+_FLUSH_INTERVAL = 10.0
+_FLUSH_BATCH = 500
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[_bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= target:
+                # Geometric middle of the bucket, never above what was actually observed
+                lo = _MIN_SECONDS * 2 ** (i / _BUCKETS_PER_DOUBLING)
+                hi = _MIN_SECONDS * 2 ** ((i + 1) / _BUCKETS_PER_DOUBLING)
+                return min(math.sqrt(lo * hi), self.max)
+        return self.max
+
+def _bucket(seconds: float) -> int:
+    if seconds <= _MIN_SECONDS:
+        return 0
+    i = int(math.log2(seconds / _MIN_SECONDS) * _BUCKETS_PER_DOUBLING)
+    return min(i, _NUM_BUCKETS - 1)
+
+_histograms = {}
+_recent = deque(maxlen=RECENT_SAMPLES) # (timestamp, op, seconds, detail)
+_pending = [] # samples waiting to be persisted
+_lock = threading.Lock()
+_flusher = None
+_last_seen = {} # op -> timestamp of its latest sample
+_started_at = time.time()
+
+def _persist_enabled() -> bool:
+    # Imported here: utils is instrumented and must not import this module back at load time
+    from app.core import utils
+    return bool(utils.load_config().get("telemetry_persist", False))
+
+def record(op: str, seconds: float, detail: str = None):
+    now = time.time()
+    with _lock:
+        hist = _histograms.get(op)
+        if hist is None:
+            if len(_histograms) >= MAX_OPERATIONS:
+                op = 'other'
+                hist = _histograms.setdefault(op, _Histogram())
+            else:
+                hist = _histograms[op] = _Histogram()
+        hist.add(seconds)
+        _last_seen[op] = now
+        _recent.append((now, op, seconds, detail))
+        if _flusher is not None:
+            _pending.append((now, op, seconds, detail))
+
+@contextmanager
+def timed(op: str, detail: str = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(op, time.perf_counter() - start, detail)
+
+def instrument(op: str):
+    """
+    Decorator recording every call of the function under `op`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(op, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def get_stats():
+    """
+    Per-operation summary, most total time first.
+    """
+    with _lock:
+        rows = [{
+            'op': op,
+            'count': h.count,
+            'p50': h.percentile(0.50),
+            'p95': h.percentile(0.95),
+            'p99': h.percentile(0.99),
+            'max': h.max,
+            'total': h.total,
+        } for op, h in _histograms.items()]
+    return sorted(rows, key=lambda r: r['total'], reverse=True)
+
+def get_slowest(n: int = 20):
+    with _lock:
+        samples = list(_recent)
+    return sorted(samples, key=lambda s: s[2], reverse=True)[:n]
+
+def idle_seconds(ignore: tuple = ()) -> float:
+    """
+    Seconds since the last sample of any operation not starting with one of the `ignore` prefixes.
+    """
+    with _lock:
+        latest = max((t for op, t in _last_seen.items() if not op.startswith(ignore)), default=_started_at)
+    return time.time() - latest
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _recent.clear()
+
+def _flush():
+    with _lock:
+        batch = _pending[:]
+        _pending.clear()
+    if not batch:
+        return
+    from app.core import database, utils
+    keep_days = float(utils.load_config().get("telemetry_retention_days", 7))
+    for i in range(0, len(batch), _FLUSH_BATCH):
+        database.add_perf_samples(batch[i:i + _FLUSH_BATCH], keep_days=keep_days)
+
+def _flush_loop():
+    while True:
+        time.sleep(_FLUSH_INTERVAL)
+        try:
+            _flush()
+        except Exception as e:
+            print(f"Telemetry flush failed: {e}")
+
+def start_persistence() -> bool:
+    """
+    Start writing samples to SQLite when "telemetry_persist" is enabled in config.json.
+    """
+    global _flusher
+    if not _persist_enabled():
+        return False
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="telemetry-flush", daemon=True)
+            _flusher.start()
+    return True
+
+def get_persisted_stats(hours: float = 24.0):
+    """
+    Exact percentiles over persisted samples of the last `hours`.
+    """
+    import numpy as np
+    from app.core import database
+    by_op = {}
+    for op, seconds in database.get_perf_samples(time.time() - hours * 3600):
+        by_op.setdefault(op, []).append(seconds)
+    rows = []
+    for op, values in by_op.items():
+        arr = np.asarray(values)
+        p50, p95, p99 = (float(v) for v in np.percentile(arr, [50, 95, 99]))
+        rows.append({'op': op, 'count': len(arr), 'p50': p50, 'p95': p95, 'p99': p99,
+                     'max': float(arr.max()), 'total': float(arr.sum())})
+    return sorted(rows, key=lambda r: r['total'], reverse=True)
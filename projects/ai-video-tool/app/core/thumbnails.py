@@ -0,0 +1,170 @@
+import os
+import glob
+import json
+import hashlib
+import ffmpeg
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.core import database, utils, telemetry
+
+GALLERY_WIDTH = 320
+
+# Scrubbing sprites: one tile every SPRITE_INTERVAL seconds, SPRITE_COLUMNS x SPRITE_ROWS tiles per sheet
+SPRITE_INTERVAL = 10
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+
+def get_thumbs_dir() -> str:
+    return os.path.join(utils.get_base_download_path(), "thumbs")
+
+def _source_key(path: str, *extra) -> str:
+    """
+    Cache-busting key: changes whenever the source file or the output settings change.
+    """
+    st = os.stat(path)
+    ident = "|".join([os.path.realpath(path), str(st.st_size), str(st.st_mtime_ns)] + [str(e) for e in extra])
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()[:12]
+
+def _run(out, op: str):
+    try:
+        with telemetry.timed(op):
+            out.run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        raise RuntimeError(e.stderr.decode('utf-8', errors='ignore')[-2000:])
+
+def make_gallery_thumbnail(db_id: int, video_path: str, thumbnail_path: str = None, duration: float = None) -> str:
+    """
+    Small WebP for the gallery, from the downloaded thumbnail or (if there is none) a frame of the video.
+    Returns the output path; an existing file with the same key is reused.
+    """
+    source = thumbnail_path if thumbnail_path and os.path.exists(thumbnail_path) else video_path
+    key = _source_key(source, GALLERY_WIDTH)
+    out_path = os.path.join(get_thumbs_dir(), f"{db_id}_{key}.webp")
+    if os.path.exists(out_path):
+        return out_path
+    os.makedirs(get_thumbs_dir(), exist_ok=True)
+
+    tmp_path = out_path + ".tmp.webp"
+    if source == video_path:
+        inp = ffmpeg.input(video_path, ss=(duration or 0) * 0.1)
+    else:
+        inp = ffmpeg.input(source)
+    out = inp.video.filter('scale', GALLERY_WIDTH, -2).output(tmp_path, vframes=1, vcodec='libwebp', quality=75)
+    _run(out, "ffmpeg.gallery_thumbnail")
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def _sprite_layout(pattern: str) -> dict:
+    """
+    Tile geometry of a sprite set, for mapping a time to a sheet and tile offset.
+    The tile height follows the source aspect ratio (and rotation), so it is read back from the first sheet.
+    """
+    sheets = sorted(glob.glob(pattern.replace("%03d", "*")))
+    stream = ffmpeg.probe(sheets[0])['streams'][0]
+    return {
+        'interval': SPRITE_INTERVAL,
+        'columns': SPRITE_COLUMNS,
+        'rows': SPRITE_ROWS,
+        'tile_width': int(stream['width']) // SPRITE_COLUMNS,
+        'tile_height': int(stream['height']) // SPRITE_ROWS,
+        'sheets': len(sheets),
+    }
+
+def make_sprite_sheets(db_id: int, video_path: str):
+    """
+    Tiled scrubbing sprites. Returns (pattern, layout): a printf-style pattern for the sheet files
+    (sheet n covers SPRITE_INTERVAL * SPRITE_COLUMNS * SPRITE_ROWS * n seconds onward) and a JSON
+    string with the tile geometry from _sprite_layout.
+    """
+    key = _source_key(video_path, SPRITE_INTERVAL, SPRITE_TILE_WIDTH, SPRITE_COLUMNS, SPRITE_ROWS)
+    pattern = os.path.join(get_thumbs_dir(), f"{db_id}_{key}_sprite_%03d.jpg")
+    if glob.glob(pattern.replace("%03d", "*")):
+        return pattern, json.dumps(_sprite_layout(pattern))
+    os.makedirs(get_thumbs_dir(), exist_ok=True)
+
+    v = (
+        ffmpeg.input(video_path, skip_frame='nokey') # Keyframes are plenty for 10s steps and much cheaper to decode
+        .video
+        .filter('fps', f"1/{SPRITE_INTERVAL}")
+        .filter('scale', SPRITE_TILE_WIDTH, -2)
+        .filter('tile', f"{SPRITE_COLUMNS}x{SPRITE_ROWS}")
+    )
+    _run(v.output(pattern, vsync='vfr', qscale=5), "ffmpeg.sprites")
+    return pattern, json.dumps(_sprite_layout(pattern))
+
+def _build_worker(db_id, video_path, thumbnail_path, duration, with_sprites):
+    # Top-level so it can be pickled by ProcessPoolExecutor
+    gallery = make_gallery_thumbnail(db_id, video_path, thumbnail_path, duration)
+    sprites, layout = make_sprite_sheets(db_id, video_path) if with_sprites else (None, None)
+    return db_id, gallery, sprites, layout
+
+def remove_stale(db_id: int, keep_paths):
+    """
+    Delete older keys of the same video (left behind when the source changed).
+    """
+    keep = {os.path.abspath(p) for p in keep_paths if p}
+    for path in glob.glob(os.path.join(get_thumbs_dir(), f"{db_id}_*")):
+        if os.path.abspath(path) in keep:
+            continue
+        if any(os.path.abspath(path).startswith(k.split("%03d")[0]) for k in keep if "%03d" in k):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def build_library_thumbnails(with_sprites: bool = True, missing_only: bool = True, max_workers: int = None, progress=None) -> str:
+    """
+    Generate gallery thumbnails (and sprite sheets) for the library in a process pool.
+    """
+    jobs = []
+    for v in database.get_all_videos():
+        if not v.get('file_path') or not os.path.exists(v['file_path']):
+            continue
+        has_gallery = v.get('gallery_thumb_path') and os.path.exists(v['gallery_thumb_path'])
+        # Sprites made before the layout was stored are rebuilt (cheap: the sheets themselves are reused)
+        has_sprites = not with_sprites or bool(v.get('sprite_path') and v.get('sprite_layout'))
+        if missing_only and has_gallery and has_sprites:
+            continue
+        jobs.append(v)
+
+    if not jobs:
+        return "All thumbnails are up to date."
+
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 2) // 2)
+
+    done = 0
+    errors = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_build_worker, v['id'], v['file_path'], v.get('thumbnail_path'), v.get('duration'), with_sprites): v
+            for v in jobs
+        }
+        for future in as_completed(futures):
+            v = futures[future]
+            try:
+                db_id, gallery, sprites, layout = future.result()
+                database.update_video_thumbnails(db_id, gallery_thumb_path=os.path.abspath(gallery),
+                                                 sprite_path=os.path.abspath(sprites) if sprites else v.get('sprite_path'),
+                                                 sprite_layout=layout if sprites else v.get('sprite_layout'))
+                remove_stale(db_id, [gallery, sprites or v.get('sprite_path')])
+            except Exception as e:
+                errors.append(f"{v['title']}: {e}")
+            done += 1
+            if progress: progress(done / len(jobs), desc=f"Thumbnails {done}/{len(jobs)}...")
+
+    msg = f"Generated thumbnails for {done - len(errors)}/{len(jobs)} videos."
+    if errors:
+        msg += " Errors: " + "; ".join(errors[:5])
+    return msg
+
+def get_gallery_image(video: dict) -> str:
+    """
+    Best image for the gallery: small WebP, then the original thumbnail, then the placeholder.
+    """
+    for key in ('gallery_thumb_path', 'thumbnail_path'):
+        path = video.get(key)
+        if path and os.path.exists(path):
+            return path
+    return os.path.abspath("assets/placeholder.svg")
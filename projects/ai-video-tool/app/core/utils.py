@@ -2,6 +2,7 @@ import os
 import json
 import re
 from pathlib import Path
+from app.core import telemetry
 
 CONFIG_PATH = "config.json"
 
@@ -50,6 +51,7 @@ def parse_timestamp(timestamp_str: str) -> float:
     else:
         return float(parts[0])
 
+@telemetry.instrument("vtt.parse")
 def parse_vtt_file(file_path: str):
     """
     Parse a WebVTT file into a list of segments:
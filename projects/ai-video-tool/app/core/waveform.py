@@ -0,0 +1,220 @@
+import os
+import struct
+import subprocess
+import threading
+import numpy as np
+from app.core import telemetry
+
+# Decoded once to mono 16-bit PCM at this rate; plenty for a visual envelope
+SAMPLE_RATE = 8000
+# Samples per peak at level 0 (100 peaks per second)
+BASE_BLOCK = 80
+# Each coarser level merges this many peaks of the previous one
+LEVEL_FACTOR = 4
+NUM_LEVELS = 5
+
+# File layout (little endian):
+#   header  : magic 'PEAK', version, sample_rate, base_block, num_levels   (<4sIIII)
+#   levels  : per level (samples_per_peak, count)                           (<IQ each)
+#   data    : per level, int16 [count, 2] of (min, max)
+MAGIC = b'PEAK'
+VERSION = 1
+_HEADER = struct.Struct('<4sIIII')
+_LEVEL = struct.Struct('<IQ')
+
+# Decode this many samples per read (must be a multiple of BASE_BLOCK)
+_READ_SAMPLES = BASE_BLOCK * 8192
+
+# In-memory cache: video_path -> (mtime, levels), levels = [(samples_per_peak, memmap)]
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_peaks_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + ".peaks.bin"
+
+def _block_peaks(samples: np.ndarray) -> np.ndarray:
+    blocks = samples.reshape(-1, BASE_BLOCK)
+    return np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1)
+
+def _reduce(peaks: np.ndarray, factor: int) -> np.ndarray:
+    if len(peaks) == 0:
+        return peaks
+    pad = (-len(peaks)) % factor
+    if pad:
+        peaks = np.concatenate([peaks, np.repeat(peaks[-1:], pad, axis=0)])
+    grouped = peaks.reshape(-1, factor, 2)
+    return np.stack([grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)], axis=1)
+
+def compute_peaks(video_path: str) -> list:
+    """
+    Decode the audio once and return min/max peaks for every zoom level,
+    as a list of (samples_per_peak, int16 [count, 2]) from finest to coarsest.
+    PCM is processed in chunks, so memory stays flat even for very long streams.
+    """
+    cmd = [
+        'ffmpeg', '-v', 'error', '-i', video_path,
+        '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1'
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    chunks = []
+    remainder = np.empty(0, dtype='<i2')
+    try:
+        while True:
+            data = process.stdout.read(_READ_SAMPLES * 2)
+            if not data:
+                break
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype='<i2')
+            if len(remainder):
+                samples = np.concatenate([remainder, samples])
+            usable = len(samples) - len(samples) % BASE_BLOCK
+            if usable:
+                chunks.append(_block_peaks(samples[:usable]))
+            remainder = samples[usable:].copy()
+        if len(remainder):
+            last = np.pad(remainder, (0, BASE_BLOCK - len(remainder)), mode='edge')
+            chunks.append(_block_peaks(last))
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode('utf-8', errors='ignore')
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg audio decode failed: {stderr.strip()[-2000:]}")
+
+    base = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype='<i2')
+    levels = [(BASE_BLOCK, base.astype('<i2'))]
+    for _ in range(NUM_LEVELS - 1):
+        spp, peaks = levels[-1]
+        levels.append((spp * LEVEL_FACTOR, _reduce(peaks, LEVEL_FACTOR)))
+    return levels
+
+def write_peaks(path: str, levels: list):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, SAMPLE_RATE, BASE_BLOCK, len(levels)))
+        for spp, peaks in levels:
+            f.write(_LEVEL.pack(spp, len(peaks)))
+        for _, peaks in levels:
+            f.write(np.ascontiguousarray(peaks, dtype='<i2').tobytes())
+    os.replace(tmp_path, path)
+
+def read_peaks(path: str) -> list:
+    """
+    Memory-map every level of a peaks file. Returns [(samples_per_peak, memmap [count, 2])].
+    """
+    with open(path, 'rb') as f:
+        magic, version, sample_rate, _, num_levels = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION or sample_rate != SAMPLE_RATE:
+            raise ValueError(f"Unsupported peaks file: {path}")
+        table = [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(num_levels)]
+
+    offset = _HEADER.size + _LEVEL.size * num_levels
+    levels = []
+    for spp, count in table:
+        if count:
+            peaks = np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(count, 2))
+        else:
+            peaks = np.zeros((0, 2), dtype='<i2')
+        levels.append((spp, peaks))
+        offset += count * 4
+    return levels
+
+def has_peaks(video_path: str) -> bool:
+    path = get_peaks_path(video_path)
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(video_path)
+
+def build_peaks(video_path: str, force: bool = False) -> str:
+    """
+    Decode and store the peaks file next to the video. Skipped when it is already up to date.
+    """
+    path = get_peaks_path(video_path)
+    if not force and has_peaks(video_path):
+        return path
+    with telemetry.timed("ffmpeg.waveform", video_path):
+        levels = compute_peaks(video_path)
+    write_peaks(path, levels)
+    with _cache_lock:
+        _cache.pop(video_path, None)
+    return path
+
+def get_levels(video_path: str) -> list:
+    """
+    Cached memory-mapped levels. Raises FileNotFoundError when the peaks have not been built.
+    """
+    mtime = os.path.getmtime(video_path)
+    with _cache_lock:
+        cached = _cache.get(video_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    if not has_peaks(video_path):
+        raise FileNotFoundError(get_peaks_path(video_path))
+    levels = read_peaks(get_peaks_path(video_path))
+    with _cache_lock:
+        _cache[video_path] = (mtime, levels)
+    return levels
+
+def get_peaks(video_path: str, start: float, end: float, width: int):
+    """
+    Min/max envelope of [start, end) resampled to `width` columns, normalised to -1..1.
+    Uses the coarsest level that still has at least one peak per column.
+    """
+    levels = get_levels(video_path)
+    seconds = max(end - start, 1e-3)
+    spp, peaks = levels[0]
+    for level_spp, level_peaks in reversed(levels):
+        if seconds * SAMPLE_RATE / level_spp >= width:
+            spp, peaks = level_spp, level_peaks
+            break
+
+    rate = SAMPLE_RATE / spp
+    i0 = max(0, int(np.floor(start * rate)))
+    i1 = min(len(peaks), max(i0 + 1, int(np.ceil(end * rate))))
+    window = np.asarray(peaks[i0:i1])
+    mins = np.zeros(width, dtype=np.float32)
+    maxs = np.zeros(width, dtype=np.float32)
+    if len(window) == 0:
+        return mins, maxs
+
+    if len(window) >= width:
+        # Each column covers at least one peak: fold them with reduceat
+        starts = np.linspace(0, len(window), width + 1)[:-1].astype(int)
+        col_mins = np.minimum.reduceat(window[:, 0], starts)
+        col_maxs = np.maximum.reduceat(window[:, 1], starts)
+    else:
+        # Zoomed in past the finest level: neighbouring columns share a peak
+        idx = np.arange(width) * len(window) // width
+        col_mins = window[idx, 0]
+        col_maxs = window[idx, 1]
+    mins[:] = col_mins / 32768.0
+    maxs[:] = col_maxs / 32768.0
+    return mins, maxs
+
+def render_waveform(video_path: str, start: float, end: float, width: int = 1000, height: int = 120,
+                    spans=(), markers=()) -> np.ndarray:
+    """
+    Draw the envelope as an RGB image (uint8 [height, width, 3]).
+    spans: (start, end) ranges shaded in the background, markers: times drawn as vertical lines.
+    """
+    mins, maxs = get_peaks(video_path, start, end, width)
+    img = np.full((height, width, 3), 250, dtype=np.uint8)
+    seconds = max(end - start, 1e-3)
+
+    def to_x(t):
+        return int(np.clip((t - start) / seconds * width, 0, width - 1))
+
+    for s, e in spans:
+        if e < start or s > end:
+            continue
+        img[:, to_x(s):to_x(e) + 1] = (255, 228, 196)
+
+    mid = height / 2
+    top = np.floor(mid - maxs * mid).astype(int)
+    bottom = np.ceil(mid - mins * mid).astype(int)
+    rows = np.arange(height)[:, None]
+    mask = (rows >= top[None, :]) & (rows <= bottom[None, :])
+    img[mask] = (40, 90, 160)
+    img[int(mid), :] = (150, 150, 150)
+
+    for t in markers:
+        if start <= t <= end:
+            img[:, to_x(t)] = (220, 30, 30)
+    return img
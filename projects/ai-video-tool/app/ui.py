@@ -2,7 +2,8 @@ import gradio as gr
 import pandas as pd
 import json
 import os
-from app.core import downloader, ai_analyzer, editor, database, utils, scanner
+import time
+from app.core import ai_analyzer, editor, database, utils, scanner, signals, download_queue, chat, ingest, preview_cache, proxy, prefetch, clip_planner, render_queue, thumbnails, waveform, subtitle_index, search, concurrency, telemetry, backup, maintenance
 
 # Define custom theme and CSS matching the root index.html design
 custom_primary = gr.themes.Color(
@@ -39,7 +40,46 @@ body {
 }
 """
 
+def _group(group: str) -> dict:
+    """
+    Event kwargs that run a handler in a named concurrency group.
+    """
+    limit, _ = concurrency.get_group_settings(group)
+    return dict(concurrency_id=group, concurrency_limit=limit)
+
+def tracked(event, fn, group: str = 'read', **kwargs):
+    """
+    Register `fn` on `event` in a concurrency group without admission control, counted as a running
+    request of the group so idle detection sees plain browsing. Unlike guarded, fine for select events.
+    Not for timer ticks: polling is not user activity.
+    """
+    return event(concurrency.wrap(group, fn), **_group(group), **kwargs)
+
+def _admission(group: str):
+    def admit():
+        try:
+            concurrency.admit(group)
+        except concurrency.GroupSaturated as e:
+            raise gr.Error(str(e))
+    return admit
+
+def guarded(event, group: str, fn, **kwargs):
+    """
+    Register `fn` on `event` (e.g. btn.click) in a concurrency group.
+    An unqueued admission step rejects the request at once when the group's workers
+    and waiting slots are all taken, instead of letting it sit behind heavy jobs.
+    Not for select events: their SelectData only reaches the first handler of a chain.
+    """
+    return event(_admission(group), queue=False, show_progress="hidden").success(
+        concurrency.wrap(group, fn), **_group(group), **kwargs
+    )
+
 def create_ui():
+    download_queue.start_workers()
+    render_queue.start()
+    telemetry.start_persistence()
+    maintenance.start_scheduler()
+
     with gr.Blocks(title="AI Video Tool", theme=theme, css=custom_css) as demo:
         with gr.Row(equal_height=True):
             gr.Markdown("# AI Video Tool")
@@ -52,26 +92,98 @@ def create_ui():
         with gr.Tab("インポート"):
             gr.Markdown("### URLから動画をダウンロード")
             with gr.Row():
-                url_input = gr.Textbox(label="動画URL", placeholder="https://youtube.com/watch?v=...", scale=4)
-                download_btn = gr.Button("ダウンロード", variant="primary", scale=1)
+                url_input = gr.Textbox(label="動画URL (1行に1つ)", placeholder="https://youtube.com/watch?v=...", lines=2, scale=4)
+                download_btn = gr.Button("キューに追加", variant="primary", scale=1)
             
             with gr.Row():
                  format_radio = gr.Radio(["Video", "Audio"], label="フォーマット", value="Video")
                  res_dropdown = gr.Dropdown(["best", "1080p", "720p", "480p"], label="最大解像度", value="best")
                  auto_transcribe_chk = gr.Checkbox(label="字幕もダウンロード (yt-dlp)", value=True)
+                 auto_analyze_chk = gr.Checkbox(label="ダウンロード後に自動でAI分析", value=False)
 
             dl_output = gr.Textbox(label="ログ", interactive=False)
             
-            def handle_download(url, fmt, res, auto_transcribe, progress=gr.Progress()):
-                try:
-                    mode = 'audio' if fmt == 'Audio' else 'video'
-                    msg, new_id = downloader.download_video(url, format_mode=mode, resolution=res, progress=progress)
-                    
-                    return msg
-                except Exception as e:
-                    return f"Error: {str(e)}"
+            def handle_download(url, fmt, res, auto_transcribe, auto_analyze):
+                urls = [u.strip() for u in (url or "").splitlines() if u.strip()]
+                if not urls:
+                    return "Error: URL is empty.", gr.skip()
+                mode = 'audio' if fmt == 'Audio' else 'video'
+                queued = 0
+                skipped = 0
+                errors = []
+                for u in urls:
+                    try:
+                        job_ids, n_skipped = download_queue.enqueue_url(u, format_mode=mode, resolution=res, auto_analyze=auto_analyze)
+                        queued += len(job_ids)
+                        skipped += n_skipped
+                    except Exception as e:
+                        errors.append(f"{u}: {e}")
+                msg = f"Queued {queued} job(s), skipped {skipped} already in library/queue."
+                if errors:
+                    msg += " Errors: " + "; ".join(errors)
+                return msg, load_queue()
             
-            download_btn.click(handle_download, inputs=[url_input, format_radio, res_dropdown, auto_transcribe_chk], outputs=[dl_output])
+            gr.Markdown("### ダウンロードキュー")
+            queue_table = gr.Dataframe(
+                headers=["ID", "URL", "状態", "進捗 (%)", "メッセージ", "更新日時"],
+                datatype=["number", "str", "str", "number", "str", "str"],
+                interactive=False,
+                label="ジョブ一覧 (行を選択して進捗を表示)"
+            )
+            with gr.Row():
+                cancel_job_btn = gr.Button("選択したジョブをキャンセル", variant="stop")
+                refresh_queue_btn = gr.Button("キュー更新")
+            job_status = gr.Textbox(label="選択中のジョブ", interactive=False)
+            selected_job_id = gr.State(None)
+            queue_timer = gr.Timer(2.0)
+
+            def load_queue():
+                rows = []
+                for j in download_queue.list_jobs():
+                    rows.append([
+                        j['id'],
+                        j['url'],
+                        j['status'],
+                        round((j['progress'] or 0) * 100, 1),
+                        j['message'] or '',
+                        j['updated_at']
+                    ])
+                return rows
+
+            def describe_job(job_id):
+                if not job_id:
+                    return ""
+                job = database.get_download_job(job_id)
+                if not job:
+                    return f"Job {job_id}: not found."
+                if job['status'] in ('queued', 'running'):
+                    return f"Job {job_id} ({job['status']}): {round((job['progress'] or 0) * 100, 1)}% {job['message'] or ''}"
+                status = f"Job {job_id}: {job['status']} - {job['message'] or ''}"
+                # Follow the background ingest stages once the media file exists
+                if job['video_db_id']:
+                    status += "\n" + ingest.describe_stages(job['video_db_id'])
+                return status
+
+            def select_job(evt: gr.SelectData, df_data):
+                job_id = int(df_data.iloc[evt.index[0]][0])
+                return job_id, describe_job(job_id)
+
+            def refresh_queue(job_id):
+                # The queue timer also refreshes the selected job, so no handler stays open per selection
+                return load_queue(), describe_job(job_id) if job_id else gr.skip()
+
+            def handle_cancel_job(job_id):
+                if not job_id:
+                    return "No job selected.", gr.skip()
+                if download_queue.cancel(job_id):
+                    return f"Job {job_id}: cancellation requested.", load_queue()
+                return f"Job {job_id}: cannot be cancelled.", load_queue()
+
+            tracked(download_btn.click, handle_download, inputs=[url_input, format_radio, res_dropdown, auto_transcribe_chk, auto_analyze_chk], outputs=[dl_output, queue_table])
+            tracked(queue_table.select, select_job, inputs=[queue_table], outputs=[selected_job_id, job_status])
+            tracked(cancel_job_btn.click, handle_cancel_job, inputs=[selected_job_id], outputs=[job_status, queue_table])
+            tracked(refresh_queue_btn.click, load_queue, outputs=[queue_table])
+            queue_timer.tick(refresh_queue, inputs=[selected_job_id], outputs=[queue_table, job_status], **_group('read'))
 
         # --- Tab 2: Library (Gallery & Search) ---
         with gr.Tab("ライブラリ"):
@@ -106,78 +218,157 @@ def create_ui():
                 label="検索結果 (行を選択してモンタージュ作成)"
             )
             
+            # Pager for search-as-you-type results
+            with gr.Row(visible=False) as search_pager_row:
+                prev_page_btn = gr.Button("前のページ", scale=1)
+                search_page_label = gr.Markdown("")
+                next_page_btn = gr.Button("次のページ", scale=1)
+            search_page = gr.State(0)
+
             # Actions for Search Results
             with gr.Row(visible=False) as search_actions_row:
                 play_clip_btn = gr.Button("選択したクリップを再生")
                 create_montage_btn = gr.Button("検索結果からモンタージュを作成")
             
+            montage_status = gr.Textbox(label="モンタージュ", interactive=False, visible=True)
+
             # Player
             video_player = gr.Video(label="プレビュー")
             
+            # Displayed listing for this session: ordered IDs plus the rendered rows, bumped on every change
+            gallery_state = gr.State(None)
+
+            def _gallery_entry(v, tags):
+                return {
+                    'title': v['title'],
+                    # Small WebP when generated; original thumbnail or placeholder otherwise
+                    'image': thumbnails.get_gallery_image(v),
+                    'row': [
+                        v['id'],
+                        v['title'],
+                        ", ".join(tags) if tags else "",
+                        v.get('duration', 0.0),
+                        v.get('created_at', ''),
+                        v.get('file_path', '')
+                    ]
+                }
+
+            def _render_listing(listing):
+                entries = [listing['entries'][vid] for vid in listing['ids']]
+                items = [(e['image'], e['title']) for e in entries]
+                table_data = [e['row'] for e in entries]
+                return items, table_data
+
             # Helper to load gallery
             def load_gallery(tags=None):
                 if tags:
                     videos = database.get_videos_by_tags(tags)
                 else:
                     videos = database.get_all_videos()
-                
-                # Gallery items & Table items
-                items = []
-                table_data = []
-                for v in videos:
-                    # Check thumbnail
-                    thumb = v.get('thumbnail_path')
-                    if thumb and os.path.exists(thumb):
-                        path = thumb
-                    else:
-                        # Use placeholder if video path is used it might crash Gradio Gallery or be slow
-                        # path = v['file_path'] 
-                        path = os.path.abspath("assets/placeholder.svg")
-                        
-                    label = v['title']
-                    items.append((path, label))
-                    
-                    v_tags = database.get_video_tags(v['id'])
-                    tag_str = ", ".join(v_tags) if v_tags else ""
-                    table_data.append([
-                        v['id'],
-                        v['title'],
-                        tag_str,
-                        v.get('duration', 0.0),
-                        v.get('created_at', ''),
-                        v.get('file_path', '')
-                    ])
+
+                video_tags = database.get_tags_for_videos([v['id'] for v in videos])
+                listing = {
+                    'ids': [v['id'] for v in videos],
+                    'entries': {v['id']: _gallery_entry(v, video_tags[v['id']]) for v in videos}
+                }
+                items, table_data = _render_listing(listing)
                 
                 # Update choices
                 all_tags = database.get_all_tags()
                 
-                return items, table_data, gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), gr.update(choices=all_tags)
+                return items, table_data, gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), gr.update(choices=all_tags), listing
 
-            refresh_btn.click(load_gallery, inputs=[tag_filter], outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter])
-            tag_filter.change(load_gallery, inputs=[tag_filter], outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter])
+            def refresh_listing_entry(vid_id, listing):
+                """
+                Re-render one video's row in place (e.g. after analysis added tags).
+                """
+                if not vid_id or not listing or vid_id not in listing['entries']:
+                    return gr.skip(), gr.skip(), gr.skip(), gr.skip()
+                v = database.get_video_by_id(vid_id)
+                if not v:
+                    return gr.skip(), gr.skip(), gr.skip(), gr.skip()
+                listing['entries'][vid_id] = _gallery_entry(v, database.get_video_tags(vid_id))
+                items, table_data = _render_listing(listing)
+                return items, table_data, gr.update(choices=database.get_all_tags()), listing
+
+            tracked(refresh_btn.click, load_gallery, inputs=[tag_filter], outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter, gallery_state])
+            tracked(tag_filter.change, load_gallery, inputs=[tag_filter], outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter, gallery_state])
             
             # Search Logic
+            def _format_search_rows(results):
+                return [[
+                    r['video_title'],
+                    utils.format_timestamp(r['start_time']),
+                    r['text'],
+                    r['video_id'],
+                    r['start_time'],
+                    r['end_time']
+                ] for r in results]
+
             def handle_search(query):
                 if not query:
-                    return gr.update(visible=True), gr.update(visible=False), gr.update(visible=False) # Show Main, Hide Search
+                    return gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), gr.update(visible=False) # Show Main, Hide Search
                 
                 results = database.search_subtitles(query)
-                # Helper to format
-                data = []
-                for r in results:
-                    data.append([
-                        r['video_title'],
-                        utils.format_timestamp(r['start_time']),
-                        r['text'],
-                        r['video_id'], # video_id (db id) needed or video_uid? video_id FK in subtitles is videos.id
-                        r['start_time'],
-                        r['end_time']
-                    ])
+                data = _format_search_rows(results)
                 
-                return gr.update(visible=False), gr.update(visible=True, value=data), gr.update(visible=True) # Hide Main, Show Search
+                # Ranked top hits; the pager belongs to search-as-you-type
+                return gr.update(visible=False), gr.update(visible=True, value=data), gr.update(visible=True), gr.update(visible=False) # Hide Main, Show Search
+
+            def _show_search_page(query, page, request: gr.Request):
+                session = search.get_session(request.session_hash)
+                generation = session.begin() # Interrupts this session's older query if it is still running
+                result = session.get_page(generation, query, page)
+                # A newer keystroke started meanwhile: its results, not these, belong on screen
+                if result is None or not session.is_current(generation):
+                    return gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip()
+                rows, has_more = result
+                label = f"ページ {page + 1}" + (" (続きあり)" if has_more else "")
+                return (gr.update(visible=False), gr.update(visible=True, value=_format_search_rows(rows)),
+                        gr.update(visible=True), gr.update(visible=True), label, page)
+
+            def search_as_you_type(query, request: gr.Request):
+                _, min_chars, _ = search.get_search_settings()
+                if len(query.strip()) < min_chars:
+                    search.get_session(request.session_hash).begin()
+                    if not query.strip():
+                        return gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), gr.update(visible=False), "", 0
+                    return gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip()
+                # No server-side delay: each keystroke queries at once and interrupts the previous one's statement
+                return _show_search_page(query, 0, request)
+
+            def prev_search_page(query, page, request: gr.Request):
+                return _show_search_page(query, max(0, page - 1), request)
 
-            search_btn.click(handle_search, inputs=[search_bar], outputs=[main_library_view, search_results, search_actions_row])
-            search_bar.submit(handle_search, inputs=[search_bar], outputs=[main_library_view, search_results, search_actions_row])
+            def next_search_page(query, page, request: gr.Request):
+                return _show_search_page(query, page + 1, request)
+
+            def prefetch_search(df_data):
+                # Pre-render previews for the top hits so a row click usually plays at once
+                if df_data is None or len(df_data) == 0:
+                    prefetch.search_prefetcher.cancel()
+                    return
+                videos = {}
+                clips = []
+                for _, row in df_data.head(prefetch.get_prefetch_settings()[0]).iterrows():
+                    vid_db_id = int(row[3])
+                    if vid_db_id not in videos:
+                        videos[vid_db_id] = database.get_video_by_id(vid_db_id)
+                    video = videos[vid_db_id]
+                    if video:
+                        clips.append((proxy.get_playback_path(video), float(row[4]), float(row[5])))
+                prefetch.search_prefetcher.submit(clips)
+
+            tracked(search_btn.click, handle_search, inputs=[search_bar], outputs=[main_library_view, search_results, search_actions_row, search_pager_row]).then(prefetch_search, inputs=[search_results], **_group('read'))
+            tracked(search_bar.submit, handle_search, inputs=[search_bar], outputs=[main_library_view, search_results, search_actions_row, search_pager_row]).then(prefetch_search, inputs=[search_results], **_group('read'))
+
+            # Search as you type: trigger_mode "multiple" lets a keystroke start while an older query is still running
+            # (up to the 'search' group's limit), so the newer one can interrupt it
+            search_page_outputs = [main_library_view, search_results, search_actions_row, search_pager_row, search_page_label, search_page]
+            tracked(search_bar.change, search_as_you_type, 'search', inputs=[search_bar], outputs=search_page_outputs,
+                    trigger_mode="multiple", show_progress="hidden")
+            tracked(prev_page_btn.click, prev_search_page, inputs=[search_bar, search_page], outputs=search_page_outputs)
+            tracked(next_page_btn.click, next_search_page, inputs=[search_bar, search_page], outputs=search_page_outputs)
 
             # Play Clip
             def play_selected_clip(evt: gr.SelectData, df_data):
@@ -193,9 +384,8 @@ def create_ui():
                     end = float(row[5])
                     
                     video = database.get_video_by_id(vid_db_id)
-                    # Temp preview
-                    clips = [{'video_path': video['file_path'], 'start': start, 'end': end}]
-                    out = editor.create_montage(clips, output_filename=f"preview_search_{vid_db_id}_{row_idx}.mp4", fast_preview=True)
+                    # Cached by clip content, not by row index; cut from the proxy when available
+                    out = preview_cache.get_preview(proxy.get_playback_path(video), start, end)
                     return out
                 except Exception as e:
                     print(e)
@@ -207,32 +397,30 @@ def create_ui():
             # Let's use the button "Play Selected Clip" which reads selected rows? 
             # Gradio Dataframe doesn't output "selected rows" explicitly unless selectable=True and using state.
             # Actually, using `select` event is best for single click.
-            search_results.select(play_selected_clip, inputs=[search_results], outputs=[video_player])
+            tracked(search_results.select, play_selected_clip, 'preview', inputs=[search_results], outputs=[video_player])
 
             # Montage
-            def handle_montage(df_data):
+            def handle_montage(df_data, progress=gr.Progress()):
                 # How to get selected rows? 
                 # If dataframe doesn't support multi-select easily in UI return, we assume ALL visible rows?
                 # Or we prompt user to filter?
                 # "Create Montage from Search Results" (All)
                 # Let's just do all rows in current view for simplicity of MVP.
-                clips = []
-                for _, row in df_data.iterrows():
-                    video_db_id = int(row[3])
-                    video = database.get_video_by_id(video_db_id)
-                    clips.append({
-                        'video_path': video['file_path'],
-                        'start': row[4],
-                        'end': row[5]
-                    })
+                rows = [(int(row[3]), float(row[4]), float(row[5])) for _, row in df_data.iterrows()]
+                # Merge overlapping / adjacent hits per source and resolve all paths in one query
+                clips, report = clip_planner.plan_clips(rows)
                 
                 if not clips:
-                    return None
+                    return None, "No clips."
                 
-                out_path = editor.create_montage(clips, output_filename="search_montage.mp4")
-                return out_path
+                # Many hits across many videos: render per clip in parallel with a bounded number of open inputs
+                job_id = render_queue.submit(clips, f"search_montage_{int(time.time())}.mp4", mode="parallel")
+                job = render_queue.wait(job_id, progress=progress)
+                if not job or job['status'] != 'done':
+                    return None, f"Render job {job_id}: {job['status'] if job else 'missing'}"
+                return job['output_path'], clip_planner.format_report(report)
 
-            create_montage_btn.click(handle_montage, inputs=[search_results], outputs=[video_player])
+            guarded(create_montage_btn.click, 'render', handle_montage, inputs=[search_results], outputs=[video_player, montage_status])
 
             # Gallery Select -> Actions
             # When clicking a gallery item, we want to maybe go to Editor tab? 
@@ -246,32 +434,35 @@ def create_ui():
             
             export_file = gr.File(label="字幕ダウンロード", visible=False, interactive=False)
             
-            selected_video_idx = gr.State(None) # Index in db list
-            
-            def on_gallery_select(evt: gr.SelectData):
-                # evt.index is the index of image
-                # We need to map back to DB ID.
-                # Simplest way: re-fetch videos list inside locally or store in state.
-                videos = database.get_all_videos()
-                if evt.index < len(videos):
-                    vid = videos[evt.index]
-                    return vid['id'], f"Selected: {vid['title']}"
+            def on_gallery_select(evt: gr.SelectData, listing):
+                # evt.index is the position in the listing this session is displaying
+                if listing and 0 <= evt.index < len(listing['ids']):
+                    vid_id = listing['ids'][evt.index]
+                    return vid_id, f"Selected: {listing['entries'][vid_id]['title']}"
                 return None, "Error selection"
 
             gallery_status = gr.Textbox(label="ステータス", interactive=False)
-            gallery_view.select(on_gallery_select, outputs=[current_video_id, gallery_status])
+            tracked(gallery_view.select, on_gallery_select, inputs=[gallery_state], outputs=[current_video_id, gallery_status])
             
             # Delete Action
-            def trigger_delete(vid_id):
+            def trigger_delete(vid_id, listing):
                 if not vid_id:
-                     # gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter, gallery_status
-                    return gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip(), "No video selected."
+                    # gallery_view, library_table, tag_filter, gallery_state, current_video_id, gallery_status
+                    return gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip(), "No video selected."
                 
                 database.delete_video(vid_id)
-                # Returns 6 items from load_gallery + 1 status message
-                return load_gallery() + ("Deleted video.",)
+                if not listing:
+                    items, table_data, _, _, _, tag_update, listing = load_gallery()
+                    return items, table_data, tag_update, listing, None, "Deleted video."
 
-            delete_btn.click(trigger_delete, inputs=[current_video_id], outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter, gallery_status])
+                # Drop it from the cached listing instead of re-querying the library
+                if vid_id in listing['entries']:
+                    listing['ids'].remove(vid_id)
+                    del listing['entries'][vid_id]
+                items, table_data = _render_listing(listing)
+                return items, table_data, gr.update(choices=database.get_all_tags()), listing, None, "Deleted video."
+
+            tracked(delete_btn.click, trigger_delete, inputs=[current_video_id, gallery_state], outputs=[gallery_view, library_table, tag_filter, gallery_state, current_video_id, gallery_status])
 
         # --- Tab 3: Editor ---
         with gr.Tab("編集・分析"):
@@ -282,15 +473,17 @@ def create_ui():
             
             def update_dropdown():
                 videos = database.get_all_videos()
-                print(f"DEBUG: update_dropdown found {len(videos)} videos.")
                 new_choices = [(f"{v['title']} (ID: {v['id']})", v['id']) for v in videos]
                 return gr.Dropdown(choices=new_choices, interactive=True)
 
             refresh_editor_btn = gr.Button("リスト更新")
-            refresh_editor_btn.click(update_dropdown, outputs=[video_dropdown])
+            tracked(refresh_editor_btn.click, update_dropdown, outputs=[video_dropdown])
             
             # Analysis
-            analyze_action_btn = gr.Button("AI分析を実行")
+            with gr.Row():
+                analyze_action_btn = gr.Button("AI分析を実行")
+                signal_candidates_btn = gr.Button("音量・シーン変化から候補を抽出")
+                snap_btn = gr.Button("開始/終了を字幕の区切りにスナップ")
             
             # Highlights Editor
             highlights_df = gr.Dataframe(
@@ -300,12 +493,29 @@ def create_ui():
                 interactive=True
             )
             
+            # Waveform: whole video with highlights shaded, or the selected highlight with its boundaries
+            editor_waveform = gr.Image(label="波形 (行を選択すると区間を拡大)", interactive=False, height=140)
+            selected_highlight = gr.State(None)
+
             # Preview Row
             preview_btn = gr.Button("ハイライトをプレビュー")
             editor_player = gr.Video(label="クリッププレビュー")
+            highlight_chat = gr.Dataframe(
+                headers=["時間", "投稿者", "メッセージ"],
+                datatype=["str", "str", "str"],
+                interactive=False,
+                label="この区間のチャット"
+            )
             
             # Montage/Export
-            export_btn = gr.Button("ハイライトを動画として書き出し")
+            with gr.Row():
+                export_mode = gr.Radio(
+                    [("再エンコード", "encode"), ("スマートカット (キーフレーム単位でコピー)", "smart"), ("並列レンダリング (クリップごと)", "parallel")],
+                    label="書き出しモード", value="encode"
+                )
+                export_btn = gr.Button("ハイライトを動画として書き出し")
+            progressive_chk = gr.Checkbox(label="レンダリング中に再生 (HLSセグメント)", value=False)
+            progressive_player = gr.Video(label="レンダリング中のプレビュー", streaming=True, autoplay=True)
             export_output = gr.Video(label="書き出された動画")
             
             # Load Analysis
@@ -327,16 +537,56 @@ def create_ui():
                         pass
                 return []
 
-            video_dropdown.change(load_analysis, inputs=[video_dropdown], outputs=[highlights_df])
+            tracked(video_dropdown.change, load_analysis, inputs=[video_dropdown], outputs=[highlights_df])
+
+            def load_editor_video(vid_id):
+                # Play the lightweight proxy in the editor; exports still use the original
+                if not vid_id: return None
+                vid = database.get_video_by_id(vid_id)
+                return proxy.get_playback_path(vid) if vid else None
+
+            tracked(video_dropdown.change, load_editor_video, inputs=[video_dropdown], outputs=[editor_player])
             
             def run_analysis(vid_id, progress=gr.Progress()):
+                if not vid_id:
+                    yield None
+                    return
+                # Stream highlights into the table as soon as each one is complete
+                for hl, _ in ai_analyzer.analyze_video_stream(vid_id, progress=progress):
+                    rows = [[h['start_time'], h['end_time'], h.get('score', 0), h.get('description', '')] for h in hl]
+                    yield rows
+            
+            # Analysis adds tags: update that row of the library listing in place
+            guarded(analyze_action_btn.click, 'ai', run_analysis, inputs=[video_dropdown], outputs=[highlights_df]).then(
+                refresh_listing_entry, inputs=[video_dropdown, gallery_state], outputs=[gallery_view, library_table, tag_filter, gallery_state],
+                **_group('read')
+            )
+
+            def run_signal_candidates(vid_id, progress=gr.Progress()):
                 if not vid_id: return None
-                res = ai_analyzer.analyze_video(vid_id, progress=progress)
-                hl = res.get('highlights', [])
-                rows = [[h['start_time'], h['end_time'], h['score'], h['description']] for h in hl]
+                progress(0.1, desc="Extracting loudness / scene changes...")
+                hl = signals.get_highlight_candidates(vid_id)
+                progress(1.0, desc="Done.")
+                return [[h['start_time'], h['end_time'], h['score'], h['description']] for h in hl]
+
+            guarded(signal_candidates_btn.click, 'ai', run_signal_candidates, inputs=[video_dropdown], outputs=[highlights_df])
+
+            def snap_to_subtitles(df_data, vid_id):
+                if not vid_id or df_data is None or len(df_data) == 0:
+                    return gr.skip()
+                max_distance = float(utils.load_config().get("subtitle_snap_distance", 2.0))
+                rows = []
+                for _, row in df_data.iterrows():
+                    start, end = float(row['start']), float(row['end'])
+                    # Bisection on the timing index; boundaries farther than max_distance are left alone
+                    new_start = subtitle_index.nearest_boundary(vid_id, start, max_distance)
+                    new_end = subtitle_index.nearest_boundary(vid_id, end, max_distance)
+                    if new_start is not None: start = new_start
+                    if new_end is not None and new_end > start: end = new_end
+                    rows.append([start, end, row['score'], row['description']])
                 return rows
-            
-            analyze_action_btn.click(run_analysis, inputs=[video_dropdown], outputs=[highlights_df])
+
+            tracked(snap_btn.click, snap_to_subtitles, inputs=[highlights_df, video_dropdown], outputs=[highlights_df])
             
             def preview_highlight(evt: gr.SelectData, df_data, vid_id):
                 # row index
@@ -346,26 +596,167 @@ def create_ui():
                 end = float(row['end'])
                 vid = database.get_video_by_id(vid_id)
                 
-                # Temp preview
-                clips = [{'video_path': vid['file_path'], 'start': start, 'end': end}]
-                out = editor.create_montage(clips, output_filename=f"preview_{vid_id}_{row_idx}.mp4", fast_preview=True)
+                # Cached by clip content, so an edited start/end never serves a stale file
+                out = preview_cache.get_preview(proxy.get_playback_path(vid), start, end)
                 return out
 
-            highlights_df.select(preview_highlight, inputs=[highlights_df, video_dropdown], outputs=[editor_player])
-            
-            def export_highlights(df_data, vid_id, progress=gr.Progress()):
+            tracked(highlights_df.select, preview_highlight, 'preview', inputs=[highlights_df, video_dropdown], outputs=[editor_player])
+
+            def prefetch_highlights(df_data, vid_id):
+                if not vid_id or df_data is None or len(df_data) == 0:
+                    prefetch.highlight_prefetcher.cancel()
+                    return
+                vid = database.get_video_by_id(vid_id)
+                if not vid:
+                    return
+                path = proxy.get_playback_path(vid)
+                clips = []
+                for _, row in df_data.iterrows():
+                    try:
+                        clips.append((path, float(row['start']), float(row['end'])))
+                    except (TypeError, ValueError):
+                        continue # Row being edited
+                prefetch.highlight_prefetcher.submit(clips)
+
+            highlights_df.change(prefetch_highlights, inputs=[highlights_df, video_dropdown], **_group('read'))
+
+            def draw_waveform(df_data, vid_id, row_idx):
+                if not vid_id: return None
+                vid = database.get_video_by_id(vid_id)
+                if not vid or not vid.get('file_path') or not os.path.exists(vid['file_path']):
+                    return None
+                if not waveform.has_peaks(vid['file_path']):
+                    # Built once in the background; the next edit or selection draws it
+                    ingest.submit_waveform(vid['id'])
+                    return None
+
+                # One entry per table row, so row_idx lines up; None for a row being edited
+                spans = []
+                if df_data is not None:
+                    for _, row in df_data.iterrows():
+                        try:
+                            spans.append((float(row['start']), float(row['end'])))
+                        except (TypeError, ValueError):
+                            spans.append(None)
+
+                if row_idx is not None and row_idx < len(spans) and spans[row_idx]:
+                    start, end = spans[row_idx]
+                    pad = max(5.0, (end - start) * 0.25)
+                    return waveform.render_waveform(vid['file_path'], max(0.0, start - pad), end + pad,
+                                                    spans=[(start, end)], markers=[start, end])
+                spans = [span for span in spans if span]
+                duration = vid.get('duration') or max([e for _, e in spans] + [1.0])
+                return waveform.render_waveform(vid['file_path'], 0.0, duration, spans=spans)
+
+            def select_highlight(evt: gr.SelectData, df_data, vid_id):
+                row_idx = evt.index[0]
+                return row_idx, draw_waveform(df_data, vid_id, row_idx)
+
+            tracked(highlights_df.select, select_highlight, inputs=[highlights_df, video_dropdown], outputs=[selected_highlight, editor_waveform])
+            # Redrawn from the memory-mapped peaks on every edit, so boundary changes show up immediately
+            tracked(highlights_df.change, draw_waveform, inputs=[highlights_df, video_dropdown, selected_highlight], outputs=[editor_waveform])
+            video_dropdown.change(lambda: None, outputs=[selected_highlight], **_group('read'))
+
+            def show_highlight_chat(evt: gr.SelectData, df_data, vid_id):
                 if not vid_id: return None
+                row = df_data.iloc[evt.index[0]]
+                messages = database.get_chat_messages(int(vid_id), start=float(row['start']), end=float(row['end']), limit=500)
+                return [[m['time_text'] or utils.format_timestamp(m['time_in_seconds'] or 0), m['author'] or '', m['message'] or ''] for m in messages]
+
+            tracked(highlights_df.select, show_highlight_chat, inputs=[highlights_df, video_dropdown], outputs=[highlight_chat])
+            
+            def export_highlights(df_data, vid_id, mode, progressive, progress=gr.Progress()):
+                if not vid_id:
+                    yield gr.skip(), None
+                    return
                 vid = database.get_video_by_id(vid_id)
                 clips = []
                 for _, row in df_data.iterrows():
                     clips.append({
                         'video_path': vid['file_path'],
-                        'start': row['start'],
-                        'end': row['end']
+                        'start': float(row['start']),
+                        'end': float(row['end'])
                     })
-                return editor.create_montage(clips, output_filename=f"montage_{vid_id}.mp4", progress=progress)
+                # Runs on the render queue; closing the page does not stop it
+                job_id = render_queue.submit(clips, f"montage_{vid_id}_{int(time.time())}.mp4", mode=mode, progressive=progressive)
+
+                if progressive:
+                    # Stream finished HLS segments to the player while later ones are still rendering
+                    hls_dir = render_queue.get_hls_dir(job_id)
+                    sent = 0
+                    while True:
+                        # Status first: once the job has ended, this listing still picks up its last segments
+                        job = database.get_render_job(job_id)
+                        finished = not job or job['status'] not in ('queued', 'running')
+                        segments, ended = editor.list_hls_segments(hls_dir)
+                        for seg in segments[sent:]:
+                            yield seg, gr.skip()
+                        sent = len(segments)
+                        if ended or finished:
+                            break
+                        time.sleep(1.0)
+                    job = render_queue.wait(job_id, progress=progress)
+                    # A closed page never gets here; the render queue sweeps its segments later
+                    render_queue.release_hls_dir(job_id)
+                else:
+                    job = render_queue.wait(job_id, progress=progress)
+                if job and job['status'] == 'done':
+                    yield gr.skip(), job['output_path']
+                else:
+                    yield gr.skip(), None
+
+            guarded(export_btn.click, 'render', export_highlights, inputs=[highlights_df, video_dropdown, export_mode, progressive_chk], outputs=[progressive_player, export_output])
+
+            gr.Markdown("### レンダリングキュー")
+            render_table = gr.Dataframe(
+                headers=["ID", "名前", "モード", "状態", "進捗 (%)", "fps", "速度", "残り", "出力"],
+                datatype=["number", "str", "str", "str", "number", "number", "str", "str", "str"],
+                interactive=False,
+                label="書き出しジョブ (行を選択してダウンロード / キャンセル)"
+            )
+            with gr.Row():
+                cancel_render_btn = gr.Button("選択したジョブをキャンセル", variant="stop")
+                refresh_render_btn = gr.Button("キュー更新")
+            render_status = gr.Textbox(label="選択中のジョブ", interactive=False)
+            render_file = gr.File(label="書き出し済みファイル", interactive=False)
+            selected_render_id = gr.State(None)
+            render_timer = gr.Timer(2.0)
+
+            def load_render_queue():
+                rows = []
+                for j in render_queue.list_jobs():
+                    rows.append([
+                        j['id'],
+                        j['name'],
+                        j['mode'],
+                        j['status'],
+                        round((j['progress'] or 0) * 100, 1),
+                        round(j['fps'] or 0, 1),
+                        f"{j['speed']:.2f}x" if j['speed'] else '',
+                        editor.format_eta(j['eta']) if j['eta'] is not None and j['status'] == 'running' else '',
+                        j['output_path'] or ''
+                    ])
+                return rows
 
-            export_btn.click(export_highlights, inputs=[highlights_df, video_dropdown], outputs=[export_output])
+            def select_render_job(evt: gr.SelectData, df_data):
+                job_id = int(df_data.iloc[evt.index[0]][0])
+                job = database.get_render_job(job_id)
+                if not job:
+                    return None, "Not found.", None
+                out_file = job['output_path'] if job['status'] == 'done' and job['output_path'] and os.path.exists(job['output_path']) else None
+                return job_id, f"Job {job_id}: {job['status']} - {job['message'] or ''}", out_file
+
+            def handle_cancel_render(job_id):
+                if not job_id:
+                    return "No job selected.", gr.skip()
+                if render_queue.cancel(job_id):
+                    return f"Job {job_id}: cancellation requested.", load_render_queue()
+                return f"Job {job_id}: cannot be cancelled.", load_render_queue()
+
+            tracked(render_table.select, select_render_job, inputs=[render_table], outputs=[selected_render_id, render_status, render_file])
+            tracked(cancel_render_btn.click, handle_cancel_render, inputs=[selected_render_id], outputs=[render_status, render_table])
+            tracked(refresh_render_btn.click, load_render_queue, outputs=[render_table])
+            render_timer.tick(load_render_queue, outputs=[render_table], **_group('read'))
 
         # --- Tab 4: Settings ---
         with gr.Tab("設定"):
@@ -394,19 +785,134 @@ def create_ui():
                 load_dotenv(override=True)
                 return "設定を保存しました。"
 
-            save_config_btn.click(save_keys, inputs=[api_key_gemini, api_key_openai], outputs=[config_status])
+            tracked(save_config_btn.click, save_keys, inputs=[api_key_gemini, api_key_openai], outputs=[config_status])
             
             gr.Markdown("### ストレージ管理")
             scan_btn = gr.Button("ストレージを再スキャンして動画をインポート")
             scan_status = gr.Textbox(label="スキャン結果", interactive=False)
             
             def handle_scan(progress=gr.Progress()):
-                return scanner.scan_and_import_videos(progress=progress)
+                msg = scanner.scan_and_import_videos(progress=progress)
+                # Existing comments.json files of videos that were already in the DB
+                return msg + " " + chat.import_existing_comments(progress=progress)
             
-            scan_btn.click(handle_scan, outputs=[scan_status])
+            guarded(scan_btn.click, 'maintenance', handle_scan, outputs=[scan_status])
+
+            proxy_btn = gr.Button("プロキシ (低解像度プレビュー用) を一括生成")
+            proxy_status = gr.Textbox(label="プロキシ生成", interactive=False)
+
+            def handle_generate_proxies():
+                count = ingest.submit_missing_proxies()
+                return f"Queued proxy generation for {count} videos (running in background)."
+
+            guarded(proxy_btn.click, 'maintenance', handle_generate_proxies, outputs=[proxy_status])
+
+            thumbs_btn = gr.Button("ギャラリー用サムネイル・スプライトを一括生成")
+            thumbs_status = gr.Textbox(label="サムネイル生成", interactive=False)
+
+            def handle_generate_thumbnails(progress=gr.Progress()):
+                return thumbnails.build_library_thumbnails(progress=progress)
+
+            guarded(thumbs_btn.click, 'maintenance', handle_generate_thumbnails, outputs=[thumbs_status])
+
+            score_btn = gr.Button("ライブラリ全体の音量・シーン変化を事前解析 (CPU)")
+            score_status = gr.Textbox(label="解析結果", interactive=False)
+
+            def handle_score_library(progress=gr.Progress()):
+                return signals.score_library(progress=progress)
+
+            guarded(score_btn.click, 'maintenance', handle_score_library, outputs=[score_status])
+
+            gr.Markdown("### データベースのバックアップ")
+            backup_btn = gr.Button("今すぐバックアップ (アプリ動作中でも可)")
+            backup_status = gr.Textbox(label="バックアップ結果", interactive=False)
+            backup_table = gr.Dataframe(
+                headers=["ファイル", "作成日時", "サイズ (MB)"],
+                datatype=["str", "str", "number"],
+                interactive=False,
+                label="スナップショット (復元: python cli.py restore <ファイル>)"
+            )
+
+            def load_backups():
+                return [[b['path'], b['created'].strftime("%Y-%m-%d %H:%M:%S"), round(b['size'] / 1e6, 1)]
+                        for b in backup.list_backups()]
+
+            def handle_backup(progress=gr.Progress()):
+                try:
+                    path = backup.create_backup(progress=progress)
+                    return f"Backup saved: {path}", load_backups()
+                except Exception as e:
+                    return f"Backup failed: {e}", load_backups()
+
+            guarded(backup_btn.click, 'maintenance', handle_backup, outputs=[backup_status, backup_table])
+
+            gr.Markdown("### データベースの最適化")
+            gr.Markdown("検索インデックスの統合・統計情報の更新・空き領域の解放を行います。アイドル時には自動で実行されます。")
+            db_maint_btn = gr.Button("今すぐ最適化")
+            db_maint_status = gr.Textbox(label="最適化結果 (サイズ: 実行前 -> 実行後)", interactive=False, lines=6)
+
+            def handle_db_maintenance(progress=gr.Progress()):
+                return maintenance.format_report(maintenance.run_maintenance(progress=progress))
+
+            guarded(db_maint_btn.click, 'maintenance', handle_db_maintenance, outputs=[db_maint_status])
+
+        # --- Tab 5: Performance ---
+        with gr.Tab("パフォーマンス"):
+            gr.Markdown("### 処理時間の統計 (ミリ秒)")
+            perf_table = gr.Dataframe(
+                headers=["操作", "回数", "p50", "p95", "p99", "最大", "合計 (秒)"],
+                datatype=["str", "number", "number", "number", "number", "number", "number"],
+                interactive=False,
+                label="このプロセスの計測 (起動以降)"
+            )
+            slowest_table = gr.Dataframe(
+                headers=["時刻", "操作", "ミリ秒", "詳細"],
+                datatype=["str", "str", "number", "str"],
+                interactive=False,
+                label="最近の遅い処理"
+            )
+            persisted_table = gr.Dataframe(
+                headers=["操作", "回数", "p50", "p95", "p99", "最大", "合計 (秒)"],
+                datatype=["str", "number", "number", "number", "number", "number", "number"],
+                interactive=False,
+                label="保存済みの計測 (過去24時間, config.json の telemetry_persist が有効な場合)"
+            )
+            with gr.Row():
+                refresh_perf_btn = gr.Button("更新")
+                reset_perf_btn = gr.Button("統計をリセット")
+            perf_timer = gr.Timer(5.0)
+
+            def _stats_rows(stats):
+                return [[r['op'], r['count'], round(r['p50'] * 1000, 1), round(r['p95'] * 1000, 1),
+                         round(r['p99'] * 1000, 1), round(r['max'] * 1000, 1), round(r['total'], 2)] for r in stats]
+
+            def load_performance():
+                slowest = [[time.strftime('%H:%M:%S', time.localtime(ts)), op, round(seconds * 1000, 1), detail or '']
+                           for ts, op, seconds, detail in telemetry.get_slowest()]
+                return _stats_rows(telemetry.get_stats()), slowest
+
+            def load_persisted_performance():
+                return _stats_rows(telemetry.get_persisted_stats())
+
+            def reset_performance():
+                telemetry.reset()
+                return load_performance()
+
+            tracked(refresh_perf_btn.click, load_performance, outputs=[perf_table, slowest_table]).then(load_persisted_performance, outputs=[persisted_table], **_group('read'))
+            tracked(reset_perf_btn.click, reset_performance, outputs=[perf_table, slowest_table])
+            perf_timer.tick(load_performance, outputs=[perf_table, slowest_table], **_group('read'))
              
         # Initial Load
-        demo.load(load_gallery, outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter])
-        demo.load(update_dropdown, outputs=[video_dropdown])
+        demo.load(load_gallery, outputs=[gallery_view, library_table, main_library_view, search_results, search_actions_row, tag_filter, gallery_state], **_group('read'))
+        demo.load(update_dropdown, outputs=[video_dropdown], **_group('read'))
+        demo.load(load_queue, outputs=[queue_table], **_group('read'))
+        demo.load(load_render_queue, outputs=[render_table], **_group('read'))
+        demo.load(load_backups, outputs=[backup_table], **_group('read'))
+
+    # default_concurrency_limit is per event (each listener gets its own concurrency_id), so it does not pool
+    # anything: shared limits come from _group(). It only bounds listeners registered without one.
+    # max_size rejects at once when the whole queue is full
+    read_limit, _ = concurrency.get_group_settings('read')
+    demo.queue(default_concurrency_limit=read_limit, max_size=int(utils.load_config().get("queue_max_size", 256)))
              
     return demo
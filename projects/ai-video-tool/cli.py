@@ -0,0 +1,344 @@
+"""
+Headless batch interface to app/core (no browser UI).
+
+    python cli.py download URL... [--jobs N] [--analyze]
+    python cli.py scan [--jobs N]
+    python cli.py analyze ID... | --missing [--jobs N] [--signals]
+    python cli.py render --input clips.jsonl [--jobs N] [--mode encode|smart|parallel]
+    python cli.py export ID... | --all [--jobs N] [--mode ...]
+    python cli.py library-export PATH        (.jsonl, or .yaml for multi-document YAML; "-" for stdout)
+    python cli.py library-import PATH [--chunk-size N]
+    python cli.py backup [--label NAME] | backup --list | restore SNAPSHOT
+    python cli.py maintenance [--budget SECONDS] [--full]
+
+Items can also be given with --input FILE (one per line, "-" for stdin).
+Progress is written to stdout as JSON Lines ({"event": ..., "task": ..., ...});
+human-readable errors go to stderr. The exit code is 1 if any task failed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Paths in config.json and the database are relative to the project root
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core import database, downloader, scanner, chat, ingest, ai_analyzer, signals, editor, clip_planner, library_io, backup, maintenance
+
+class Reporter:
+    """
+    Thread-safe JSON Lines writer. Progress events are throttled per task.
+    """
+
+    def __init__(self, stream=sys.stdout, min_interval: float = 0.5):
+        self.stream = stream
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.last = {}
+        self.failed = 0
+
+    def emit(self, event: str, task: str = None, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        if task is not None:
+            record['task'] = task
+        record.update(fields)
+        with self.lock:
+            if event == 'error':
+                self.failed += 1
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+    def progress_for(self, task: str):
+        """
+        A callable with the progress(value, desc=...) signature app/core expects.
+        """
+        def progress(value, desc=None):
+            now = time.monotonic()
+            with self.lock:
+                last_time, last_desc = self.last.get(task, (0.0, None))
+                if now - last_time < self.min_interval and desc == last_desc and value < 1.0:
+                    return
+                self.last[task] = (now, desc)
+            self.emit('progress', task, value=round(float(value or 0), 4), desc=desc)
+        return progress
+
+def read_items(args):
+    """
+    Positional items plus lines of --input (a path or "-" for stdin). Blank lines and # comments are skipped.
+    """
+    items = list(getattr(args, 'items', None) or [])
+    if args.input:
+        f = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    items.append(line)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    return items
+
+def run_parallel(reporter: Reporter, jobs: int, tasks):
+    """
+    tasks: list of (task_name, fn, args). Each fn gets a progress callback as its last argument.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {}
+        for name, fn, fn_args in tasks:
+            reporter.emit('start', name)
+            futures[pool.submit(fn, *fn_args, reporter.progress_for(name))] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                reporter.emit('done', name, result=results[name])
+            except Exception as e:
+                print(f"{name}: {e}", file=sys.stderr)
+                reporter.emit('error', name, message=str(e))
+    return results
+
+def wait_for_ingest(reporter: Reporter, db_ids, poll_interval: float = 2.0):
+    """
+    Block until the background ingest stages of the given videos are finished (the process would kill them on exit).
+    """
+    pending = set(db_ids)
+    while pending:
+        for db_id in list(pending):
+            if ingest.is_finished(db_id):
+                pending.discard(db_id)
+                reporter.emit('ingest_done', f"video:{db_id}", stages=ingest.describe_stages(db_id))
+        if pending:
+            time.sleep(poll_interval)
+
+def cmd_download(args, reporter: Reporter):
+    urls = read_items(args)
+    entries = []
+    for url in urls:
+        try:
+            entries.extend(downloader.expand_url(url))
+        except Exception as e:
+            reporter.emit('error', url, message=str(e))
+
+    archived = database.get_archived_video_uids([e['id'] for e in entries if e.get('id')])
+    seen = set()
+    tasks = []
+    for e in entries:
+        if e.get('id') in archived or e.get('id') in seen:
+            reporter.emit('skipped', e.get('url'), reason='already in library')
+            continue
+        seen.add(e.get('id'))
+
+        def task(url, progress):
+            message, db_id = downloader.download_video(url, args.format, args.resolution, progress=progress,
+                                                       auto_analyze=args.analyze)
+            return {'message': message, 'video_id': db_id}
+        tasks.append((e['url'], task, (e['url'],)))
+
+    results = run_parallel(reporter, args.jobs, tasks)
+    wait_for_ingest(reporter, [r['video_id'] for r in results.values() if r.get('video_id')])
+
+def cmd_scan(args, reporter: Reporter):
+    ingest.get_executor(max_workers=args.jobs)
+    before = {v['id'] for v in database.get_all_videos()}
+    progress = reporter.progress_for('scan')
+    message = scanner.scan_and_import_videos(progress=progress)
+    reporter.emit('done', 'scan', result=message)
+    reporter.emit('done', 'chat', result=chat.import_existing_comments(progress=reporter.progress_for('chat')))
+    new_ids = [v['id'] for v in database.get_all_videos() if v['id'] not in before]
+    wait_for_ingest(reporter, new_ids)
+
+def _video_ids(args, reporter: Reporter):
+    if getattr(args, 'all', False):
+        return [v['id'] for v in database.get_all_videos()]
+    if getattr(args, 'missing', False):
+        return [v['id'] for v in database.get_all_videos() if not v.get('analysis_result')]
+    ids = []
+    for item in read_items(args):
+        try:
+            ids.append(int(item))
+        except ValueError:
+            reporter.emit('error', item, message="not a video ID")
+    return ids
+
+def cmd_analyze(args, reporter: Reporter):
+    ids = _video_ids(args, reporter)
+    if args.signals:
+        # CPU-bound ffmpeg extraction: signals already runs its own process pool
+        result = signals.score_library(ids, max_workers=args.jobs, progress=reporter.progress_for('signals'))
+        reporter.emit('done', 'signals', result=result)
+        return
+
+    def task(db_id, progress):
+        result = ai_analyzer.analyze_video(db_id, progress=progress)
+        return {'highlights': len(result.get('highlights', [])), 'tags': result.get('tags', [])}
+    run_parallel(reporter, args.jobs, [(f"video:{i}", task, (i,)) for i in ids])
+
+def _render(clips, output_name, mode, progress):
+    path = editor.create_montage(clips, output_name, progress=progress, mode=mode)
+    return {'output': os.path.abspath(path) if path else None}
+
+def cmd_render(args, reporter: Reporter):
+    """
+    Input lines are JSON clips: {"output": "name.mp4", "video_id": 1, "start": 10.0, "end": 20.0}
+    ("video_path" may replace "video_id"). Clips sharing an output become one montage.
+    """
+    groups = {}
+    for line in read_items(args):
+        # A bad line is reported and skipped; the other clips still render
+        try:
+            clip = json.loads(line)
+            if not isinstance(clip, dict):
+                raise ValueError("expected a JSON object")
+            clip['start'], clip['end'] = float(clip['start']), float(clip['end'])
+            if 'video_id' in clip:
+                clip['video_id'] = int(clip['video_id'])
+            elif 'video_path' not in clip:
+                raise ValueError("missing video_id or video_path")
+        except (ValueError, TypeError, KeyError) as e:
+            reporter.emit('error', line, message=f"invalid clip: {e}")
+            continue
+        groups.setdefault(clip.get('output') or args.output, []).append(clip)
+
+    tasks = []
+    for output_name, clips in groups.items():
+        by_id = [(c['video_id'], c['start'], c['end']) for c in clips if 'video_id' in c]
+        planned, report = clip_planner.plan_clips(by_id) if by_id else ([], None)
+        planned += [{'video_path': c['video_path'], 'start': c['start'], 'end': c['end']}
+                    for c in clips if 'video_id' not in c]
+        if report:
+            reporter.emit('plan', output_name, report=report)
+        tasks.append((output_name, _render, (planned, output_name, args.mode)))
+    run_parallel(reporter, args.jobs, tasks)
+
+def cmd_export(args, reporter: Reporter):
+    """
+    Render each video's analysed highlights into its own montage (the Editor's export, in batch).
+    """
+    tasks = []
+    videos = database.get_videos_by_ids(_video_ids(args, reporter))
+    for db_id, video in videos.items():
+        try:
+            highlights = json.loads(video.get('analysis_result') or '{}').get('highlights', [])
+        except json.JSONDecodeError:
+            highlights = []
+        if not highlights:
+            reporter.emit('skipped', f"video:{db_id}", reason='no highlights')
+            continue
+        clips = [{'video_path': video['file_path'], 'start': float(min(h['start_time'], h['end_time'])),
+                  'end': float(max(h['start_time'], h['end_time']))} for h in highlights]
+        name = f"montage_{db_id}_{int(time.time())}.mp4"
+        tasks.append((f"video:{db_id}", _render, (clips, name, args.mode)))
+    run_parallel(reporter, args.jobs, tasks)
+
+def cmd_library_export(args, reporter: Reporter):
+    count = library_io.export_library(args.path, progress=reporter.progress_for('library-export'))
+    reporter.emit('done', 'library-export', result={'videos': count, 'path': args.path})
+
+def cmd_library_import(args, reporter: Reporter):
+    stats = library_io.import_library(args.path, chunk_size=args.chunk_size,
+                                      progress=reporter.progress_for('library-import'))
+    reporter.emit('done', 'library-import', result=stats)
+
+def cmd_backup(args, reporter: Reporter):
+    if args.list:
+        for b in backup.list_backups():
+            reporter.emit('backup', b['name'], path=b['path'], created=b['created'].isoformat(), size=b['size'])
+        return
+    path = backup.create_backup(label=args.label, progress=reporter.progress_for('backup'))
+    reporter.emit('done', 'backup', result={'path': path, 'size': os.path.getsize(path)})
+
+def cmd_restore(args, reporter: Reporter):
+    safety = backup.restore_backup(args.snapshot, progress=reporter.progress_for('restore'))
+    reporter.emit('done', 'restore', result={'restored': args.snapshot, 'previous': safety})
+
+def cmd_maintenance(args, reporter: Reporter):
+    report = maintenance.run_maintenance(budget_seconds=args.budget, full=args.full,
+                                         progress=reporter.progress_for('maintenance'))
+    reporter.emit('done', 'maintenance', result=report)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AI Video Tool batch CLI")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(p, items_help=None):
+        if items_help:
+            p.add_argument('items', nargs='*', help=items_help)
+        p.add_argument('--input', '-i', help="Read items from a file, one per line ('-' for stdin)")
+        p.add_argument('--jobs', '-j', type=int, default=1, help="Parallel tasks")
+
+    p = sub.add_parser('download', help="Download videos, playlists or channels")
+    add_common(p, "Video / playlist / channel URLs")
+    p.add_argument('--format', choices=['video', 'audio'], default='video')
+    p.add_argument('--resolution', default='best', help="best, 1080p, 720p, 480p")
+    p.add_argument('--analyze', action='store_true', help="Run AI analysis after ingest")
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser('scan', help="Import videos found in the download directory")
+    add_common(p)
+    p.set_defaults(func=cmd_scan)
+
+    p = sub.add_parser('analyze', help="AI analysis (or --signals scoring) of library videos")
+    add_common(p, "Video database IDs")
+    p.add_argument('--missing', action='store_true', help="All videos without an analysis result")
+    p.add_argument('--signals', action='store_true', help="Loudness / scene-change scoring instead of Gemini")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser('render', help="Render montages from JSON clip lines")
+    add_common(p, "JSON clip objects")
+    p.add_argument('--output', default="montage.mp4", help="Output name for clips without an \"output\" key")
+    p.add_argument('--mode', choices=['encode', 'smart', 'parallel'], default='encode')
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser('export', help="Render analysed highlights of videos into montages")
+    add_common(p, "Video database IDs")
+    p.add_argument('--all', action='store_true', help="Every video with highlights")
+    p.add_argument('--mode', choices=['encode', 'smart', 'parallel'], default='encode')
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('library-export', help="Stream tags, videos and analysis results to JSON Lines / YAML")
+    p.add_argument('path', help="Output file (.jsonl or .yaml), '-' for stdout")
+    p.set_defaults(func=cmd_library_export)
+
+    p = sub.add_parser('library-import', help="Apply a library export (upsert by video uid)")
+    p.add_argument('path', help="Export file, '-' for stdin (JSON Lines)")
+    p.add_argument('--chunk-size', type=int, default=500, help="Records per transaction")
+    p.set_defaults(func=cmd_library_import)
+
+    p = sub.add_parser('backup', help="Compressed online snapshot of the database (safe while the app runs)")
+    p.add_argument('--label', help="Suffix for the snapshot name")
+    p.add_argument('--list', action='store_true', help="List snapshots instead of taking one")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser('restore', help="Verify a snapshot and restore it (the current database is backed up first)")
+    p.add_argument('snapshot', help="Path of a .sqlite3.gz snapshot")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser('maintenance', help="FTS index merge, planner statistics and incremental vacuum")
+    p.add_argument('--budget', type=float, help="Time budget in seconds (default: maintenance_budget_seconds)")
+    p.add_argument('--full', action='store_true', help="Also FTS optimize and a full VACUUM if needed (blocks writers)")
+    p.set_defaults(func=cmd_maintenance)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Events go to stderr when an export itself is written to stdout
+    to_stdout = args.command == 'library-export' and args.path == '-'
+    reporter = Reporter(stream=sys.stderr if to_stdout else sys.stdout)
+    started = time.monotonic()
+    try:
+        args.func(args, reporter)
+    except KeyboardInterrupt:
+        reporter.emit('error', args.command, message="interrupted")
+    except Exception as e:
+        print(f"{args.command}: {e}", file=sys.stderr)
+        reporter.emit('error', args.command, message=str(e))
+    reporter.emit('summary', args.command, failed=reporter.failed, seconds=round(time.monotonic() - started, 2))
+    return 1 if reporter.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,7 +23,7 @@ def rebuild_database():
     
     for root, dirs, files in os.walk(base_dir):
         for file in files:
-            if file.endswith(".mp4"):
+            if file.endswith(".mp4") and not file.endswith(".proxy.mp4"):
                 # Potential video file
                 file_path = os.path.join(root, file)
                 # Check if it follows our structure
@@ -6,9 +6,18 @@ import argparse
 sys.path.append(os.getcwd())
 
 from app.core.database import DB_PATH, init_db
+from app.core import backup
 
-def reset_database():
+def reset_database(take_backup=True):
     if os.path.exists(DB_PATH):
+        if take_backup:
+            try:
+                path = backup.create_backup(label="prereset")
+                print(f"Restore with: python cli.py restore {path}")
+            except Exception as e:
+                print(f"Error backing up database: {e}")
+                print("Not deleting it. Use --no-backup to reset anyway.")
+                return False
         try:
             os.remove(DB_PATH)
             print(f"Deleted existing database at {DB_PATH}")
@@ -33,12 +42,13 @@ def reset_database():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Reset the database.")
     parser.add_argument("--force", action="store_true", help="Skip confirmation")
+    parser.add_argument("--no-backup", action="store_true", help="Do not take a snapshot before deleting")
     args = parser.parse_args()
 
     if not args.force:
-        confirm = input("This will DELETE ALL DATA in 'data/db.sqlite3'. Are you sure? (y/N): ")
+        confirm = input("This will DELETE ALL DATA in 'data/db.sqlite3' (a snapshot is kept in data/backups unless --no-backup). Are you sure? (y/N): ")
         if confirm.lower() != 'y':
             print("Operation cancelled.")
             sys.exit(0)
     
-    reset_database()
+    reset_database(take_backup=not args.no_backup)